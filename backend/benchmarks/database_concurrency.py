@@ -0,0 +1,116 @@
+"""
+Concurrency of one worker with blocking psycopg2 queries on the event loop against the async engine.
+
+Every simulated turn reads a game state with its last messages and then awaits a fake LLM call.
+A ticker measures how late the event loop runs it, which is the delay every other request sees.
+
+Needs a database seeded by benchmarks.explain_queries.
+Run from the backend directory: `DATABASE_URL=postgresql://... python -m benchmarks.database_concurrency`
+"""
+import asyncio
+import os
+import statistics
+import time
+from sqlalchemy import desc, text
+from sqlmodel import Session, create_engine, select
+from src.db import DATABASE_URL, async_engine, get_async_session
+from src.schemas.database import GameState, Message, User
+from src.auxiliary.database import get_user_game_state_by_id, get_messages_of_game_state
+
+clients = int(os.getenv("LOAD_CLIENTS", "50"))
+turns_per_client = int(os.getenv("LOAD_TURNS", "20"))
+llm_latency = float(os.getenv("LOAD_LLM_LATENCY", "0.05"))
+tick_interval = 0.005
+
+sync_engine = create_engine(DATABASE_URL, pool_size=10, max_overflow=10)
+
+message_chain_query = """
+WITH RECURSIVE message_chain AS (
+    SELECT * FROM messages WHERE id = :last_message_id
+    UNION ALL
+    SELECT m.* FROM messages m
+    JOIN message_chain mc ON m.id = mc.previous_message_id
+)
+SELECT id FROM message_chain LIMIT 15
+"""
+
+
+def blocking_turn(user: User) -> None:
+    """The reads of a turn as they were done before, on the event loop thread"""
+    with Session(sync_engine) as session:
+        game_state = session.exec(
+            select(GameState).filter(GameState.id == user.last_game_state_id, GameState.user_id == user.id)
+        ).first()
+
+        message_ids = [row[0] for row in session.exec(
+            text(message_chain_query), params={"last_message_id": game_state.last_message_id}
+        )]
+        session.exec(select(Message).where(Message.id.in_(message_ids)).order_by(desc(Message.id))).all()
+
+
+async def async_turn(user: User) -> None:
+    async with get_async_session("turn") as session:
+        game_state = await get_user_game_state_by_id(session, user.last_game_state_id, user)
+        await get_messages_of_game_state(session, game_state, limit=15)
+
+
+async def run(mode: str, users: list[User], report: bool = True) -> None:
+    lags: list[float] = []
+    running = True
+
+    async def ticker() -> None:
+        while running:
+            expected = time.perf_counter() + tick_interval
+            await asyncio.sleep(tick_interval)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    async def client(user: User) -> None:
+        for _ in range(turns_per_client):
+            if mode == "blocking":
+                blocking_turn(user)
+            else:
+                await async_turn(user)
+
+            # The LLM call of the turn
+            await asyncio.sleep(llm_latency)
+
+    ticking = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(client(user) for user in users))
+    elapsed = time.perf_counter() - start
+    running = False
+    await ticking
+
+    if not report:
+        return
+
+    lags.sort()
+    print(
+        f"{mode:>8}: {len(users) * turns_per_client / elapsed:8.1f} turns/s, "
+        f"loop lag p50 {statistics.median(lags) * 1000:6.1f} ms, "
+        f"p99 {lags[int(len(lags) * 0.99)] * 1000:6.1f} ms, "
+        f"max {lags[-1] * 1000:6.1f} ms"
+    )
+
+
+async def main() -> None:
+    with Session(sync_engine) as session:
+        users = list(session.exec(
+            select(User).where(User.last_game_state_id != None).order_by(User.id).limit(clients)
+        ).all())
+        session.expunge_all()
+
+    print(f"{clients} clients, {turns_per_client} turns each, {llm_latency * 1000:.0f} ms per LLM call")
+
+    # Warm up both pools
+    await run("blocking", users[:1], report=False)
+    await run("async", users[:1], report=False)
+
+    await run("blocking", users)
+    await run("async", users)
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,216 @@
+"""
+Checks that the queries of auxiliary/database.py use indexes on a large dataset.
+
+The helpers are called against a seeded database while their statements are recorded,
+then every recorded statement is explained. Exits with 1 if any plan has a sequential scan.
+
+The database is wiped and seeded, so it must be a scratch one.
+Run from the backend directory: `EXPLAIN_DATABASE_URL=postgresql://... python -m benchmarks.explain_queries`
+"""
+import asyncio
+import json
+import os
+import sys
+
+os.environ["DATABASE_URL"] = os.environ["EXPLAIN_DATABASE_URL"]
+
+from datetime import timedelta
+from sqlalchemy import event, text
+from sqlmodel import SQLModel, select
+from src.db import async_engine, get_async_session
+from src.schemas.database import User, UserDailyUsage
+from src.schemas.states.characters import Character
+from src.auxiliary import database
+
+users = int(os.getenv("EXPLAIN_USERS", "20000"))
+states_per_user = int(os.getenv("EXPLAIN_STATES_PER_USER", "30"))
+fork_states_per_user = 10
+environments_per_user = 5
+saves_per_user = 3
+usage_days = 30
+translations = 50000
+
+usage_counters = [
+    column.name for column in UserDailyUsage.__table__.columns
+    if column.name not in ("id", "user_id", "date")
+]
+
+seed_query = f"""
+INSERT INTO users (
+    id, name, password, user_biography_name, user_biography_description,
+    user_biography_displayed_name, user_biography_displayed_description,
+    user_narrative_preference, user_narrative_displayed_preference,
+    language, subscription_tier, created_at
+)
+SELECT u, 'user' || u, 'password', 'name', 'description', 'name', 'description', '', '', 'auto', 'free', now()
+FROM generate_series(1, {users}) u;
+
+INSERT INTO map_states (id, time, character_location)
+SELECT u, 'day', '[]'::json FROM generate_series(1, {users}) u;
+
+INSERT INTO environments (id, location, previous_environment_summary, previous_environment_characters, previous_environment_id)
+SELECT
+    (u - 1) * {environments_per_user} + e,
+    'main_character_home',
+    CASE WHEN e > 1 THEN 'summary' END,
+    CASE WHEN e > 1 THEN json_build_array(CASE WHEN e % 2 = 0 THEN 'alice' ELSE 'lena' END) ELSE '[]'::json END,
+    CASE WHEN e > 1 THEN (u - 1) * {environments_per_user} + e - 1 END
+FROM generate_series(1, {users}) u, generate_series(1, {environments_per_user}) e;
+
+INSERT INTO game_state_branches (id, user_id, parent_branch_id, fork_depth, head_depth, links, needs_sweep)
+SELECT 2 * u - 1, u, NULL, -1, {states_per_user} - 1, 1 + {saves_per_user}, FALSE FROM generate_series(1, {users}) u
+UNION ALL
+SELECT 2 * u, u, 2 * u - 1, {states_per_user} / 2 - 1, {states_per_user} / 2 + {fork_states_per_user} - 1, 0, u % 10 = 0 FROM generate_series(1, {users}) u;
+
+INSERT INTO messages (id, character, english_text, displayed_text, previous_message_id)
+SELECT
+    (u - 1) * ({states_per_user} + {fork_states_per_user}) + d + 1, 'alice', 'text', 'text',
+    CASE WHEN d > 0 THEN (u - 1) * ({states_per_user} + {fork_states_per_user}) + d END
+FROM generate_series(1, {users}) u, generate_series(0, {states_per_user} + {fork_states_per_user} - 1) d;
+
+INSERT INTO game_states (
+    id, user_id, characters, music, followers, last_message_id, environment_id, map_state_id,
+    previous_game_state_id, branch_id, depth
+)
+SELECT
+    (u - 1) * ({states_per_user} + {fork_states_per_user}) + d + 1, u, '[]'::json, 'none', '[]'::json,
+    (u - 1) * ({states_per_user} + {fork_states_per_user}) + d + 1,
+    u * {environments_per_user}, u,
+    CASE WHEN d > 0 THEN (u - 1) * ({states_per_user} + {fork_states_per_user}) + d END,
+    2 * u - 1, d
+FROM generate_series(1, {users}) u, generate_series(0, {states_per_user} - 1) d
+UNION ALL
+SELECT
+    (u - 1) * ({states_per_user} + {fork_states_per_user}) + {states_per_user} + f + 1, u, '[]'::json, 'none', '[]'::json,
+    (u - 1) * ({states_per_user} + {fork_states_per_user}) + {states_per_user} + f + 1,
+    u * {environments_per_user}, u,
+    CASE WHEN f > 0 THEN (u - 1) * ({states_per_user} + {fork_states_per_user}) + {states_per_user} + f
+         ELSE (u - 1) * ({states_per_user} + {fork_states_per_user}) + {states_per_user} / 2 END,
+    2 * u, {states_per_user} / 2 + f
+FROM generate_series(1, {users}) u, generate_series(0, {fork_states_per_user} - 1) f;
+
+UPDATE users SET last_game_state_id = id * ({states_per_user} + {fork_states_per_user}) - {fork_states_per_user};
+
+INSERT INTO saves (user_id, game_state_id, description, created_at)
+SELECT u, (u - 1) * ({states_per_user} + {fork_states_per_user}) + s * 10, 'save', now()
+FROM generate_series(1, {users}) u, generate_series(1, {saves_per_user}) s;
+
+INSERT INTO user_daily_usage (user_id, date, {", ".join(usage_counters)})
+SELECT u, date_trunc('day', now()) - make_interval(days => d), {", ".join("0" for _ in usage_counters)}
+FROM generate_series(1, {users}) u, generate_series(1, {usage_days}) d;
+
+INSERT INTO translation_cache (key, translation, input_tokens, output_tokens, created_at)
+SELECT md5(t::text), 'translation', 10, 10, now() - make_interval(mins => t)
+FROM generate_series(1, {translations}) t;
+"""
+
+sequences = ["users", "map_states", "environments", "game_state_branches", "messages", "game_states"]
+
+
+async def seed() -> None:
+    async with async_engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+
+        tables = ", ".join(table.name for table in SQLModel.metadata.tables.values())
+        await connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+        for statement in seed_query.split(";"):
+            if statement.strip():
+                await connection.execute(text(statement))
+
+        for table in sequences:
+            await connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+            ))
+
+    async with async_engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("ANALYZE"))
+
+
+async def call_helpers() -> None:
+    """Run every helper of auxiliary/database.py once, in one session like a request"""
+    async with get_async_session("explain") as session:
+        user = (await session.exec(select(User).where(User.id == users // 2))).one()
+
+        head = await database.get_user_game_state_by_id(session, user.last_game_state_id, user)
+
+        await database.get_user_current_game_state(session, user)
+        await database.get_map_state_by_game_state(session, head)
+        environment = await database.get_environment_by_game_state(session, head)
+        await database.get_last_message_by_state(session, head)
+        await database.get_messages_of_game_state(session, head, limit=15)
+        await database.get_messages_since(session, head.last_message_id, head.last_message_id - 10)
+        await database.update_running_summary(session, head.environment_id, None, "summary", head.last_message_id)
+        await database.get_messages_with_game_state(session, head, offset=20, limit=10)
+        await database.load_turn_context(session, user.id, head.id, message_limit=15)
+        await database.get_previous_history_summaries(session, environment, Character.ALICE, limit=6)
+        await database.increase_user_daily_usage(session, user, interaction_queries=1)
+        await database.check_user_premium_status(session, user)
+
+        await database.get_cached_translation(session, "key", timedelta(days=30))
+        await database.evict_translation_cache(session, timedelta(days=30), max_rows=translations)
+
+        await database.add_game_state_reference(session, head)
+        await database.remove_game_state_reference(session, head.branch_id)
+        await database.set_user_head(session, user, head)
+        await database.append_game_state(
+            session, head,
+            user_id=user.id, environment_id=head.environment_id, map_state_id=head.map_state_id
+        )
+        await session.rollback()
+
+        for branch_id in await database.get_branches_to_sweep(session, limit=10):
+            await database.sweep_game_state_branch(session, branch_id)
+
+        other_user = (await session.exec(select(User).where(User.id == users // 2 + 1))).one()
+        await database.create_new_game(session, other_user)
+        await database.delete_user(session, other_user)
+
+
+def sequential_scans(plan: dict) -> list[str]:
+    scans = []
+    if plan["Node Type"] == "Seq Scan":
+        scans.append(plan["Relation Name"])
+
+    for child in plan.get("Plans", []):
+        scans.extend(sequential_scans(child))
+
+    return scans
+
+
+async def main() -> None:
+    await seed()
+
+    statements: list[tuple[str, tuple]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and not statement.lstrip().upper().startswith(("INSERT", "EXPLAIN")):
+            statements.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    await call_helpers()
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+    failures = 0
+    async with async_engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+
+            scans = sequential_scans(plan[0]["Plan"])
+            if scans:
+                failures += 1
+                print(f"Sequential scan on {', '.join(scans)}:\n{' '.join(statement.split())}\n")
+
+        await connection.rollback()
+
+    await async_engine.dispose()
+
+    print(f"{len(statements)} statements explained, {failures} with sequential scans")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
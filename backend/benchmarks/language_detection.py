@@ -0,0 +1,128 @@
+"""
+Latency and accuracy of the local language detection on short chat lines.
+
+Run from the backend directory: `python -m benchmarks.language_detection`
+"""
+import time
+from src.classifier.language import TranslationAction, detect_language, decide_translation, min_confidence
+from src.schemas.other import Language
+
+samples: list[tuple[Language, str]] = [
+    (Language.ENGLISH, "Hi, how are you doing today?"),
+    (Language.ENGLISH, "I think we should go to the beach"),
+    (Language.ENGLISH, "What are you doing here?"),
+    (Language.ENGLISH, "Sorry, I didn't know that"),
+    (Language.RUSSIAN, "Привет, как дела?"),
+    (Language.RUSSIAN, "Пойдём на пляж вечером"),
+    (Language.RUSSIAN, "Что ты здесь делаешь?"),
+    (Language.RUSSIAN, "Я не знаю, где она"),
+    (Language.UKRAINIAN, "Привіт, як справи?"),
+    (Language.UKRAINIAN, "Що ти тут робиш?"),
+    (Language.UKRAINIAN, "Я не знаю, де вона"),
+    (Language.CHINESE_SIMPLIFIED, "你好，你在这里做什么？"),
+    (Language.CHINESE_SIMPLIFIED, "我们去海边吧"),
+    (Language.CHINESE_TRADITIONAL, "你好，你在這裡做什麼？"),
+    (Language.CHINESE_TRADITIONAL, "我們去海邊吧"),
+    (Language.SPANISH, "Hola, ¿qué estás haciendo aquí?"),
+    (Language.SPANISH, "Vamos a la playa por la tarde"),
+    (Language.HINDI, "नमस्ते, आप कैसे हैं?"),
+    (Language.HINDI, "चलो समुद्र तट पर चलते हैं"),
+    (Language.KOREAN, "안녕, 여기서 뭐 해?"),
+    (Language.KOREAN, "해변에 가자"),
+    (Language.FRENCH, "Salut, qu'est-ce que tu fais ici ?"),
+    (Language.FRENCH, "Je ne sais pas où elle est"),
+    (Language.ITALIAN, "Ciao, cosa fai qui?"),
+    (Language.ITALIAN, "Non so dove sia lei"),
+    (Language.DUTCH, "Hallo, wat doe jij hier?"),
+    (Language.DUTCH, "Ik weet niet waar ze is"),
+    (Language.POLISH, "Cześć, co tu robisz?"),
+    (Language.POLISH, "Nie wiem, gdzie ona jest"),
+    (Language.ARABIC, "مرحبا، ماذا تفعل هنا؟"),
+    (Language.ARABIC, "لنذهب إلى الشاطئ"),
+    (Language.PORTUGUESE, "Olá, o que você está fazendo aqui?"),
+    (Language.PORTUGUESE, "Não sei onde ela está"),
+    (Language.JAPANESE, "こんにちは、ここで何をしているの？"),
+    (Language.JAPANESE, "海に行こうよ"),
+    (Language.GERMAN, "Hallo, was machst du hier?"),
+    (Language.GERMAN, "Ich weiß nicht, wo sie ist"),
+    (Language.INDONESIAN, "Halo, apa yang kamu lakukan di sini?"),
+    (Language.INDONESIAN, "Saya tidak tahu dia di mana"),
+    (Language.TURKISH, "Merhaba, burada ne yapıyorsun?"),
+    (Language.TURKISH, "Onun nerede olduğunu bilmiyorum"),
+    (Language.VIETNAMESE, "Xin chào, bạn đang làm gì ở đây?"),
+    (Language.VIETNAMESE, "Tôi không biết cô ấy ở đâu"),
+    (Language.ROMANIAN, "Salut, ce faci aici?"),
+    (Language.ROMANIAN, "Nu știu unde este ea"),
+]
+
+# Too short to tell apart, the language of the previous turns is expected
+short_samples: list[tuple[Language, str, str]] = [
+    (Language.RUSSIAN, "ок", "Привет, как дела? Я не знаю, где она"),
+    (Language.GERMAN, "ja", "Hallo, was machst du hier? Ich weiß nicht, wo sie ist"),
+    (Language.ENGLISH, "ok", "Hi, how are you doing today? What are you doing here?"),
+    (Language.SPANISH, "jaja", "Hola, ¿qué estás haciendo aquí? Vamos a la playa"),
+]
+
+# First lines of a scene have no previous turns, a guess below the threshold must not be used
+first_line_samples: list[str] = ["no", "je", "ja", "ok"]
+
+# Greetings and thanks of one language are enough on a first line
+first_line_greetings: list[tuple[Language, str]] = [
+    (Language.SPANISH, "gracias"),
+    (Language.SPANISH, "hola amigo"),
+    (Language.FRENCH, "Bonjour"),
+    (Language.FRENCH, "merci beaucoup"),
+    (Language.GERMAN, "Danke"),
+    (Language.ITALIAN, "ciao"),
+]
+
+
+def main(rounds: int = 200) -> None:
+    correct = 0
+    confident = 0
+    for language, text in samples:
+        detection = detect_language(text)
+        if detection.language == language:
+            correct += 1
+        else:
+            print(f"Wrong: {text!r} detected as {detection.language} ({detection.confidence})")
+        if detection.confidence >= min_confidence:
+            confident += 1
+
+    reused = sum(
+        1 for language, text, previous_text in short_samples
+        if decide_translation(text, previous_text).language == language
+    )
+
+    kept_english = 0
+    for text in first_line_samples:
+        decision = decide_translation(text)
+        if decision.language == Language.ENGLISH and decision.action == TranslationAction.SKIP:
+            kept_english += 1
+        else:
+            print(f"Guessed: {text!r} without previous turns decided as {decision.language} ({decision.confidence})")
+
+    greeted = 0
+    for language, text in first_line_greetings:
+        decision = decide_translation(text)
+        if decision.language == language and decision.action == TranslationAction.TRANSLATE:
+            greeted += 1
+        else:
+            print(f"Missed: {text!r} without previous turns decided as {decision.language} ({decision.confidence})")
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for _, text in samples:
+            detect_language(text)
+    elapsed = time.perf_counter() - start
+
+    print(f"Accuracy: {correct}/{len(samples)} ({correct / len(samples):.1%})")
+    print(f"Confident: {confident}/{len(samples)}")
+    print(f"Short lines resolved by previous turns: {reused}/{len(short_samples)}")
+    print(f"Short first lines kept in English: {kept_english}/{len(first_line_samples)}")
+    print(f"Greetings on first lines translated: {greeted}/{len(first_line_greetings)}")
+    print(f"Latency: {elapsed / (rounds * len(samples)) * 1e6:.1f} us per line")
+
+
+if __name__ == "__main__":
+    main()
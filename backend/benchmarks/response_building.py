@@ -0,0 +1,90 @@
+"""
+Time of building a GameStateInterface from a game state, with URLs concatenated per response
+as before, against lookups in the compiled asset manifest.
+
+Run from the backend directory: `STATIC_URL_ROOT=https://... python -m benchmarks.response_building`
+"""
+import os
+import timeit
+from src.auxiliary.config import static_url_root
+from src.auxiliary.state import (
+    character_time_clothe,
+    character_to_head_url,
+    facial_expression_to_url,
+    get_character_sprites_by_location,
+    parse_game_to_interface,
+    pose_clothes_to_url,
+    pose_to_url,
+    time_location_to_url,
+)
+from src.schemas.api.game_state import CharacterSpriteURLS, GameStateInterface, MessageGameState
+from src.schemas.database import Environment, GameState, MapState, Message
+from src.schemas.states.characters import Character
+from src.schemas.states.locations import Location
+from src.schemas.states.music import Music, music_urls
+from src.schemas.states.other import CharacterLocation
+from src.schemas.states.times import Time
+
+iterations = int(os.getenv("BENCHMARK_ITERATIONS", "20000"))
+
+
+def concatenated_interface(
+    environment: Environment,
+    game_state: GameState,
+    map_state: MapState,
+    message: Message | None = None
+) -> GameStateInterface:
+    """parse_game_to_interface as it was before the manifest"""
+    music_urls_api = [static_url_root + music_url for music_url in music_urls[game_state.music]]
+    background_url = static_url_root + time_location_to_url.get(map_state.time, None).get(environment.location, None)
+
+    character_sprites = []
+    for character in game_state.characters:
+        character_sprites.append(CharacterSpriteURLS(
+            pose_url=static_url_root + pose_to_url.get(character['pose'], None),
+            clothes_url=static_url_root + pose_clothes_to_url.get(character['pose'], None).get(character['clothes'], None),
+            facial_expression_url=static_url_root + facial_expression_to_url.get(character['pose'], None).get(character['facial_expression'], None)
+        ))
+
+    return GameStateInterface(
+        id=game_state.id,
+        characters=character_sprites,
+        background_url=background_url,
+        message=MessageGameState(message=message, game_state_id=game_state.id).model_dump() if message else None,
+        followers_head_urls=[static_url_root + character_to_head_url.get(character, None) for character in game_state.followers],
+        time=map_state.time,
+        music_urls=music_urls_api,
+        music_type=game_state.music
+    )
+
+
+def main() -> None:
+    character_locations = [
+        CharacterLocation(location=Location.BEACH, character=character, clothes=character_time_clothe[Time.DAY][character]).model_dump()
+        for character in (Character.ALICE, Character.ULYANA, Character.LENA)
+    ]
+
+    environment = Environment(id=1, location=Location.BEACH.value)
+    map_state = MapState(id=1, time=Time.DAY.value, character_location=character_locations)
+    game_state = GameState(
+        id=1,
+        user_id=1,
+        characters=get_character_sprites_by_location(Location.BEACH, character_locations),
+        music=Music.NORMAL.value,
+        followers=[Character.ALICE.value, Character.LENA.value],
+        environment_id=1,
+        map_state_id=1
+    )
+    message = Message(id=1, character=Character.ALICE.value, english_text="Hi", displayed_text="Hi")
+
+    for name, build in (("concatenated", concatenated_interface), ("manifest", parse_game_to_interface)):
+        seconds = min(timeit.repeat(
+            lambda: build(environment, game_state, map_state, message),
+            number=iterations,
+            repeat=5
+        ))
+        print(f"{name:>12}: {seconds / iterations * 1e6:6.1f} us per response")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,125 @@ Script to download and convert model to ONNX during Docker build
 import os
 import torch
 import logging
+import numpy as np
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Conversation turns and label sets used to compare fp32 and int8 decisions
+accuracy_check_samples = [
+    (
+        "alice: Get out of my way before I throw you into the lake!",
+        "Mood of conversation is {}",
+        ["Funny", "Sad and melancholic", "Normal", "Happy and cheerful", "Angry and aggressive", "Scary and frightening"]
+    ),
+    (
+        "lena: I... I'm sorry. I just wanted to read alone for a while.",
+        "Mood of conversation is {}",
+        ["Funny", "Sad and melancholic", "Normal", "Happy and cheerful", "Romantic and sweet", "Confusing and mysterious"]
+    ),
+    (
+        "ulyana: Haha! You should have seen your face when the bucket fell on you!",
+        "Mood of conversation is {}",
+        ["Funny", "Sad and melancholic", "Normal", "Angry and aggressive", "Scary and frightening"]
+    ),
+    (
+        "miku: Did you know I can play seven instruments? Let's go to the stage, I'll show you!",
+        "Mood of conversation is {}",
+        ["Funny", "Normal", "Happy and cheerful", "Romantic and sweet", "Sad and melancholic"]
+    ),
+    (
+        "slavya: The sunset over the river is beautiful tonight. I'm glad you're here with me.",
+        "Mood of conversation is {}",
+        ["Funny", "Normal", "Happy and cheerful", "Romantic and sweet", "Scary and frightening"]
+    ),
+    (
+        "main_character: Did you hear that noise in the old bunker?\nlena: Something is moving down there... I'm scared.",
+        "Mood of conversation is {}",
+        ["Funny", "Normal", "Happy and cheerful", "Confusing and mysterious", "Scary and frightening"]
+    ),
+    (
+        "alice: What are you staring at? Hmph. It's not like I made this for you.",
+        "The alice mood based on his response is {}",
+        ["Normal or happy.", "Guilty, sad or shy.", "Very angry.", "Confused.", "Grinning."]
+    ),
+    (
+        "lena: Leave me alone! I told you I don't want to talk about it!",
+        "The lena mood based on his response is {}",
+        ["Smiling or angry.", "Sad or surprised.", "Serious or grinning."]
+    ),
+    (
+        "main_character: Would you like to go to the beach with me?\nslavya: Of course, let's go together!",
+        "The slavya {} Semyon whether he wants to go.",
+        ["agreed to follow", "refused to follow"]
+    ),
+    (
+        "main_character: Come with me to the forest.\nulyana: No way, I have to finish my prank first.",
+        "The ulyana {} Semyon whether he wants to go.",
+        ["agreed to follow", "refused to follow"]
+    ),
+]
+
+def quantize_onnx_model(onnx_model_path: str, quantized_model_path: str):
+    """
+    Dynamically quantize weights of the fp32 model to int8
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    logger.info("Quantizing ONNX model to int8...")
+
+    quantize_dynamic(
+        model_input=onnx_model_path,
+        model_output=quantized_model_path,
+        weight_type=QuantType.QInt8
+    )
+
+    logger.info(f"Quantized model saved to: {quantized_model_path}")
+
+
+def check_quantized_accuracy(onnx_model_path: str, quantized_model_path: str, tokenizer):
+    """
+    Compare top-1 decisions of fp32 and int8 models on the fixed conversation samples
+    """
+    import onnxruntime as ort
+
+    fp32_session = ort.InferenceSession(onnx_model_path, providers=['CPUExecutionProvider'])
+    int8_session = ort.InferenceSession(quantized_model_path, providers=['CPUExecutionProvider'])
+
+    agreements = 0
+    for premise, hypothesis_template, labels in accuracy_check_samples:
+        inputs = tokenizer(
+            [(premise, hypothesis_template.format(label)) for label in labels],
+            padding=True,
+            truncation=True,
+            max_length=256,
+            return_tensors="np"
+        )
+        ort_inputs = {
+            'input_ids': inputs['input_ids'].astype(np.int64),
+            'attention_mask': inputs['attention_mask'].astype(np.int64)
+        }
+
+        fp32_label = labels[int(np.argmax(fp32_session.run(None, ort_inputs)[0][:, 0]))]
+        int8_label = labels[int(np.argmax(int8_session.run(None, ort_inputs)[0][:, 0]))]
+
+        if fp32_label == int8_label:
+            agreements += 1
+        else:
+            logger.warning(f"fp32 and int8 disagree on {premise!r}: {fp32_label!r} != {int8_label!r}")
+
+    agreement = agreements / len(accuracy_check_samples)
+    logger.info(f"Top-1 agreement of int8 with fp32: {agreement:.0%} on {len(accuracy_check_samples)} samples")
+
+    min_agreement = float(os.getenv("INT8_MIN_AGREEMENT", "0.9"))
+    if agreement < min_agreement:
+        raise RuntimeError(
+            f"Quantized model agreement {agreement:.0%} is below the required {min_agreement:.0%}"
+        )
+
+
 def build_onnx_model():
     # Model name from environment variable
     model_name = os.environ["STANDARD_CLASSIFIER_NAME"]
@@ -79,6 +192,12 @@ def build_onnx_model():
     tokenizer_path = os.path.join(models_dir, "tokenizer")
     tokenizer.save_pretrained(tokenizer_path)
     logger.info(f"Tokenizer saved to: {tokenizer_path}")
+
+    # Optionally build int8 model next to the fp32 one
+    if os.getenv("BUILD_INT8_CLASSIFIER", "false").lower() == "true":
+        quantized_model_path = os.path.join(models_dir, "classifier_int8.onnx")
+        quantize_onnx_model(onnx_model_path, quantized_model_path)
+        check_quantized_accuracy(onnx_model_path, quantized_model_path, tokenizer)
     
     logger.info("Model building completed successfully!")
 
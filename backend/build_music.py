@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Script to transcode music tracks into streaming variants before the static assets are fingerprinted
+
+Every track of music_urls is encoded with ffmpeg as Opus in the bitrates of the bandwidth classes,
+and its first seconds as an intro segment, written to static/music_variants.
+Run it before build_static.py, which fingerprints the variants with the other assets;
+the backend sends them to clients of a low bandwidth class once they are in the static manifest.
+
+Needs ffmpeg built with libopus on the PATH (FFMPEG_PATH).
+Run from the backend directory: `python build_music.py`
+"""
+import logging
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Only the music tables are needed, not the URLs
+os.environ.setdefault("STATIC_URL_ROOT", "")
+
+from src.schemas.states.music import (
+    music_bitrates,
+    music_intro_bitrate,
+    music_intro_path,
+    music_intro_seconds,
+    music_urls,
+    music_variant_path,
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+static_dir = os.getenv("STATIC_SOURCE_DIR", "../static")
+ffmpeg_path = os.getenv("FFMPEG_PATH", "ffmpeg")
+
+
+def encode(source_path: str, output_path: str, bitrate: int, seconds: int | None = None) -> None:
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    command = [ffmpeg_path, "-y", "-v", "error", "-i", source_path]
+    if seconds is not None:
+        command += ["-t", str(seconds)]
+
+    command += [
+        "-vn", "-map_metadata", "-1",
+        "-c:a", "libopus", "-b:a", f"{bitrate}k", "-vbr", "on",
+        "-compression_level", "10", "-application", "audio",
+        output_path
+    ]
+    subprocess.run(command, check=True)
+
+
+def transcode(path: str) -> dict[str, int]:
+    """Write all variants of one track, returns bytes of the track and of each variant"""
+    source_path = os.path.join(static_dir, path)
+    outputs = {music_intro_path(path): (music_intro_bitrate, music_intro_seconds)}
+    outputs |= {music_variant_path(path, bitrate): (bitrate, None) for bitrate in music_bitrates.values()}
+
+    for output, (bitrate, seconds) in outputs.items():
+        encode(source_path, os.path.join(static_dir, output), bitrate, seconds)
+
+    return {path: os.path.getsize(source_path)} | {
+        output: os.path.getsize(os.path.join(static_dir, output)) for output in outputs
+    }
+
+
+if __name__ == "__main__":
+    paths = sorted({path for paths in music_urls.values() for path in paths})
+    start = time.perf_counter()
+
+    # ffmpeg runs in its own processes
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        sizes = list(executor.map(transcode, paths))
+
+    totals = {}
+    for path, track_sizes in zip(paths, sizes):
+        original = track_sizes[path]
+        for bandwidth_class, bitrate in music_bitrates.items():
+            totals.setdefault(bandwidth_class.value, [0, 0])
+            totals[bandwidth_class.value][0] += original
+            totals[bandwidth_class.value][1] += track_sizes[music_variant_path(path, bitrate)]
+
+        reductions = ", ".join(
+            f"{bitrate}k {1 - track_sizes[music_variant_path(path, bitrate)] / original:.0%} smaller"
+            for bitrate in music_bitrates.values()
+        )
+        logger.info(
+            f"{path}: {original / 1024:.0f} KiB, {reductions}, "
+            f"intro {track_sizes[music_intro_path(path)] / 1024:.0f} KiB"
+        )
+
+    logger.info(f"Transcoded {len(paths)} tracks in {time.perf_counter() - start:.1f} s")
+    for bandwidth_class, (original, variant) in totals.items():
+        logger.info(f"{bandwidth_class}: {variant / 1024 ** 2:.1f} MiB against {original / 1024 ** 2:.1f} MiB, {1 - variant / original:.0%} smaller")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Script to composite character sprites before the static assets are fingerprinted
+
+Every sprite the game can show is flattened from its pose, clothes and facial expression layers
+into one image, written as WebP and AVIF in the widths of auxiliary/state.py to static/composites.
+Run it before build_static.py, which fingerprints the composites with the other assets;
+the backend sends their URLs once they are in the static manifest.
+
+Needs Pillow with WebP and AVIF support (Pillow >= 11.3).
+Run from the backend directory: `python build_sprites.py`
+"""
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, features
+
+# Only the asset tables are needed, not the URLs
+os.environ.setdefault("STATIC_URL_ROOT", "")
+
+from src.auxiliary.state import (
+    composite_formats,
+    composite_path,
+    composite_widths,
+    facial_expression_to_url,
+    pose_clothes_to_url,
+    pose_to_url,
+    sprite_combinations,
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+static_dir = os.getenv("STATIC_SOURCE_DIR", "../static")
+
+# Encoder settings, alpha is kept lossless at the edges by exact
+format_options = {
+    "webp": {"quality": 90, "method": 6, "exact": True},
+    "avif": {"quality": 70, "speed": 4},
+}
+
+
+def composite(combination) -> tuple[int, int]:
+    """Write all variants of one sprite, returns bytes of its layers and of its full size WebP"""
+    pose, clothes, facial_expression = combination
+    layer_paths = [
+        pose_to_url[pose],
+        pose_clothes_to_url[pose][clothes],
+        facial_expression_to_url[pose][facial_expression],
+    ]
+
+    layers = [Image.open(os.path.join(static_dir, path)).convert("RGBA") for path in layer_paths]
+    sprite = layers[0]
+    for layer in layers[1:]:
+        sprite = Image.alpha_composite(sprite, layer)
+
+    for width in composite_widths:
+        height = round(sprite.height * width / sprite.width)
+        resized = sprite if width == sprite.width else sprite.resize((width, height), Image.Resampling.LANCZOS)
+
+        for image_format in composite_formats:
+            output_path = os.path.join(static_dir, composite_path(pose, clothes, facial_expression, width, image_format))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            resized.save(output_path, format=image_format.upper(), **format_options[image_format])
+
+    layer_bytes = sum(os.path.getsize(os.path.join(static_dir, path)) for path in layer_paths)
+    full_size_path = composite_path(pose, clothes, facial_expression, composite_widths[0], composite_formats[0])
+    return layer_bytes, os.path.getsize(os.path.join(static_dir, full_size_path))
+
+
+if __name__ == "__main__":
+    for image_format in composite_formats:
+        if not features.check(image_format):
+            raise RuntimeError(f"Pillow is built without {image_format} support")
+
+    combinations = sorted(sprite_combinations())
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor() as executor:
+        sizes = list(executor.map(composite, combinations))
+
+    layer_bytes = sum(size[0] for size in sizes)
+    composite_bytes = sum(size[1] for size in sizes)
+    logger.info(
+        f"Composited {len(combinations)} sprites in {time.perf_counter() - start:.1f} s, "
+        f"full size WebP is {composite_bytes / layer_bytes:.0%} of the PNG layers "
+        f"({composite_bytes / len(sizes) / 1024:.0f} KiB against {layer_bytes / len(sizes) / 1024:.0f} KiB per sprite)"
+    )
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Script to fingerprint static assets before they are uploaded
+
+Every file of the static directory is copied to the output directory with a hash of its content
+in the name, e.g. music/afterword.ogg to music/afterword.3f2a1b9c0d4e.ogg.
+The manifest of source paths to fingerprinted ones is read by the backend (STATIC_MANIFEST_PATH).
+
+A changed file gets a new name, so the output can be served with
+`Cache-Control: public, max-age=31536000, immutable` and clients keep it across deploys.
+Upload the output before deploying the backend with the new manifest.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+source_dir = os.getenv("STATIC_SOURCE_DIR", "../static")
+output_dir = os.getenv("STATIC_OUTPUT_DIR", "../static_build")
+manifest_path = os.getenv("STATIC_MANIFEST_PATH", "static_manifest.json")
+hash_length = 12
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()[:hash_length]
+
+
+def fingerprint(source_dir: str, output_dir: str) -> dict[str, str]:
+    manifest = {}
+
+    for directory, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+
+            source_path = os.path.join(directory, name)
+            relative_path = os.path.relpath(source_path, source_dir).replace(os.sep, "/")
+
+            stem, extension = os.path.splitext(relative_path)
+            fingerprinted_path = f"{stem}.{file_hash(source_path)}{extension}"
+
+            output_path = os.path.join(output_dir, fingerprinted_path)
+            if not os.path.exists(output_path):
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                shutil.copy2(source_path, output_path)
+
+            manifest[relative_path] = fingerprinted_path
+
+    return manifest
+
+
+if __name__ == "__main__":
+    manifest = fingerprint(source_dir, output_dir)
+
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+    logger.info(f"Fingerprinted {len(manifest)} assets into {output_dir}, manifest written to {manifest_path}")
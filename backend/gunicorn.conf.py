@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+bind = "0.0.0.0:8080"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+sidecar_process = None
+sidecar_stopping = threading.Event()
+# Held while the sidecar is replaced, so on_exit does not miss a restarted one
+sidecar_lock = threading.Lock()
+# Delay before a crashed sidecar is restarted, doubled while it keeps crashing during startup
+sidecar_restart_delay = float(os.getenv("CLASSIFIER_SIDECAR_RESTART_DELAY", "1"))
+sidecar_max_restart_delay = 60.0
+# A sidecar running this long is considered started, so the restart delay is reset
+sidecar_healthy_seconds = 60.0
+
+
+def start_sidecar(server) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, "-m", "src.classifier.sidecar"])
+    server.log.info(f"Started classifier sidecar with pid {process.pid}")
+    return process
+
+
+def watch_sidecar(server) -> None:
+    """
+    Restart the sidecar when it exits, e.g. killed for memory, since workers can not classify without it
+    """
+    global sidecar_process
+
+    delay = sidecar_restart_delay
+    while True:
+        started_at = time.monotonic()
+        exit_code = sidecar_process.wait()
+
+        if sidecar_stopping.is_set():
+            return
+
+        if time.monotonic() - started_at >= sidecar_healthy_seconds:
+            delay = sidecar_restart_delay
+
+        server.log.error(f"Classifier sidecar exited with code {exit_code}, restarting in {delay:.0f} s")
+        if sidecar_stopping.wait(delay):
+            return
+
+        with sidecar_lock:
+            if sidecar_stopping.is_set():
+                return
+            sidecar_process = start_sidecar(server)
+        delay = min(delay * 2, sidecar_max_restart_delay)
+
+
+def on_starting(server):
+    """
+    In sidecar mode start one classifier process, which all workers share
+    """
+    global sidecar_process
+
+    if os.getenv("CLASSIFIER_MODE", "local").lower() == "sidecar":
+        sidecar_process = start_sidecar(server)
+        threading.Thread(target=watch_sidecar, args=(server,), name="sidecar-watcher", daemon=True).start()
+
+
+def on_exit(server):
+    with sidecar_lock:
+        sidecar_stopping.set()
+
+    if sidecar_process is not None:
+        sidecar_process.terminate()
+        sidecar_process.wait()
@@ -1,22 +1,38 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from sqlmodel import SQLModel
 from src.schemas.database import (
     User, UserDailyUsage, Environment, MapState, 
     Message, GameState, Save
 )
 from contextlib import asynccontextmanager
+import asyncio
 from src.routers.game_state import game_state_router
 from src.routers.user import user_router
 from src.routers.save import save_router
-from src.db import engine
+from src.routers.metrics import metrics_router
+from src.db import async_engine
 from fastapi.middleware.cors import CORSMiddleware
 from src.classifier.bert import classifier as bert_classifier
+from src.llm.client import http_client
+from src.auxiliary.sweeper import run_sweeper
+from src.auxiliary.usage import run_usage_flusher, usage_buffer
+from src.auxiliary.state import bandwidth_class, parse_bandwidth_class
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):    
     bert_classifier.load_model()
-    SQLModel.metadata.create_all(engine)
+    async with async_engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    sweeper = asyncio.create_task(run_sweeper())
+    usage_flusher = asyncio.create_task(run_usage_flusher())
     yield
+    sweeper.cancel()
+    usage_flusher.cancel()
+    # Counters buffered since the last flush
+    await usage_buffer.flush()
+    bert_classifier.close()
+    await http_client.aclose()
+    await async_engine.dispose()
 
 app = FastAPI(lifespan=lifespan, root_path="/api/v1")
 
@@ -29,6 +45,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Music URLs of the responses are chosen by the bandwidth the client declares
+@app.middleware("http")
+async def set_bandwidth_class(request: Request, call_next):
+    token = bandwidth_class.set(parse_bandwidth_class(
+        request.headers.get("X-Bandwidth-Class"),
+        request.headers.get("Save-Data")
+    ))
+    try:
+        return await call_next(request)
+    finally:
+        bandwidth_class.reset(token)
+
 app.include_router(game_state_router)
 app.include_router(user_router)
-app.include_router(save_router)
\ No newline at end of file
+app.include_router(save_router)
+app.include_router(metrics_router)
\ No newline at end of file
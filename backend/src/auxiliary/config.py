@@ -10,4 +10,10 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
 
-static_url_root = os.environ["STATIC_URL_ROOT"]
\ No newline at end of file
+# Bearer token of the metrics endpoint, which is disabled without it
+metrics_token = os.getenv("METRICS_TOKEN")
+
+static_url_root = os.environ["STATIC_URL_ROOT"]
+# Written by build_static.py, maps asset paths to their fingerprinted names.
+# Without it assets are referenced by their source paths.
+static_manifest_path = os.getenv("STATIC_MANIFEST_PATH", "static_manifest.json")
\ No newline at end of file
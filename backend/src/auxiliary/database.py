@@ -1,237 +1,508 @@
-from src.schemas.database import Message, GameState, User, MapState, Environment, UserDailyUsage, SubscriptionTier
-from src.db import get_session
+from src.schemas.database import (
+    Message, GameState, GameStateBranch, User, MapState, Environment, UserDailyUsage, SubscriptionTier,
+    TranslationCacheEntry
+)
 from sqlmodel import select, delete
-from sqlalchemy import text, desc
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text, desc, and_, update
+from pydantic import BaseModel, ConfigDict
 from src.auxiliary.state import generate_character_locations
 from src.schemas.states.times import Time
 from src.auxiliary.state import parse_game_to_interface
 from src.schemas.api.game_state import GameStateInterface, MessageGameState
 from src.schemas.states.characters import Character
 from src.auxiliary.helper import str_to_enum
-from datetime import datetime, UTC
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm.attributes import set_committed_value
+from src.auxiliary.user_cache import invalidate_user
+from datetime import datetime, timedelta, UTC
+import logging
 
-def get_last_message_by_state(game_state: GameState) -> Message | None:
-    with get_session() as session:
-        message = session.exec(
-            select(Message).filter(Message.id == game_state.last_message_id)
-        ).first()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-        if message is not None:
-            session.expunge(message)
+async def get_last_message_by_state(session: AsyncSession, game_state: GameState) -> Message | None:
+    message = (await session.exec(
+        select(Message).filter(Message.id == game_state.last_message_id)
+    )).first()
 
-        return message
+    return message
 
 
-def get_user_game_state_by_id(game_state_id: int, user: User) -> GameState | None:
-    with get_session() as session:
-        game_state = session.exec(
-            select(GameState).filter(GameState.id == game_state_id, GameState.user_id == user.id)
-        ).first()
+async def get_user_game_state_by_id(session: AsyncSession, game_state_id: int, user: User) -> GameState | None:
+    game_state = (await session.exec(
+        select(GameState).filter(GameState.id == game_state_id, GameState.user_id == user.id)
+    )).first()
 
-        if game_state is not None:
-            session.expunge(game_state)
+    return game_state
 
-        return game_state
 
+async def get_map_state_by_game_state(session: AsyncSession, game_state: GameState) -> MapState:
+    game_state = (await session.exec(
+        select(MapState).where(game_state.map_state_id == MapState.id)
+    )).first()
 
-def get_map_state_by_game_state(game_state: GameState) -> MapState:
-    with get_session() as session:
-        game_state = session.exec(
-            select(MapState).where(game_state.map_state_id == MapState.id)
-        ).first()
+    return game_state
 
-        session.expunge(game_state)
-        return game_state
 
+async def get_environment_by_game_state(session: AsyncSession, game_state: GameState) -> Environment:
+    environment = (await session.exec(
+        select(Environment).where(game_state.environment_id == Environment.id)
+    )).first()
 
-def get_environment_by_game_state(game_state: GameState) -> Environment:
-    with get_session() as session:
-        environment = session.exec(
-            select(Environment).where(game_state.environment_id == Environment.id)
-        ).first()
+    return environment
 
-        session.expunge(environment)
-        return environment
 
-
-def get_messages_of_game_state(game_state: GameState, limit: int | None = None, offset: int = 0) -> list[Message]:
-    with get_session() as session:
-        if game_state.last_message_id is None:
-            return []
+async def get_messages_of_game_state(session: AsyncSession, game_state: GameState, limit: int | None = None, offset: int = 0) -> list[Message]:
+    if game_state.last_message_id is None:
+        return []
             
-        # Use a recursive CTE to fetch all messages in the chain
-        # This is more efficient than fetching them one by one
-        query = """
-        WITH RECURSIVE message_chain AS (
-            SELECT * FROM messages WHERE id = :last_message_id
-            UNION ALL
-            SELECT m.* FROM messages m
-            JOIN message_chain mc ON m.id = mc.previous_message_id
-            WHERE m.id IS NOT NULL
-        )
-        SELECT id FROM message_chain
-        """
+    # Use a recursive CTE to fetch all messages in the chain
+    # This is more efficient than fetching them one by one
+    query = """
+    WITH RECURSIVE message_chain AS (
+        SELECT * FROM messages WHERE id = :last_message_id
+        UNION ALL
+        SELECT m.* FROM messages m
+        JOIN message_chain mc ON m.id = mc.previous_message_id
+        WHERE m.id IS NOT NULL
+    )
+    SELECT id FROM message_chain
+    """
         
-        # Prepare parameters for the query
-        params = {"last_message_id": game_state.last_message_id}
+    # Prepare parameters for the query
+    params = {"last_message_id": game_state.last_message_id}
 
-        if limit is not None:
-            query += "\nLIMIT :limit"
-            params["limit"] = limit
+    if limit is not None:
+        query += "\nLIMIT :limit"
+        params["limit"] = limit
 
-        # Execute the raw SQL query to get just the IDs
-        result = session.exec(text(query), params=params)
-        message_ids = [row[0] for row in result]
+    # Execute the raw SQL query to get just the IDs
+    result = await session.exec(text(query), params=params)
+    message_ids = [row[0] for row in result]
         
-        # Fetch all messages at once using SQLAlchemy ORM
-        if message_ids:
-            messages = session.exec(
-                select(Message).where(Message.id.in_(message_ids)).order_by(desc(Message.id)).offset(offset)
-            ).all()
-            
-            # Detach all messages from the session
-            session.expunge_all()
+    # Fetch all messages at once using SQLAlchemy ORM
+    if message_ids:
+        messages = (await session.exec(
+            select(Message).where(Message.id.in_(message_ids)).order_by(desc(Message.id)).offset(offset)
+        )).all()
                 
-            return messages
-        return []
+        return messages
+    return []
 
 
-def create_new_game(user: User) -> GameStateInterface:
-    with get_session() as session:
-        random_locations = generate_character_locations(time=Time.DAY)
+async def get_messages_since(session: AsyncSession, last_message_id: int, since_message_id: int | None) -> tuple[list[Message], bool]:
+    """
+    Messages of the chain ending at last_message_id which follow since_message_id, oldest first.
+    The chain is walked back until since_message_id, the flag tells whether it was reached;
+    if not, the message is on another branch and the whole chain is returned.
+    """
+    query = """
+    WITH RECURSIVE message_chain AS (
+        SELECT id, previous_message_id FROM messages
+        WHERE id = :last_message_id AND id IS DISTINCT FROM CAST(:since_message_id AS INTEGER)
+        UNION ALL
+        SELECT m.id, m.previous_message_id FROM messages m
+        JOIN message_chain mc ON m.id = mc.previous_message_id
+        WHERE m.id IS DISTINCT FROM CAST(:since_message_id AS INTEGER)
+    )
+    SELECT id, previous_message_id FROM message_chain
+    """
+    chain = (await session.exec(
+        text(query),
+        params={"last_message_id": last_message_id, "since_message_id": since_message_id}
+    )).all()
 
-        new_environment = Environment()
-        new_map_state = MapState(
-            time=Time.DAY,
-            character_location=random_locations
-        )
+    reached = since_message_id is None or last_message_id == since_message_id or any(
+        previous_message_id == since_message_id for _, previous_message_id in chain
+    )
 
-        session.add(new_environment)
-        session.add(new_map_state)
-        session.flush()
+    if not chain:
+        return [], reached
 
-        session.refresh(new_environment)
-        session.refresh(new_map_state)
+    messages = (await session.exec(
+        select(Message).where(Message.id.in_([row[0] for row in chain])).order_by(Message.id)
+    )).all()
 
-        new_game_state = GameState(
-            user_id=user.id,
-            last_message_id=None,
-            environment_id=new_environment.id,
-            map_state_id=new_map_state.id,
-            previous_game_state_id=None
+    return list(messages), reached
+
+
+async def update_running_summary(
+    session: AsyncSession,
+    environment_id: int,
+    previous_message_id: int | None,
+    summary: str,
+    message_id: int
+) -> bool:
+    """
+    Replace the running summary of the environment, unless another fold has replaced
+    the one it continues in the meantime
+    """
+    result = await session.exec(
+        update(Environment)
+        .where(
+            Environment.id == environment_id,
+            Environment.running_summary_message_id.is_not_distinct_from(previous_message_id)
         )
+        .values(running_summary=summary, running_summary_message_id=message_id)
+    )
 
-        session.add(new_game_state)
-        session.flush()
-        session.refresh(new_game_state)
+    return result.rowcount == 1
+
+
+class TurnContext(BaseModel):
+    """
+    Everything an interaction turn reads from the database, loaded at its start
+    """
+    model_config = ConfigDict(frozen=True, arbitrary_types_allowed=True)
+
+    user: User
+    game_state: GameState
+    environment: Environment
+    map_state: MapState
+    # Latest message first
+    messages: tuple[Message, ...]
+
+
+async def load_turn_context(session: AsyncSession, user_id: int, game_state_id: int, message_limit: int) -> tuple[User | None, TurnContext | None]:
+    """
+    Load the user, the game state with its environment and map state and the last messages
+    in two queries on one connection.
+
+    Returns the user (None if it does not exist) and the context
+    (None if the game state does not exist or belongs to another user).
+    """
+    row = (await session.exec(
+        select(User, GameState, Environment, MapState)
+        .outerjoin(GameState, and_(GameState.id == game_state_id, GameState.user_id == User.id))
+        .outerjoin(Environment, Environment.id == GameState.environment_id)
+        .outerjoin(MapState, MapState.id == GameState.map_state_id)
+        .where(User.id == user_id)
+    )).first()
+
+    if row is None:
+        return (None, None)
+
+    user, game_state, environment, map_state = row
+
+    if game_state is None:
+        return (user, None)
+
+    query = """
+    WITH RECURSIVE message_chain AS (
+        SELECT m.*, 0 AS depth FROM messages m WHERE m.id = :last_message_id
+        UNION ALL
+        SELECT m.*, mc.depth + 1 FROM messages m
+        JOIN message_chain mc ON m.id = mc.previous_message_id
+        WHERE mc.depth + 1 < :message_limit
+    )
+    SELECT COALESCE(json_agg(json_build_object(
+        'id', id,
+        'character', character,
+        'english_text', english_text,
+        'displayed_text', displayed_text,
+        'previous_message_id', previous_message_id
+    ) ORDER BY depth), '[]'::json)
+    FROM message_chain
+    """
+    params = {
+        "last_message_id": game_state.last_message_id,
+        "message_limit": message_limit
+    }
+    messages = (await session.exec(text(query), params=params)).scalar_one()
+
+    return (user, TurnContext(
+        user=user,
+        game_state=game_state,
+        environment=environment,
+        map_state=map_state,
+        messages=tuple(Message.model_validate(message) for message in messages)
+    ))
+
+
+async def get_previous_history_summaries(
+    session: AsyncSession,
+    environment: Environment,
+    character: Character,
+    limit: int | None = None
+) -> list[str]:
+    """
+    Summaries of previous environments where the character was present, oldest first.
+    With a limit only the latest ones are returned.
+    """
+    # The recursive walk is evaluated lazily, so with a limit it stops at the last summary needed.
+    # Its rows come out one environment per step, latest first, without sorting them.
+    query = """
+    WITH RECURSIVE env_chain AS (
+        SELECT id, previous_environment_id, previous_environment_characters, previous_environment_summary
+        FROM environments WHERE id = :env_id
+        UNION ALL
+        SELECT e.id, e.previous_environment_id, e.previous_environment_characters, e.previous_environment_summary
+        FROM environments e
+        JOIN env_chain ec ON e.id = ec.previous_environment_id
+    )
+    SELECT previous_environment_summary
+    FROM env_chain
+    WHERE previous_environment_summary IS NOT NULL
+      AND previous_environment_characters IS NOT NULL
+      AND previous_environment_characters::jsonb @> jsonb_build_array(CAST(:character_value AS TEXT))
+    """
+    if limit is not None:
+        query += "LIMIT :limit"
+
+    params = {
+        "env_id": environment.id,
+        "character_value": character.value,
+        "limit": limit
+    }
+    summaries = (await session.exec(text(query), params=params)).scalars().all()
+
+    return list(reversed(summaries))
+
+
+# Branches holding the ancestors of a game state, with the deepest ancestor in each.
+# Ancestors are then read by (branch_id, depth) ranges instead of walking previous_game_state_id.
+game_state_ancestry_query = """
+WITH RECURSIVE segments AS (
+    SELECT id AS branch_id, parent_branch_id, fork_depth, CAST(:depth AS INTEGER) AS max_depth
+    FROM game_state_branches WHERE id = :branch_id
+
+    UNION ALL
+
+    SELECT b.id, b.parent_branch_id, b.fork_depth, s.fork_depth
+    FROM game_state_branches b
+    JOIN segments s ON b.id = s.parent_branch_id
+)
+"""
 
-        user.last_game_state_id = new_game_state.id
-        session.add(user)
 
-        return parse_game_to_interface(
-            environment=new_environment,
-            game_state=new_game_state,
-            map_state=new_map_state
+async def append_game_state(session: AsyncSession, previous: GameState | None, **fields) -> GameState:
+    """
+    Add a game state following the previous one (or starting a game if it is None).
+    The state continues the branch of the previous one if that is the branch head,
+    otherwise a new branch forks off after the previous state.
+    """
+    if previous is None:
+        branch = GameStateBranch(user_id=fields["user_id"], parent_branch_id=None, fork_depth=-1, head_depth=0)
+        session.add(branch)
+        await session.flush()
+
+        branch_id = branch.id
+        depth = 0
+    else:
+        depth = previous.depth + 1
+
+        # Moving the head in one statement keeps concurrent appends from sharing a depth
+        extended = await session.exec(
+            update(GameStateBranch)
+            .where(GameStateBranch.id == previous.branch_id, GameStateBranch.head_depth == previous.depth)
+            .values(head_depth=depth)
         )
-    
 
-def change_previous_game_state_links(game_state: GameState, change: int) -> None:
+        if extended.rowcount == 1:
+            branch_id = previous.branch_id
+        else:
+            # The new branch keeps the parent's states up to the fork alive
+            await session.exec(
+                update(GameStateBranch)
+                .where(GameStateBranch.id == previous.branch_id)
+                .values(links=GameStateBranch.links + 1)
+            )
+
+            branch = GameStateBranch(
+                user_id=fields["user_id"],
+                parent_branch_id=previous.branch_id,
+                fork_depth=previous.depth,
+                head_depth=depth
+            )
+            session.add(branch)
+            await session.flush()
+
+            branch_id = branch.id
+
+    game_state = GameState(
+        previous_game_state_id=previous.id if previous is not None else None,
+        branch_id=branch_id,
+        depth=depth,
+        **fields
+    )
+
+    session.add(game_state)
+    await session.flush()
+    await session.refresh(game_state)
+
+    return game_state
+
+
+async def create_new_game(session: AsyncSession, user: User) -> GameStateInterface:
+    random_locations = generate_character_locations(time=Time.DAY)
+
+    new_environment = Environment()
+    new_map_state = MapState(
+        time=Time.DAY,
+        character_location=random_locations
+    )
+
+    session.add(new_environment)
+    session.add(new_map_state)
+    await session.flush()
+
+    await session.refresh(new_environment)
+    await session.refresh(new_map_state)
+
+    new_game_state = await append_game_state(
+        session,
+        None,
+        user_id=user.id,
+        last_message_id=None,
+        environment_id=new_environment.id,
+        map_state_id=new_map_state.id
+    )
+
+    await set_user_head(session, user, new_game_state)
+
+    return parse_game_to_interface(
+        environment=new_environment,
+        game_state=new_game_state,
+        map_state=new_map_state
+    )
+
+
+async def add_game_state_reference(session: AsyncSession, game_state: GameState) -> bool:
+    """
+    Count a new save or user head on the game state's branch.
+    Returns False if the sweeper has deleted the game state meanwhile.
+    """
+    await session.exec(
+        update(GameStateBranch)
+        .where(GameStateBranch.id == game_state.branch_id)
+        .values(links=GameStateBranch.links + 1)
+    )
+
+    # The branch row is locked now, so the sweeper can not delete the state after this check
+    return (await session.exec(select(GameState.id).where(GameState.id == game_state.id))).first() is not None
+
+
+async def remove_game_state_reference(session: AsyncSession, branch_id: int) -> None:
+    """
+    Uncount a save or user head on the branch and leave the cleanup to the sweeper
+    """
+    await session.exec(
+        update(GameStateBranch)
+        .where(GameStateBranch.id == branch_id)
+        .values(links=GameStateBranch.links - 1, needs_sweep=True)
+    )
+
+
+async def set_user_head(session: AsyncSession, user: User, game_state: GameState) -> bool:
     """
-    Use a recursive CTE to find all previous GameStates (by previous_game_state_id),
-    including the given one, and change their 'links' field by the `change` amount.
+    Point the user's last game state to the given one, moving the head reference between branches.
+    Returns False if the game state has been deleted meanwhile.
     """
-    with get_session() as session:
-        # Recursive CTE to get all previous game_state ids
-        query = """
-        WITH RECURSIVE state_chain AS (
-            SELECT id, previous_game_state_id FROM game_states WHERE id = :start_id
-            UNION ALL
-            SELECT gs.id, gs.previous_game_state_id FROM game_states gs
-            JOIN state_chain sc ON gs.id = sc.previous_game_state_id
-            WHERE gs.id IS NOT NULL
+    # Locking the user row keeps concurrent requests from moving the same head.
+    # NO KEY UPDATE still lets rows referencing the user be inserted meanwhile.
+    previous = (await session.exec(
+        text("""
+        SELECT gs.branch_id, gs.depth FROM users u
+        JOIN game_states gs ON gs.id = u.last_game_state_id
+        WHERE u.id = :user_id
+        FOR NO KEY UPDATE OF u
+        """),
+        params={"user_id": user.id}
+    )).first()
+
+    if previous is None or previous.branch_id != game_state.branch_id:
+        if not await add_game_state_reference(session, game_state):
+            return False
+
+        if previous is not None:
+            await remove_game_state_reference(session, previous.branch_id)
+
+    elif game_state.depth < previous.depth:
+        # States after the new head may be unreferenced now
+        await session.exec(
+            update(GameStateBranch)
+            .where(GameStateBranch.id == game_state.branch_id)
+            .values(needs_sweep=True)
         )
-        SELECT id FROM state_chain
-        """
-        params = {"start_id": game_state.id}
-        result = session.exec(text(query), params=params)
-        state_ids = [row[0] for row in result]
-        if not state_ids:
-            return
-        # Fetch all GameState objects at once
-        states = session.exec(select(GameState).where(GameState.id.in_(state_ids))).all()
-        for state in states:
-            state.links += change
-            session.add(state)
-        
-        session.flush()
 
-def get_messages_with_game_state(game_state: GameState, offset: int, limit: int) -> list[MessageGameState]:
+    # Written explicitly: the ORM skips a value equal to the loaded one, which may be a stale cached copy
+    await session.exec(
+        update(User).where(User.id == user.id).values(last_game_state_id=game_state.id)
+    )
+    set_committed_value(user, "last_game_state_id", game_state.id)
+    invalidate_user(session, user.id)
+
+    return True
+
+
+async def get_messages_with_game_state(session: AsyncSession, game_state: GameState, offset: int, limit: int) -> list[MessageGameState]:
     """
     For the given game_state, find all game states in its chain, and for each game state,
     get its associated message if last_message_id is not null. Return a paginated
     list of MessageGameState objects. Pagination is applied to the game state chain.
     """
-    with get_session() as session:
-        # Step 1: Get a page of game state objects in the chain (pagination here)
-        query = """
-        WITH RECURSIVE game_state_chain AS (
-            SELECT * FROM game_states WHERE id = :game_state_id
-            UNION ALL
-            SELECT gs.* FROM game_states gs
-            JOIN game_state_chain gsc ON gs.id = gsc.previous_game_state_id
-            WHERE gs.id IS NOT NULL
-        )
-        SELECT * FROM game_state_chain
-        LIMIT :limit OFFSET :offset
-        """
-        params = {"game_state_id": game_state.id, "limit": limit, "offset": offset}
-        result = session.exec(text(query), params=params)
-        # Convert result to GameState objects
-        game_states = [GameState.model_validate(row) for row in result.mappings()]
-        if not game_states:
-            return []
-        
-        # Step 2: Get the message IDs that are not null
-        message_ids = [gs.last_message_id for gs in game_states if gs.last_message_id is not None]
-        if not message_ids:
-            return []
-            
-        # Step 3: Fetch all messages at once
-        messages = session.exec(
-            select(Message)
-            .where(Message.id.in_(message_ids))
-        ).all()
+    # Step 1: Get a page of game state objects in the chain (pagination here).
+    # Every depth from 0 to the given state's depth occurs once in the chain, so a page is a depth range.
+    highest_depth = game_state.depth - offset
+    if highest_depth < 0 or limit <= 0:
+        return []
 
-        session.expunge_all()
+    query = game_state_ancestry_query + """
+    SELECT gs.* FROM segments s
+    JOIN game_states gs ON gs.branch_id = s.branch_id AND gs.depth <= s.max_depth
+    WHERE gs.depth BETWEEN :lowest_depth AND :highest_depth
+    ORDER BY gs.depth DESC
+    """
+    params = {
+        "branch_id": game_state.branch_id,
+        "depth": game_state.depth,
+        "lowest_depth": highest_depth - limit + 1,
+        "highest_depth": highest_depth
+    }
+    result = await session.exec(text(query), params=params)
+    # Convert result to GameState objects
+    game_states = [GameState.model_validate(row) for row in result.mappings()]
+    if not game_states:
+        return []
         
-        # Step 4: Create a dictionary to map message IDs to messages
-        for message in messages:
-            message.character = str_to_enum(message.character, Character)
-
-        msg_dict = {msg.id: msg for msg in messages}
+    # Step 2: Get the message IDs that are not null
+    message_ids = [gs.last_message_id for gs in game_states if gs.last_message_id is not None]
+    if not message_ids:
+        return []
+            
+    # Step 3: Fetch all messages at once
+    messages = (await session.exec(
+        select(Message)
+        .where(Message.id.in_(message_ids))
+    )).all()
+
+    # Step 4: Create a dictionary to map message IDs to messages
+    for message in messages:
+        # Detached, so the converted character is not written back on commit
+        session.expunge(message)
+        message.character = str_to_enum(message.character, Character)
+
+    msg_dict = {msg.id: msg for msg in messages}
         
-        # Step 5: Build MessageGameState objects
-        result = []
-        for gs in game_states:
-            if gs.last_message_id is not None and gs.last_message_id in msg_dict:
-                result.append(MessageGameState(message=msg_dict[gs.last_message_id], game_state_id=gs.id))
+    # Step 5: Build MessageGameState objects
+    result = []
+    for gs in game_states:
+        if gs.last_message_id is not None and gs.last_message_id in msg_dict:
+            result.append(MessageGameState(message=msg_dict[gs.last_message_id], game_state_id=gs.id))
 
-        return result
+    return result
 
 
-def get_user_current_game_state(user: User) -> GameState | None:
-    with get_session() as session:
-        game_state = session.exec(
-            select(GameState).filter(GameState.id == user.last_game_state_id)
-        ).first()
+async def get_user_current_game_state(session: AsyncSession, user: User) -> GameState | None:
+    game_state = (await session.exec(
+        select(GameState).filter(GameState.id == user.last_game_state_id)
+    )).first()
         
-        if game_state is not None:
-            session.expunge(game_state)
+    return game_state
 
-        return game_state
 
-
-def truncate_user(user: User) -> None:
+async def truncate_user(session: AsyncSession, user: User) -> None:
     """Delete all database rows associated with a user except for usage data.
     
     This function deletes:
@@ -248,199 +519,200 @@ def truncate_user(user: User) -> None:
     # Store the user ID since the user object might be detached
     user_id = user.id
     
-    with get_session() as session:
-        # Get a fresh copy of the user that's attached to the session
-        session_user = session.exec(select(User).where(User.id == user_id)).first()
-        if not session_user:
-            return  # User not found in database
+    # Get a fresh copy of the user that's attached to the session
+    session_user = (await session.exec(select(User).where(User.id == user_id))).first()
+    if not session_user:
+        return  # User not found in database
             
-        # Reset user's last_game_state_id to None
-        session_user.last_game_state_id = None
-        session.add(session_user)
-        session.flush()
-
-        # Step 1: Get all GameStates for the user and collect associated IDs
-        game_states_for_user = session.exec(
-            select(GameState).where(GameState.user_id == user_id)
-        ).all()
-
-        if not game_states_for_user:
-            # If no game states, still commit the change to user.last_game_state_id
-            return
-
-                # Collect unique IDs for related entities that need explicit deletion
-        env_ids_to_delete = list(set(
-            gs.environment_id for gs in game_states_for_user if gs.environment_id is not None
-        ))
-        map_state_ids_to_delete = list(set(
-            gs.map_state_id for gs in game_states_for_user if gs.map_state_id is not None
-        ))
+    # Reset user's last_game_state_id to None
+    await session.exec(update(User).where(User.id == user_id).values(last_game_state_id=None))
+    set_committed_value(session_user, "last_game_state_id", None)
+    invalidate_user(session, user_id)
+
+    # Step 1: Get all GameStates for the user and collect associated IDs
+    game_states_for_user = (await session.exec(
+        select(GameState).where(GameState.user_id == user_id)
+    )).all()
+
+    if not game_states_for_user:
+        # If no game states, still commit the change to user.last_game_state_id
+        return
+
+            # Collect unique IDs for related entities that need explicit deletion
+    env_ids_to_delete = list(set(
+        gs.environment_id for gs in game_states_for_user if gs.environment_id is not None
+    ))
+    map_state_ids_to_delete = list(set(
+        gs.map_state_id for gs in game_states_for_user if gs.map_state_id is not None
+    ))
         
-        # Step 2: Get all message IDs directly from the game states' last_message_id.
-        # Based on user feedback, it's assumed that all messages to be deleted
-        # for this user will be present in this set. Recursive chain discovery is removed.
-        message_ids_to_delete = list(set(
-            gs.last_message_id for gs in game_states_for_user if gs.last_message_id is not None
-        ))
+    # Step 2: Get all message IDs directly from the game states' last_message_id.
+    # Based on user feedback, it's assumed that all messages to be deleted
+    # for this user will be present in this set. Recursive chain discovery is removed.
+    message_ids_to_delete = list(set(
+        gs.last_message_id for gs in game_states_for_user if gs.last_message_id is not None
+    ))
         
-        # (The recursive SQL query previously here is now removed)
+    # (The recursive SQL query previously here is now removed)
 
-        # Step 3: Delete game states
-        # This will cascade to Saves because Save.game_state_id has ON DELETE CASCADE.
-        game_states_delete_stmt = delete(GameState).where(GameState.user_id == user_id)
-        session.exec(game_states_delete_stmt)
+    # Step 3: Delete game states
+    # This will cascade to Saves because Save.game_state_id has ON DELETE CASCADE.
+    game_states_delete_stmt = delete(GameState).where(GameState.user_id == user_id)
+    await session.exec(game_states_delete_stmt)
+
+    branches_delete_stmt = delete(GameStateBranch).where(GameStateBranch.user_id == user_id)
+    await session.exec(branches_delete_stmt)
         
-        # Step 4: Delete the messages themselves
-        if message_ids_to_delete:
-            messages_delete_stmt = delete(Message).where(Message.id.in_(message_ids_to_delete))
-            session.exec(messages_delete_stmt)
+    # Step 4: Delete the messages themselves
+    if message_ids_to_delete:
+        messages_delete_stmt = delete(Message).where(Message.id.in_(message_ids_to_delete))
+        await session.exec(messages_delete_stmt)
         
-        # Step 5: Explicitly delete Environments associated with the user's game states
-        if env_ids_to_delete:
-            environments_delete_stmt = delete(Environment).where(Environment.id.in_(env_ids_to_delete))
-            session.exec(environments_delete_stmt)
+    # Step 5: Explicitly delete Environments associated with the user's game states
+    if env_ids_to_delete:
+        environments_delete_stmt = delete(Environment).where(Environment.id.in_(env_ids_to_delete))
+        await session.exec(environments_delete_stmt)
 
-        # Step 6: Explicitly delete MapStates associated with the user's game states
-        if map_state_ids_to_delete:
-            map_states_delete_stmt = delete(MapState).where(MapState.id.in_(map_state_ids_to_delete))
-            session.exec(map_states_delete_stmt)
+    # Step 6: Explicitly delete MapStates associated with the user's game states
+    if map_state_ids_to_delete:
+        map_states_delete_stmt = delete(MapState).where(MapState.id.in_(map_state_ids_to_delete))
+        await session.exec(map_states_delete_stmt)
 
 
-def delete_user(user: User) -> None:
+async def delete_user(session: AsyncSession, user: User) -> None:
     # Store the user ID since the user object might be detached
     user_id = user.id
     
-    with get_session() as session:
-        # First get a fresh copy of the user that's attached to the session
-        session_user = session.exec(select(User).where(User.id == user_id)).first()
-        if not session_user:
-            return  # User not found in database
+    # First get a fresh copy of the user that's attached to the session
+    session_user = (await session.exec(select(User).where(User.id == user_id))).first()
+    if not session_user:
+        return  # User not found in database
             
-        # First clean up all user-related data
-        truncate_user(session_user)
+    # First clean up all user-related data
+    await truncate_user(session, session_user)
         
-        # Delete user daily usage records
-        statement = delete(UserDailyUsage).where(UserDailyUsage.user_id == user_id)
-        session.exec(statement)
+    # Delete user daily usage records
+    statement = delete(UserDailyUsage).where(UserDailyUsage.user_id == user_id)
+    await session.exec(statement)
         
-        # Delete the user record itself
-        statement = delete(User).where(User.id == user_id)
-        session.exec(statement)
+    # Delete the user record itself
+    statement = delete(User).where(User.id == user_id)
+    await session.exec(statement)
+    invalidate_user(session, user_id)
 
 
-def get_previous_history_summaries(
-    environment: Environment,
-    character: Character,
-    limit: int | None = None
-) -> list[str]:
-    """Recursively fetch previous environment summaries where a specified character was present.
-    
-    Args:
-        environment: The starting environment to begin the search from
-        character: The character that must be present in the previous environments
-        limit: Optional maximum number of summaries to return
-        
-    Returns:
-        A list of environment summaries where the specified character was present
-    """
-    with get_session() as session:
-        # First, get all environment IDs in the chain where the character was present
-        # We use a recursive CTE to find all previous environments
-        query = """
-        WITH RECURSIVE env_chain AS (
-            -- Start with the given environment
-            SELECT id, previous_environment_id, previous_environment_characters, previous_environment_summary
-            FROM environments 
-            WHERE id = :env_id
-            
-            UNION ALL
-            
-            -- Join with previous environments
-            SELECT e.id, e.previous_environment_id, e.previous_environment_characters, e.previous_environment_summary
-            FROM environments e
-            JOIN env_chain ec ON e.id = ec.previous_environment_id
-            WHERE e.id IS NOT NULL
-        )
-        -- Select environments where the character was present in previous_environment_characters
-        -- and the previous environment summary is not null
-        SELECT id, previous_environment_summary 
-        FROM env_chain
-        WHERE previous_environment_summary IS NOT NULL
-          AND previous_environment_characters IS NOT NULL
-          AND previous_environment_characters::jsonb @> jsonb_build_array(:character_value)
-        """
-        
-        # Add limit if specified
-        if limit is not None:
-            query += "\nLIMIT :limit"
-            
-        # Execute the query with parameters
-        params = {
-            "env_id": environment.id,
-            "character_value": character.value,
-            "limit": limit
-        }
-        
-        result = session.exec(text(query), params=params)
-        
-        # Extract summaries from the result
-        summaries = [row[1] for row in result if row[1] is not None]
-        
-    return list(reversed(summaries))
+async def get_branches_to_sweep(session: AsyncSession, limit: int) -> list[int]:
+    return list((await session.exec(
+        select(GameStateBranch.id)
+        .where(GameStateBranch.needs_sweep == True)
+        .order_by(GameStateBranch.id)
+        .limit(limit)
+    )).all())
 
 
-def delete_previous_game_states_with_0_links(game_state: GameState) -> None:
+async def sweep_game_state_branch(session: AsyncSession, branch_id: int) -> None:
     """
-    Recursively fetch current and previous game states from the given game state 
-    and delete those that have 0 links, along with their associated messages.
-    
-    Args:
-        game_state: The starting game state to begin the recursive search from
-    """
-    with get_session() as session:
-        # Find all current and previous game states in the chain with 0 links
-        query = """
-        WITH RECURSIVE state_chain AS (
-            -- Start with the given game state
-            SELECT * FROM game_states WHERE id = :game_state_id
-            
-            UNION ALL
-            
-            -- Recursively get all previous states
-            SELECT gs.* FROM game_states gs
-            JOIN state_chain sc ON gs.id = sc.previous_game_state_id
-            WHERE gs.id IS NOT NULL
-        )
-        SELECT id, last_message_id FROM state_chain
-        WHERE links = 0
-        """
-        
-        params = {"game_state_id": game_state.id}
-        result = session.exec(text(query), params=params)
-        
-        # Get all game states with 0 links and their message IDs
-        states_to_delete = []
-        message_ids_to_delete = []
-        
-        for row in result:
-            state_id, message_id = row
-            states_to_delete.append(state_id)
-            if message_id is not None:
-                message_ids_to_delete.append(message_id)
-        
-        # Delete game states with 0 links and their direct messages
-        if states_to_delete:
-            # Delete messages
-            if message_ids_to_delete:
-                message_delete = delete(Message).where(Message.id.in_(message_ids_to_delete))
-                session.exec(message_delete)
-            
-            # Delete game states with 0 links
-            state_delete = delete(GameState).where(GameState.id.in_(states_to_delete))
-            session.exec(state_delete)
+    Delete the states of the branch after its deepest save, user head or child branch fork,
+    along with their messages. A branch without references is deleted with all its states,
+    and its parent branch is swept next.
+    """
+    # Branches used by a running request are swept on the next round
+    branch = (await session.exec(
+        select(GameStateBranch)
+        .where(GameStateBranch.id == branch_id, GameStateBranch.needs_sweep == True)
+        .with_for_update(skip_locked=True)
+    )).first()
+
+    if branch is None:
+        return
+
+    query = """
+    SELECT GREATEST(
+        (SELECT MAX(gs.depth) FROM saves s
+         JOIN game_states gs ON gs.id = s.game_state_id
+         WHERE gs.branch_id = :branch_id),
+        (SELECT MAX(gs.depth) FROM users u
+         JOIN game_states gs ON gs.id = u.last_game_state_id
+         WHERE gs.branch_id = :branch_id),
+        (SELECT MAX(fork_depth) FROM game_state_branches
+         WHERE parent_branch_id = :branch_id)
+    )
+    """
+    referenced_depth = (await session.exec(text(query), params={"branch_id": branch_id})).scalar()
+
+    if referenced_depth is None and branch.parent_branch_id is not None:
+        # Requests lock the parent before its children, so waiting for it here could deadlock
+        parent = (await session.exec(
+            select(GameStateBranch.id)
+            .where(GameStateBranch.id == branch.parent_branch_id)
+            .with_for_update(skip_locked=True)
+        )).first()
+
+        if parent is None:
+            return
 
+    if referenced_depth is None and branch.links > 0:
+        # Links are only a counter, the references decide what is kept
+        logger.warning(f"Branch {branch_id} has {branch.links} links but no references")
 
-def increase_user_daily_usage(
+    # Messages are deleted after the game states, which refer to them
+    deleted_messages = await session.exec(
+        text("""
+        DELETE FROM game_states
+        WHERE branch_id = :branch_id AND depth > :referenced_depth
+        RETURNING last_message_id
+        """),
+        params={"branch_id": branch_id, "referenced_depth": referenced_depth if referenced_depth is not None else -1}
+    )
+    message_ids = [row[0] for row in deleted_messages if row[0] is not None]
+
+    if message_ids:
+        await session.exec(delete(Message).where(Message.id.in_(message_ids)))
+
+    if referenced_depth is None:
+        if branch.parent_branch_id is not None:
+            await remove_game_state_reference(session, branch.parent_branch_id)
+
+        await session.delete(branch)
+    else:
+        branch.head_depth = min(branch.head_depth, referenced_depth)
+        branch.needs_sweep = False
+        session.add(branch)
+
+
+usage_counters = [
+    column.name for column in UserDailyUsage.__table__.columns
+    if column.name not in ("id", "user_id", "date")
+]
+
+
+async def add_user_daily_usage(session: AsyncSession, deltas: dict[tuple[int, datetime], dict[str, int]]) -> None:
+    """
+    Add usage counters keyed by (user_id, day) with one INSERT ... ON CONFLICT DO UPDATE.
+    Concurrent writers only add to the counters, so no increment is lost.
+    """
+    if not deltas:
+        return
+
+    rows = [
+        {"user_id": user_id, "date": date, **{counter: delta.get(counter, 0) for counter in usage_counters}}
+        for (user_id, date), delta in deltas.items()
+    ]
+
+    statement = pg_insert(UserDailyUsage).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[UserDailyUsage.user_id, UserDailyUsage.date],
+        set_={
+            counter: getattr(UserDailyUsage, counter) + getattr(statement.excluded, counter)
+            for counter in usage_counters
+        }
+    )
+
+    await session.exec(statement)
+
+
+async def increase_user_daily_usage(
+    session: AsyncSession,
     user: User, 
 
     interaction_input_tokens: int = 0, 
@@ -466,67 +738,100 @@ def increase_user_daily_usage(
     premium_summarization_input_tokens: int = 0,
     premium_summarization_output_tokens: int = 0,
     premium_summarization_queries: int = 0,
+
+    translation_cache_hits: int = 0,
+    translation_cache_misses: int = 0,
+    translation_cache_saved_tokens: int = 0,
 ) -> None:
-    with get_session() as session:
-        # Get today's date in UTC
-        today = datetime.now(UTC).replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # Try to find an existing usage record for today
-        daily_usage = session.exec(
-            select(UserDailyUsage)
-            .where(UserDailyUsage.user_id == user.id)
-            .where(UserDailyUsage.date == today)
-        ).first()
-        
-        if daily_usage is None:
-            # Create a new record if none exists for today
-            daily_usage = UserDailyUsage(
-                user_id=user.id,
-                date=today,
-                interaction_input_tokens=interaction_input_tokens,
-                interaction_output_tokens=interaction_output_tokens,
-                interaction_queries=interaction_queries,
-                translation_input_tokens=translation_input_tokens,
-                translation_output_tokens=translation_output_tokens,
-                translation_queries=translation_queries,
-                summarization_input_tokens=summarization_input_tokens,
-                summarization_output_tokens=summarization_output_tokens,
-                summarization_queries=summarization_queries,
-                premium_interaction_input_tokens=premium_interaction_input_tokens,
-                premium_interaction_output_tokens=premium_interaction_output_tokens,
-                premium_interaction_queries=premium_interaction_queries,
-                premium_translation_input_tokens=premium_translation_input_tokens,
-                premium_translation_output_tokens=premium_translation_output_tokens,
-                premium_translation_queries=premium_translation_queries,
-                premium_summarization_input_tokens=premium_summarization_input_tokens,
-                premium_summarization_output_tokens=premium_summarization_output_tokens,
-                premium_summarization_queries=premium_summarization_queries
-            )
-        else:
-            # Update existing record
-            daily_usage.interaction_input_tokens += interaction_input_tokens
-            daily_usage.interaction_output_tokens += interaction_output_tokens
-            daily_usage.interaction_queries += interaction_queries
-            daily_usage.translation_input_tokens += translation_input_tokens
-            daily_usage.translation_output_tokens += translation_output_tokens
-            daily_usage.translation_queries += translation_queries
-            daily_usage.summarization_input_tokens += summarization_input_tokens
-            daily_usage.summarization_output_tokens += summarization_output_tokens
-            daily_usage.summarization_queries += summarization_queries
-            daily_usage.premium_interaction_input_tokens += premium_interaction_input_tokens
-            daily_usage.premium_interaction_output_tokens += premium_interaction_output_tokens
-            daily_usage.premium_interaction_queries += premium_interaction_queries
-            daily_usage.premium_translation_input_tokens += premium_translation_input_tokens
-            daily_usage.premium_translation_output_tokens += premium_translation_output_tokens
-            daily_usage.premium_translation_queries += premium_translation_queries
-            daily_usage.premium_summarization_input_tokens += premium_summarization_input_tokens
-            daily_usage.premium_summarization_output_tokens += premium_summarization_output_tokens
-            daily_usage.premium_summarization_queries += premium_summarization_queries
-        # Save the record
-        session.add(daily_usage)
-
-
-def check_user_premium_status(user: User) -> bool:
+    """
+    Add the counters to today's usage of the user in a single atomic statement
+    """
+    today = datetime.now(UTC).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+    await add_user_daily_usage(session, {
+        (user.id, today): {
+            "interaction_input_tokens": interaction_input_tokens,
+            "interaction_output_tokens": interaction_output_tokens,
+            "interaction_queries": interaction_queries,
+            "translation_input_tokens": translation_input_tokens,
+            "translation_output_tokens": translation_output_tokens,
+            "translation_queries": translation_queries,
+            "summarization_input_tokens": summarization_input_tokens,
+            "summarization_output_tokens": summarization_output_tokens,
+            "summarization_queries": summarization_queries,
+            "premium_interaction_input_tokens": premium_interaction_input_tokens,
+            "premium_interaction_output_tokens": premium_interaction_output_tokens,
+            "premium_interaction_queries": premium_interaction_queries,
+            "premium_translation_input_tokens": premium_translation_input_tokens,
+            "premium_translation_output_tokens": premium_translation_output_tokens,
+            "premium_translation_queries": premium_translation_queries,
+            "premium_summarization_input_tokens": premium_summarization_input_tokens,
+            "premium_summarization_output_tokens": premium_summarization_output_tokens,
+            "premium_summarization_queries": premium_summarization_queries,
+            "translation_cache_hits": translation_cache_hits,
+            "translation_cache_misses": translation_cache_misses,
+            "translation_cache_saved_tokens": translation_cache_saved_tokens
+        }
+    })
+
+
+async def get_cached_translation(session: AsyncSession, key: str, ttl: timedelta) -> TranslationCacheEntry | None:
+    entry = (await session.exec(
+        select(TranslationCacheEntry)
+        .where(TranslationCacheEntry.key == key)
+        .where(TranslationCacheEntry.created_at >= datetime.now(UTC).replace(tzinfo=None) - ttl)
+    )).first()
+
+    if entry is not None:
+        session.expunge(entry)
+
+    return entry
+
+
+async def save_cached_translation(session: AsyncSession, entry: TranslationCacheEntry) -> None:
+    """
+    Store the translation, replacing an expired entry with the same key
+    """
+    statement = pg_insert(TranslationCacheEntry).values(
+        key=entry.key,
+        translation=entry.translation,
+        input_tokens=entry.input_tokens,
+        output_tokens=entry.output_tokens,
+        created_at=entry.created_at
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[TranslationCacheEntry.key],
+        set_={
+            "translation": statement.excluded.translation,
+            "input_tokens": statement.excluded.input_tokens,
+            "output_tokens": statement.excluded.output_tokens,
+            "created_at": statement.excluded.created_at
+        }
+    )
+    await session.exec(statement)
+
+
+async def evict_translation_cache(session: AsyncSession, ttl: timedelta, max_rows: int) -> None:
+    """
+    Delete expired entries and the oldest ones above max_rows
+    """
+    await session.exec(
+        delete(TranslationCacheEntry)
+        .where(TranslationCacheEntry.created_at < datetime.now(UTC).replace(tzinfo=None) - ttl)
+    )
+
+    query = """
+    DELETE FROM translation_cache
+    WHERE id IN (
+        SELECT id FROM translation_cache
+        ORDER BY created_at DESC
+        OFFSET :max_rows
+    )
+    """
+    await session.exec(text(query), params={"max_rows": max_rows})
+
+
+async def check_user_premium_status(session: AsyncSession, user: User) -> bool:
     if (
         user.subscription_tier == SubscriptionTier.PREMIUM and 
         user.subscription_ends_at is not None and 
@@ -535,14 +840,12 @@ def check_user_premium_status(user: User) -> bool:
         return True
     
     if user.subscription_tier == SubscriptionTier.PREMIUM:
-        with get_session() as session:
-            user.subscription_tier = SubscriptionTier.FREE
-            user.subscription_ends_at = None
-            user.subscription_started_at = None
-
-            session.add(user)
-            session.flush()
-            session.refresh(user)
-            session.expunge_all()
+        user.subscription_tier = SubscriptionTier.FREE
+        user.subscription_ends_at = None
+        user.subscription_started_at = None
+
+        session.add(user)
+        await session.flush()
+        invalidate_user(session, user.id)
 
     return False
\ No newline at end of file
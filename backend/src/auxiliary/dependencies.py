@@ -1,37 +1,48 @@
-from fastapi import Depends
+from fastapi import Depends, Header
 from typing import Optional
-import jwt
-from src.auxiliary.config import oauth2_scheme, SECRET_KEY, ALGORITHM
-from src.db import get_session
+import hmac
+from src.auxiliary.config import oauth2_scheme, metrics_token
+from src.auxiliary.user_cache import user_cache
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.db import get_db_session
 from src.schemas.database import User
 from sqlmodel import select
 from fastapi import HTTPException
 
+# Dependency to allow only the scraper with the metrics token
+def verify_metrics_token(authorization: Optional[str] = Header(default=None)) -> None:
+    if metrics_token is None:
+        raise HTTPException(404)
+
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), metrics_token.encode()):
+        raise HTTPException(401)
+
 # Dependency to get current user ID from JWT token
 def get_current_user_id(token: Optional[str] = Depends(oauth2_scheme)) -> int | None:
     if token is None:
         return None
 
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    user_id_str = payload.get("sub")
-    user_id = int(user_id_str)
-
-    return user_id
+    return user_cache.decode_token(token)
 
-def get_current_user(
-    user_id: int | None = Depends(get_current_user_id)
+async def get_current_user(
+    user_id: int | None = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_db_session)
 ) -> User:
-    with get_session() as session:
-        user = None
+    if user_id is None:
+        raise HTTPException(401)
+
+    # The cached copy is merged without a query, so it can be changed and saved in the session
+    user = user_cache.get(user_id)
+    if user is not None:
+        return await session.merge(user, load=False)
+
+    user = (await session.exec(select(User).filter(User.id == user_id))).first()
 
-        if user_id is not None:
-            user = session.exec(select(User).filter(User.id == user_id)).first()
+    if user is None:
+        raise HTTPException(401)
 
-        if user is None:
-            raise HTTPException(401)
-        # If we found a user, make sure all attributes are loaded before the session closes
-        if user is not None:
-            # Expunge the object from the session so it can be used after the session is closed
-            session.expunge(user)
+    session.expunge(user)
+    user_cache.put(user)
 
-        return user
\ No newline at end of file
+    return await session.merge(user, load=False)
\ No newline at end of file
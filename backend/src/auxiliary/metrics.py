@@ -0,0 +1,60 @@
+import threading
+from collections import defaultdict
+
+default_buckets = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class Metrics:
+    """
+    In-process counters, gauges and histograms of a single worker
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        self._histograms: dict[str, dict] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = default_buckets) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = {
+                    "buckets": {bucket: 0 for bucket in buckets},
+                    "count": 0,
+                    "sum": 0
+                }
+                self._histograms[name] = histogram
+
+            for bucket in histogram["buckets"]:
+                if value <= bucket:
+                    histogram["buckets"][bucket] += 1
+
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {
+                    name: {
+                        "buckets": {str(bucket): count for bucket, count in histogram["buckets"].items()},
+                        "count": histogram["count"],
+                        "sum": histogram["sum"]
+                    }
+                    for name, histogram in self._histograms.items()
+                }
+            }
+
+
+metrics = Metrics()
@@ -1,4 +1,9 @@
+import json
+import logging
+import os
 import random
+from contextvars import ContextVar
+from dataclasses import dataclass
 from src.schemas.states.other import CharacterLocation
 from src.schemas.states.locations import Location
 from src.schemas.states.characters import Character, CharacterSprite
@@ -7,15 +12,20 @@ from src.schemas.states.entities.ulyana import UlyanaClothes, UlyanaFacialExpres
 from src.schemas.states.entities.alice import AliceClothes, AliceFacialExpression, AlicePose
 from src.schemas.database import Environment, GameState, MapState, Message
 from src.schemas.api.game_state import GameStateInterface
-from src.schemas.states.music import music_urls
+from src.schemas.states.music import (
+    BandwidthClass, Music, music_bitrates, music_intro_path, music_urls, music_variant_path
+)
 from src.schemas.api.game_state import CharacterSpriteURLS, MessageGameState
-from src.auxiliary.config import static_url_root
+from src.auxiliary.config import static_url_root, static_manifest_path
 from src.schemas.api.game_state import CharacterMapLocation
 from src.schemas.states.entities.base import Clothes, FacialExpression, Pose
 from src.schemas.states.entities.miku import MikuFacialExpression, MikuPose, MikuClothes
 from src.schemas.states.entities.slavya import SlavyaClothes, SlavyaFacialExpression, SlavyaPose
 from src.schemas.states.entities.lena import LenaClothes, LenaFacialExpression, LenaPose
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 next_time_dictionary: dict[Time, Time] = {
     Time.DAY: Time.SUNSET,
     Time.SUNSET: Time.NIGHT,
@@ -391,13 +401,13 @@ valid_character_expressions: dict[Pose, tuple[FacialExpression]] = {
     UlyanaPose.ULYANA_CONFUSED: (UlyanaFacialExpression.ULYANA_SURPRISE2, UlyanaFacialExpression.ULYANA_SHY2, UlyanaFacialExpression.ULYANA_CRY, UlyanaFacialExpression.ULYANA_SHY, UlyanaFacialExpression.ULYANA_SURPRISE, UlyanaFacialExpression.ULYANA_SURPRISE3, UlyanaFacialExpression.ULYANA_CRY2),
     UlyanaPose.ULYANA_ANGRY: (UlyanaFacialExpression.ULYANA_FRUSTRATED, UlyanaFacialExpression.ULYANA_FROWNING, UlyanaFacialExpression.ULYANA_FEAR, UlyanaFacialExpression.ULYANA_UPSET),
 
-    AlicePose.ALICE_NORMAL: (AliceFacialExpression.ALICE_NORMAL, AliceFacialExpression.ALICE_LAUGH),
-    AlicePose.ALICE_CONSTRAINED: (AliceFacialExpression.ALICE_SAD, AliceFacialExpression.ALICE_SHY, AliceFacialExpression.ALICE_GUILTY, AliceFacialExpression.ALICE_SMILE),
+    AlicePose.ALICE_NORMAL: (AliceFacialExpression.ALICE_NORMAL, AliceFacialExpression.ALICE_LAUGH, AliceFacialExpression.ALICE_SMILE),
+    AlicePose.ALICE_CONSTRAINED: (AliceFacialExpression.ALICE_SAD, AliceFacialExpression.ALICE_SHY, AliceFacialExpression.ALICE_GUILTY),
     AlicePose.ALICE_ANGRY: (AliceFacialExpression.ALICE_ANGRY, AliceFacialExpression.ALICE_RAGE),
     AlicePose.ALICE_CONFUSED: (AliceFacialExpression.ALICE_CRY, AliceFacialExpression.ALICE_SCARED, AliceFacialExpression.ALICE_SHOCKED, AliceFacialExpression.ALICE_SURPRISED),
     AlicePose.ALICE_GRIN: (AliceFacialExpression.ALICE_GRIN,),
 
-    MikuPose.MIKU_NORMAL: (MikuFacialExpression.MIKU_NORMAL, MikuFacialExpression.MIKU_CRY, MikuFacialExpression.MIKU_FROWNING, MikuFacialExpression.MIKU_LAUGH, MikuFacialExpression.MIKU_SCARED, MikuFacialExpression.MIKU_SHOCKED, MikuFacialExpression.MIKU_SHY, MikuFacialExpression.MIKU_SURPRISED),
+    MikuPose.MIKU_NORMAL: (MikuFacialExpression.MIKU_CRY, MikuFacialExpression.MIKU_FROWNING, MikuFacialExpression.MIKU_LAUGH, MikuFacialExpression.MIKU_SCARED, MikuFacialExpression.MIKU_SHOCKED, MikuFacialExpression.MIKU_SHY, MikuFacialExpression.MIKU_SURPRISED),
     MikuPose.MIKU_LOVELY: (MikuFacialExpression.MIKU_CRY_SMILE, MikuFacialExpression.MIKU_GRIN, MikuFacialExpression.MIKU_HAPPY, MikuFacialExpression.MIKU_SAD, MikuFacialExpression.MIKU_SMILE),
     MikuPose.MIKU_SERIOUS: (MikuFacialExpression.MIKU_ANGRY, MikuFacialExpression.MIKU_NORMAL, MikuFacialExpression.MIKU_RAGE, MikuFacialExpression.MIKU_SERIOUS, MikuFacialExpression.MIKU_UPSET),
 
@@ -435,44 +445,270 @@ default_character_view: dict[Clothes, tuple[Pose, FacialExpression]] = {
     LenaClothes.LENA_UNIFORM: (LenaPose.LENA_NORMAL, LenaFacialExpression.LENA_NORMAL),
 }
 
+# Widths of the composited sprites built by build_sprites.py, the first one is the full size
+composite_widths: tuple[int, ...] = (675, 450, 300)
+composite_formats: tuple[str, ...] = ("webp", "avif")
+
+
+def sprite_combinations() -> set[tuple[Pose, Clothes, FacialExpression]]:
+    """
+    Every sprite the game can show: characters keep the clothes of the time of day,
+    and take any valid pose and facial expression, or the default view of their clothes
+    """
+    combinations = {
+        (pose, clothes, facial_expression)
+        for clothes, (pose, facial_expression) in default_character_view.items()
+    }
+
+    for character, poses in valid_character_poses.items():
+        character_clothes = {clothes[character] for clothes in character_time_clothe.values()}
+        combinations |= {
+            (pose, clothes, facial_expression)
+            for pose in poses
+            for facial_expression in valid_character_expressions.get(pose, ())
+            for clothes in character_clothes
+        }
+
+    return combinations
+
+
+def composite_path(pose: Pose, clothes: Clothes, facial_expression: FacialExpression, width: int, image_format: str) -> str:
+    return f"composites/{pose.value}/{clothes.value}/{facial_expression.value}.{width}.{image_format}"
+
+
+@dataclass(frozen=True)
+class AssetManifest:
+    """
+    Final URLs of every asset combination, compiled from the tables above at startup.
+    Keys are enum values, as they are stored in the database.
+    """
+    # (pose, clothes, facial expression)
+    sprites: dict[tuple[str, str, str], CharacterSpriteURLS]
+    # (time, location)
+    backgrounds: dict[tuple[str, str], str]
+    # (music, bandwidth class)
+    music: dict[tuple[str, str], tuple[str, ...]]
+    # Intro segments in the order of the tracks, empty if they are not built
+    music_intros: dict[str, tuple[str, ...]]
+    heads: dict[str, str]
+    # Background shown after the map is changed at the time
+    next_backgrounds: dict[str, str]
+    # Sprites of the facial expressions the classifier may choose for the (pose, clothes)
+    expressions: dict[tuple[str, str], tuple[CharacterSpriteURLS, ...]]
+
+
+def load_static_manifest(path: str = static_manifest_path) -> dict[str, str]:
+    if not os.path.exists(path):
+        logger.info(f"No static manifest at {path}, assets are referenced by their source paths")
+        return {}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def compile_asset_manifest(url_root: str = static_url_root, static_manifest: dict[str, str] | None = None) -> AssetManifest:
+    """
+    Resolve all URLs once, through the fingerprinted names of the static manifest if there is one.
+    Composited sprites and music variants are used if the static manifest has them.
+    Raises ValueError listing every combination the game can produce, but which has no asset,
+    and every asset missing from the static manifest.
+    """
+    static_manifest = load_static_manifest() if static_manifest is None else static_manifest
+    asset_paths = {
+        path
+        for urls in (
+            pose_to_url, character_to_head_url,
+            *time_location_to_url.values(), *facial_expression_to_url.values(), *pose_clothes_to_url.values()
+        )
+        for path in urls.values()
+    } | {path for urls in music_urls.values() for path in urls}
+
+    combinations = sprite_combinations()
+    has_composites = any(path.startswith("composites/") for path in static_manifest)
+    if has_composites:
+        asset_paths |= {
+            composite_path(*combination, width, image_format)
+            for combination in combinations
+            for width in composite_widths
+            for image_format in composite_formats
+        }
+
+    music_paths = [path for paths in music_urls.values() for path in paths]
+    has_music_variants = any(path.startswith("music_variants/") for path in static_manifest)
+    if has_music_variants:
+        asset_paths |= {music_intro_path(path) for path in music_paths}
+        asset_paths |= {music_variant_path(path, bitrate) for path in music_paths for bitrate in music_bitrates.values()}
+
+    missing = [f"fingerprint of {path}" for path in sorted(asset_paths) if static_manifest and path not in static_manifest]
+
+    def url(path: str) -> str:
+        return url_root + static_manifest.get(path, path)
+
+    def srcset(pose: Pose, clothes: Clothes, facial_expression: FacialExpression, image_format: str) -> str:
+        return ", ".join(
+            f"{url(composite_path(pose, clothes, facial_expression, width, image_format))} {width}w"
+            for width in composite_widths
+        )
+
+    def composite(pose: Pose, clothes: Clothes, facial_expression: FacialExpression) -> dict:
+        if not has_composites or (pose, clothes, facial_expression) not in combinations:
+            return {}
+
+        return {
+            "composite_url": url(composite_path(pose, clothes, facial_expression, composite_widths[0], composite_formats[0])),
+            "composite_srcset": srcset(pose, clothes, facial_expression, "webp"),
+            "composite_avif_srcset": srcset(pose, clothes, facial_expression, "avif")
+        }
+
+    sprites = {
+        (pose.value, clothes.value, facial_expression.value): CharacterSpriteURLS(
+            pose_url=url(pose_to_url[pose]),
+            clothes_url=url(clothes_url),
+            facial_expression_url=url(facial_expression_url),
+            **composite(pose, clothes, facial_expression)
+        )
+        for pose, clothes_urls in pose_clothes_to_url.items()
+        for clothes, clothes_url in clothes_urls.items()
+        for facial_expression, facial_expression_url in facial_expression_to_url.get(pose, {}).items()
+        if pose in pose_to_url
+    }
+
+    backgrounds = {
+        (time.value, location.value): url(path)
+        for time, location_urls in time_location_to_url.items()
+        for location, path in location_urls.items()
+    }
+
+    missing += [
+        f"sprite {pose.value}, {clothes.value}, {facial_expression.value}"
+        for pose, clothes, facial_expression in sorted(combinations)
+        if (pose.value, clothes.value, facial_expression.value) not in sprites
+    ]
+    missing += [
+        f"background {time.value}, {location.value}"
+        for time in Time for location in Location
+        if (time.value, location.value) not in backgrounds
+    ]
+    missing += [f"music {music.value}" for music in music_urls.keys() ^ set(Music)]
+    missing += [f"head {character.value}" for character in Character if character not in character_to_head_url]
+
+    if missing:
+        raise ValueError("Assets are missing for: " + "; ".join(missing))
+
+    def music_variant(path: str, bandwidth_class: BandwidthClass) -> str:
+        if not has_music_variants or bandwidth_class not in music_bitrates:
+            return url(path)
+
+        return url(music_variant_path(path, music_bitrates[bandwidth_class]))
+
+    expressions = {}
+    for pose, clothes, facial_expression in sorted(combinations):
+        sprite = sprites[(pose.value, clothes.value, facial_expression.value)]
+        expressions.setdefault((pose.value, clothes.value), []).append(sprite)
+
+    return AssetManifest(
+        sprites=sprites,
+        backgrounds=backgrounds,
+        music={
+            (music.value, bandwidth_class.value): tuple(music_variant(path, bandwidth_class) for path in paths)
+            for music, paths in music_urls.items()
+            for bandwidth_class in BandwidthClass
+        },
+        music_intros={
+            music.value: tuple(url(music_intro_path(path)) for path in paths) if has_music_variants else ()
+            for music, paths in music_urls.items()
+        },
+        heads={character.value: url(path) for character, path in character_to_head_url.items()},
+        next_backgrounds={
+            time.value: backgrounds[(next_time.value, Location.MAIN_CHARACTER_HOME.value)]
+            for time, next_time in next_time_dictionary.items()
+        },
+        expressions={key: tuple(sprites) for key, sprites in expressions.items()}
+    )
+
+
+asset_manifest = compile_asset_manifest()
+
+# Bandwidth class of the client of the current request, set by the middleware in main.py
+bandwidth_class: ContextVar[BandwidthClass] = ContextVar("bandwidth_class", default=BandwidthClass.HIGH)
+
+
+def parse_bandwidth_class(value: str | None, save_data: str | None = None) -> BandwidthClass:
+    """
+    Class of the X-Bandwidth-Class header, clients asking to save data get the low one.
+    Unknown or missing values fall back to high, the original tracks.
+    """
+    if save_data is not None and save_data.strip().lower() == "on":
+        return BandwidthClass.LOW
+
+    try:
+        return BandwidthClass((value or "").strip().lower())
+    except ValueError:
+        return BandwidthClass.HIGH
+
+
+def get_sprite_urls(sprite: dict) -> CharacterSpriteURLS:
+    urls = asset_manifest.sprites.get((sprite['pose'], sprite['clothes'], sprite['facial_expression']))
+    if urls is not None:
+        return urls
+
+    # Sprites stored before a combination was removed are shown in the default view of their clothes
+    logger.warning(f"No assets for sprite {sprite}, using the default view")
+    pose, facial_expression = default_character_view[sprite['clothes']]
+    return asset_manifest.sprites[(pose.value, sprite['clothes'], facial_expression.value)]
+
+
+def get_prefetch_urls(game_state: GameState, map_state: MapState) -> list[str]:
+    """
+    The background after the map is changed and the other facial expression layers of the present characters.
+    Composited expressions are in get_prefetch_sprites instead.
+    """
+    urls = [asset_manifest.next_backgrounds[map_state.time]]
+    for sprite in game_state.characters:
+        urls.extend(
+            expression.facial_expression_url
+            for expression in asset_manifest.expressions.get((sprite['pose'], sprite['clothes']), ())
+            if expression.composite_url is None
+        )
+
+    return list(dict.fromkeys(urls))
+
+
+def get_prefetch_sprites(game_state: GameState) -> list[CharacterSpriteURLS]:
+    """
+    Composited sprites of the other facial expressions of the present characters.
+    Their width and format are picked by the client like for the shown sprites, so they are not sent as URLs.
+    """
+    sprites = {}
+    for sprite in game_state.characters:
+        for expression in asset_manifest.expressions.get((sprite['pose'], sprite['clothes']), ()):
+            if expression.composite_url is not None:
+                sprites[expression.composite_url] = expression
+
+    return list(sprites.values())
+
+
 def parse_game_to_interface(
     environment: Environment, 
     game_state: GameState,
     map_state: MapState,
     message: Message | None = None
 ) -> GameStateInterface:
-    music_urls_api = music_urls[game_state.music]
-    music_urls_api = [static_url_root + music_url for music_url in music_urls_api]
-
-    background_url = static_url_root + time_location_to_url.get(map_state.time, None).get(environment.location, None)
-    
-    character_sprites = []
-
-    for character in game_state.characters:
-        pose = static_url_root + pose_to_url.get(character['pose'], None)
-        clothes = static_url_root + pose_clothes_to_url.get(character['pose'], None).get(character['clothes'], None)
-        facial_expression = static_url_root + facial_expression_to_url.get(character['pose'], None).get(character['facial_expression'], None)
-
-        character_sprites.append(CharacterSpriteURLS(
-            pose_url=pose,
-            clothes_url=clothes,
-            facial_expression_url=facial_expression
-        ))
-
     interface = GameStateInterface(
         id=game_state.id,
-        characters=character_sprites,
-        background_url=background_url,
+        characters=[get_sprite_urls(character) for character in game_state.characters],
+        background_url=asset_manifest.backgrounds[(map_state.time, environment.location)],
         message=MessageGameState(
             message=message,
             game_state_id=game_state.id
-        ).model_dump() if message else None,
-        followers_head_urls=[
-            static_url_root + character_to_head_url.get(character, None) for character in game_state.followers
-        ],
+        ) if message else None,
+        followers_head_urls=[asset_manifest.heads[character] for character in game_state.followers],
         time=map_state.time,
-        music_urls=music_urls_api,
-        music_type=game_state.music
+        music_urls=list(asset_manifest.music[(game_state.music, bandwidth_class.get().value)]),
+        music_intro_urls=list(asset_manifest.music_intros[game_state.music]),
+        music_type=game_state.music,
+        prefetch_urls=get_prefetch_urls(game_state, map_state),
+        prefetch_sprites=get_prefetch_sprites(game_state)
     )
 
     return interface
@@ -485,7 +721,7 @@ def parse_map_state_to_character_locations(map_state: MapState) -> list[Characte
             CharacterMapLocation(
                 location=character_location['location'],
                 character=character_location['character'],
-                character_head_url=static_url_root + character_to_head_url.get(character_location['character'], None)
+                character_head_url=asset_manifest.heads[character_location['character']]
             )
         )
 
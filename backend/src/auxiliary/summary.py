@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.db import get_async_session
+from src.schemas.database import Environment, GameState, Message, User
+from src.auxiliary.database import get_messages_since, update_running_summary
+from src.auxiliary.metrics import metrics
+from src.auxiliary.usage import record_daily_usage
+from src.llm.interaction import get_summary_of_messages
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Messages not yet in the running summary of an environment, which start a fold.
+# Must not exceed the messages loaded for a turn, which are counted.
+summary_fold_messages = int(os.getenv("SUMMARY_FOLD_MESSAGES", "10"))
+
+# Environments folded by this worker, so a turn does not start a second fold while one runs
+folding_environments: set[int] = set()
+running_folds: set[asyncio.Task] = set()
+
+
+async def record_summary_usage(user: User, session: AsyncSession | None, use_premium: bool, input_tokens: int, output_tokens: int) -> None:
+    if use_premium:
+        await record_daily_usage(
+            user=user,
+            session=session,
+            premium_summarization_input_tokens=input_tokens,
+            premium_summarization_output_tokens=output_tokens,
+            premium_summarization_queries=1
+        )
+    else:
+        await record_daily_usage(
+            user=user,
+            session=session,
+            summarization_input_tokens=input_tokens,
+            summarization_output_tokens=output_tokens,
+            summarization_queries=1
+        )
+
+
+def schedule_summary_fold(session: AsyncSession, environment: Environment, messages: list[Message], user: User, use_premium: bool) -> None:
+    """
+    Fold the messages of a turn into the running summary of the environment once they are committed,
+    if enough of them are not summarized. Messages are the latest first, with the ones of the turn.
+    """
+    message_ids = [message.id for message in messages]
+
+    if environment.running_summary_message_id in message_ids:
+        unsummarized = message_ids.index(environment.running_summary_message_id)
+    else:
+        # Not summarized yet, not folded for longer than the messages go back,
+        # or summarized on another branch of the environment, which the fold replaces
+        unsummarized = len(message_ids)
+
+    if unsummarized < summary_fold_messages:
+        return
+
+    session.info.setdefault("summary_folds", {})[environment.id] = (message_ids[0], user, use_premium)
+
+
+@event.listens_for(Session, "after_commit")
+def start_summary_folds(session: Session) -> None:
+    for environment_id, (message_id, user, use_premium) in session.info.pop("summary_folds", {}).items():
+        if environment_id in folding_environments:
+            continue
+
+        folding_environments.add(environment_id)
+        fold = asyncio.get_running_loop().create_task(fold_summary(environment_id, message_id, user, use_premium))
+        running_folds.add(fold)
+        fold.add_done_callback(running_folds.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_summary_folds(session: Session) -> None:
+    session.info.pop("summary_folds", None)
+
+
+async def fold_summary(environment_id: int, last_message_id: int, user: User, use_premium: bool) -> None:
+    """
+    Fold the messages up to last_message_id into the running summary of the environment.
+    If the summary is of another branch, the whole chain is summarized instead.
+    """
+    try:
+        async with get_async_session("summary_fold") as session:
+            environment = await session.get(Environment, environment_id)
+            previous_message_id = environment.running_summary_message_id
+            messages, reached = await get_messages_since(session, last_message_id, previous_message_id)
+
+            # Another worker may have folded them already
+            if len(messages) < summary_fold_messages:
+                return
+
+            # The connection returns to the pool during the summarization
+            await session.commit()
+
+            summary, input_tokens, output_tokens = await get_summary_of_messages(
+                messages=messages,
+                use_premium=use_premium,
+                # Without it the summary of another branch is replaced by one of the whole chain
+                previous_summary=environment.running_summary if reached and previous_message_id is not None else None
+            )
+            await record_summary_usage(user, session, use_premium, input_tokens, output_tokens)
+
+            updated = await update_running_summary(session, environment_id, previous_message_id, summary, messages[-1].id)
+
+        metrics.increment("summary_folds" if updated else "summary_folds_discarded")
+    except Exception:
+        logger.exception(f"Failed to fold the summary of environment {environment_id}")
+    finally:
+        folding_environments.discard(environment_id)
+
+
+async def summarize_environment(
+    session: AsyncSession,
+    user: User,
+    game_state: GameState,
+    environment: Environment,
+    use_premium: bool
+) -> str | None:
+    """
+    Summary of the environment the game state leaves, None if nothing happened with characters in it.
+    Only the messages after the running summary are summarized, folded into it.
+    Commits the session before the summarization.
+    """
+    if game_state.last_message_id is None or not game_state.characters:
+        return None
+
+    previous_message_id = environment.running_summary_message_id
+    previous_summary = environment.running_summary if previous_message_id is not None else None
+    messages, reached = await get_messages_since(session, game_state.last_message_id, previous_message_id)
+
+    if not reached:
+        # The running summary was folded on another branch of the environment
+        previous_summary = None
+
+    metrics.observe("summary_messages_on_leave", len(messages))
+
+    if not messages:
+        return previous_summary
+
+    # The connection returns to the pool during the summarization
+    await session.commit()
+
+    summary, input_tokens, output_tokens = await get_summary_of_messages(
+        messages=messages,
+        use_premium=use_premium,
+        previous_summary=previous_summary
+    )
+    await record_summary_usage(user, session, use_premium, input_tokens, output_tokens)
+
+    return summary
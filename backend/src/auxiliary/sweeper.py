@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import os
+from src.auxiliary.database import get_branches_to_sweep, sweep_game_state_branch
+from src.auxiliary.metrics import metrics
+from src.db import get_async_session
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+sweep_interval = float(os.getenv("GAME_STATE_SWEEP_INTERVAL", "60"))
+sweep_batch_size = int(os.getenv("GAME_STATE_SWEEP_BATCH_SIZE", "100"))
+
+
+async def sweep_game_states(batch_size: int = sweep_batch_size) -> int:
+    """
+    Sweep one batch of branches whose references were removed.
+    Every worker runs a sweeper, locked branches are skipped.
+    """
+    async with get_async_session("sweeper") as session:
+        branch_ids = await get_branches_to_sweep(session, batch_size)
+
+    # A transaction per branch, so a failed branch does not roll back the others
+    for branch_id in branch_ids:
+        try:
+            async with get_async_session("sweeper") as session:
+                await sweep_game_state_branch(session, branch_id)
+        except Exception:
+            logger.exception(f"Failed to sweep branch {branch_id}")
+
+    metrics.increment("game_state_branches_swept", len(branch_ids))
+    return len(branch_ids)
+
+
+async def run_sweeper(interval: float = sweep_interval) -> None:
+    while True:
+        try:
+            await sweep_game_states()
+        except Exception:
+            logger.exception("Game state sweep failed")
+
+        await asyncio.sleep(interval)
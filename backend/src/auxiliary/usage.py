@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, UTC
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.db import get_async_session
+from src.schemas.database import User
+from src.auxiliary.database import add_user_daily_usage, increase_user_daily_usage
+from src.auxiliary.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 0 writes every usage change right away
+usage_flush_interval = float(os.getenv("USAGE_FLUSH_INTERVAL", "0"))
+
+
+class UsageBuffer:
+    """
+    Aggregates usage counters of a worker in memory until they are flushed in one statement
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas: dict[tuple[int, datetime], dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, user_id: int, date: datetime, counters: dict[str, int]) -> None:
+        with self._lock:
+            delta = self._deltas[(user_id, date)]
+            for counter, value in counters.items():
+                delta[counter] += value
+
+    def drain(self) -> dict[tuple[int, datetime], dict[str, int]]:
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(lambda: defaultdict(int))
+
+        return deltas
+
+    async def flush(self) -> int:
+        deltas = self.drain()
+        if not deltas:
+            return 0
+
+        try:
+            async with get_async_session("usage_flush") as session:
+                await add_user_daily_usage(session, deltas)
+        except Exception:
+            # Put the counters back, so they are written by the next flush
+            for (user_id, date), counters in deltas.items():
+                self.add(user_id, date, counters)
+            raise
+
+        metrics.increment("usage_rows_flushed", len(deltas))
+        return len(deltas)
+
+
+usage_buffer = UsageBuffer()
+
+
+async def record_daily_usage(user: User, session: AsyncSession | None = None, **counters: int) -> None:
+    """
+    Count usage of the user for today.
+    Buffered if USAGE_FLUSH_INTERVAL is set, otherwise written right away,
+    in the given session or in a unit of work of its own.
+    """
+    if usage_flush_interval <= 0:
+        if session is not None:
+            await increase_user_daily_usage(session, user, **counters)
+            return
+
+        async with get_async_session("usage") as session:
+            await increase_user_daily_usage(session, user, **counters)
+        return
+
+    today = datetime.now(UTC).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    usage_buffer.add(user.id, today, {counter: value for counter, value in counters.items() if value})
+
+
+async def run_usage_flusher(interval: float = usage_flush_interval) -> None:
+    if interval <= 0:
+        return
+
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            await usage_buffer.flush()
+        except Exception:
+            logger.exception("Usage flush failed")
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import jwt
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.auxiliary.config import SECRET_KEY, ALGORITHM
+from src.auxiliary.metrics import metrics
+from src.schemas.database import User
+
+user_cache_size = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Other workers see changes of a user after this many seconds at most
+user_cache_ttl = float(os.getenv("USER_CACHE_TTL_SECONDS", "5"))
+token_cache_size = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+class UserCache:
+    """
+    In-process LRU of decoded tokens and of user rows, which expire after the TTL.
+    Cached users are detached and only copied into sessions, never changed.
+    """
+
+    def __init__(self, size: int = user_cache_size, ttl: float = user_cache_ttl, token_size: int = token_cache_size):
+        self.size = size
+        self.ttl = ttl
+        self.token_size = token_size
+        self.users: OrderedDict[int, tuple[float, User]] = OrderedDict()
+        self.tokens: OrderedDict[str, int] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def decode_token(self, token: str) -> int:
+        """User id of the token. Tokens do not expire, so they are decoded once."""
+        with self.lock:
+            user_id = self.tokens.get(token)
+            if user_id is not None:
+                self.tokens.move_to_end(token)
+
+        if user_id is not None:
+            metrics.increment("token_cache_hits")
+            return user_id
+
+        metrics.increment("token_cache_misses")
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id = int(payload.get("sub"))
+
+        with self.lock:
+            self.tokens[token] = user_id
+            while len(self.tokens) > self.token_size:
+                self.tokens.popitem(last=False)
+
+        return user_id
+
+    def get(self, user_id: int) -> User | None:
+        with self.lock:
+            item = self.users.get(user_id)
+            if item is not None and time.monotonic() - item[0] > self.ttl:
+                del self.users[user_id]
+                item = None
+
+            if item is not None:
+                self.users.move_to_end(user_id)
+
+        metrics.increment("user_cache_hits" if item is not None else "user_cache_misses")
+        return item[1] if item is not None else None
+
+    def put(self, user: User) -> None:
+        with self.lock:
+            self.users[user.id] = (time.monotonic(), user)
+            self.users.move_to_end(user.id)
+            while len(self.users) > self.size:
+                self.users.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self.lock:
+            self.users.pop(user_id, None)
+
+
+user_cache = UserCache()
+
+
+def invalidate_user(session: AsyncSession, user_id: int) -> None:
+    """
+    Drop the cached user now and again once the session commits,
+    since a concurrent request may cache the old row until then.
+    """
+    user_cache.invalidate(user_id)
+    session.info.setdefault("invalidated_user_ids", set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_users(session: Session) -> None:
+    for user_id in session.info.pop("invalidated_user_ids", ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_invalidated_users(session: Session) -> None:
+    session.info.pop("invalidated_user_ids", None)
@@ -1,22 +1,61 @@
 import onnxruntime as ort
 import numpy as np
-import requests
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 from src.schemas.database import Message, CharacterSprite
 from src.schemas.states.characters import Character
 from src.schemas.states.music import Music
 from src.schemas.states.entities.base import Pose
 from src.auxiliary.state import valid_character_poses, valid_character_expressions
-from src.schemas.states.entities.base import Clothes
+from src.schemas.states.entities.base import Clothes, FacialExpression
 from src.auxiliary.helper import str_to_enum
+from src.classifier.scheduler import InferenceScheduler
+from src.auxiliary.metrics import metrics
+from src.classifier.sidecar import SidecarClient, socket_path as sidecar_socket_path
 import logging
 import os
-import torch
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import io
+from pydantic import BaseModel
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+intra_op_num_threads = int(os.getenv("CLASSIFIER_INTRA_OP_THREADS", "2"))
+max_sequence_length = 256
+sequence_length_buckets = (64, 128, 256)
+premise_length_buckets = (16, 32, 64, 96, 128, 192, 256, 384, 512, 1024)
+# Maximum premise tokens per task kind, e.g. CLASSIFIER_PREMISE_TOKEN_BUDGETS='{"music": 160}'
+premise_token_budgets: dict[str, int] = {
+    "speaker": 96,
+    "music": 224,
+    "following": 224,
+    "pose": 224,
+    "face": 224,
+    **json.loads(os.getenv("CLASSIFIER_PREMISE_TOKEN_BUDGETS", "{}"))
+}
+# "fp32" or "int8", the latter requires classifier_int8.onnx built by build_model.py
+classifier_precision = os.getenv("CLASSIFIER_PRECISION", "fp32").lower()
+# "local" loads the model in every worker, "sidecar" shares one model process between workers
+classifier_mode = os.getenv("CLASSIFIER_MODE", "local").lower()
+hypothesis_cache_size = 1024
+
+
+class ClassificationTask(BaseModel):
+    name: str
+    text: str
+    candidate_labels: list[str]
+    hypothesis_template: str
+
+
+class TurnAnalysis(BaseModel):
+    music: Music
+    sprite: CharacterSprite
+    following: bool
+
 
 class Classifier:
     _instance = None
@@ -31,20 +70,43 @@ class Classifier:
         if not self.initialized:
             self.session = None
             self.tokenizer = None
+            self.scheduler = None
+            self.sidecar = None
+            # Fast tokenizers may reconfigure themselves on a call, which fails from several threads at once
+            self.tokenizer_lock = threading.Lock()
+            self.hypothesis_cache: OrderedDict[tuple[str, tuple[str, ...]], list[list[int]]] = OrderedDict()
+            self.hypothesis_cache_lock = threading.Lock()
+            # Tokenization and post-processing of async calls, kept off the event loop
+            self.executor = ThreadPoolExecutor(
+                max_workers=intra_op_num_threads,
+                thread_name_prefix="classifier"
+            )
             self.initialized = True
     
-    def load_model(self):
+    def load_model(self, mode: str = classifier_mode):
         """
-        Load the pre-built ONNX model and tokenizer from the models directory
+        Load the pre-built ONNX model and tokenizer from the models directory.
+        In sidecar mode the model is not loaded, classification is delegated to the sidecar process.
         """
+        if mode == "sidecar":
+            logger.info(f"Using classifier sidecar at {sidecar_socket_path}")
+            self.sidecar = SidecarClient(sidecar_socket_path)
+            return
         
         models_dir = "/models"
         onnx_model_path = os.path.join(models_dir, "classifier.onnx")
         tokenizer_path = os.path.join(models_dir, "tokenizer")
+
+        if classifier_precision == "int8":
+            quantized_model_path = os.path.join(models_dir, "classifier_int8.onnx")
+            if os.path.exists(quantized_model_path):
+                onnx_model_path = quantized_model_path
+            else:
+                logger.warning("Int8 classifier is not built, falling back to fp32")
         
         # Check if pre-built model exists
         if os.path.exists(onnx_model_path) and os.path.exists(tokenizer_path):
-            logger.info("Loading pre-built ONNX model and tokenizer...")
+            logger.info(f"Loading pre-built ONNX model {onnx_model_path} and tokenizer...")
             
             # Load tokenizer from saved directory
             self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
@@ -54,7 +116,7 @@ class Classifier:
             session_options = ort.SessionOptions()
             session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
             session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL  # Better for CPU
-            session_options.intra_op_num_threads = 2
+            session_options.intra_op_num_threads = intra_op_num_threads
             session_options.inter_op_num_threads = 1
             
             # Load pre-built ONNX model from disk
@@ -70,12 +132,29 @@ class Classifier:
             logger.info("Pre-built ONNX model not found, building at runtime...")
             # Fallback to runtime conversion (original code)
             self._load_model_runtime()
+
+        self._warm_hypothesis_cache()
+
+        self.scheduler = InferenceScheduler(self.session, pad_token_id=self.tokenizer.pad_token_id)
+        self.scheduler.start()
+
+    def close(self):
+        """
+        Stop the inference scheduler thread and the tokenization pool
+        """
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
     
     def _load_model_runtime(self):
         """
         Load the model using transformers and convert to ONNX in memory for inference
         (Fallback method for when pre-built model is not available)
         """
+        # Imported here, so workers in sidecar mode do not load torch
+        import torch
         
         # Model name for tokenizer and model
         model_name = os.environ["STANDARD_CLASSIFIER_NAME"]
@@ -142,7 +221,7 @@ class Classifier:
         session_options = ort.SessionOptions()
         session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
         session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL  # Better for CPU
-        session_options.intra_op_num_threads = 2
+        session_options.intra_op_num_threads = intra_op_num_threads
         session_options.inter_op_num_threads = 1
         
         # Load ONNX model from memory
@@ -155,30 +234,131 @@ class Classifier:
         
         logger.info("Model loaded and converted to ONNX successfully!")
 
-    def _onnx_zero_shot_classification(self, session, tokenizer, text, candidate_labels, hypothesis_template):
-        """Perform zero-shot classification using Hugging Face Inference API with fallback to ONNX model"""
-        pairs = [(text, hypothesis_template.format(label)) for label in candidate_labels]
-        
-        batch_inputs = tokenizer(
-            pairs, padding=True, truncation=True, max_length=256, return_tensors="np"
+    def _hypothesis_ids(self, tokenizer, hypothesis_template: str, candidate_labels: list[str]) -> list[list[int]]:
+        """
+        Token ids of the hypotheses of a label set, without special tokens.
+        Label sets are mostly static, so they are tokenized once per process.
+        """
+        key = (hypothesis_template, tuple(candidate_labels))
+
+        with self.hypothesis_cache_lock:
+            hypothesis_ids = self.hypothesis_cache.get(key)
+            if hypothesis_ids is not None:
+                self.hypothesis_cache.move_to_end(key)
+                return hypothesis_ids
+
+        hypotheses = [hypothesis_template.format(label) for label in candidate_labels]
+
+        with self.tokenizer_lock:
+            hypothesis_ids = tokenizer(hypotheses, add_special_tokens=False)['input_ids']
+
+        with self.hypothesis_cache_lock:
+            self.hypothesis_cache[key] = hypothesis_ids
+            if len(self.hypothesis_cache) > hypothesis_cache_size:
+                self.hypothesis_cache.popitem(last=False)
+
+        return hypothesis_ids
+
+    def _warm_hypothesis_cache(self):
+        """
+        Tokenize hypotheses of the static label sets: music, poses and faces
+        """
+        tasks = [self._music_task("")]
+        for character, poses in valid_character_poses.items():
+            tasks.append(self._pose_task(character, ""))
+            tasks.extend(self._face_task(character, pose, "") for pose in poses)
+
+        for task in tasks:
+            self._hypothesis_ids(self.tokenizer, task.hypothesis_template, task.candidate_labels)
+
+        logger.info(f"Cached hypotheses of {len(tasks)} label sets")
+
+    def _prepare_batch(self, tokenizer, tasks: list['ClassificationTask']) -> dict[str, np.ndarray]:
+        """
+        Build one padded batch of (premise, hypothesis) pairs of all tasks.
+        Only premises are tokenized here, hypotheses come from the cache.
+        """
+        texts = list(dict.fromkeys(task.text for task in tasks))
+
+        with self.tokenizer_lock:
+            premise_ids = dict(zip(texts, tokenizer(texts, add_special_tokens=False)['input_ids']))
+
+        special_tokens_count = tokenizer.num_special_tokens_to_add(pair=True)
+
+        rows = []
+        # Faces of every pose share the premise, which is observed once per kind
+        observed_premises = set()
+        for task in tasks:
+            task_kind = task.name.split(":")[0]
+            premise = premise_ids[task.text]
+
+            if (task_kind, task.text) not in observed_premises:
+                observed_premises.add((task_kind, task.text))
+                metrics.observe(f"classifier_premise_tokens_{task_kind}", len(premise), buckets=premise_length_buckets)
+
+            for hypothesis in self._hypothesis_ids(tokenizer, task.hypothesis_template, task.candidate_labels):
+                premise_budget = min(
+                    premise_token_budgets.get(task_kind, max_sequence_length),
+                    max_sequence_length - special_tokens_count - len(hypothesis)
+                )
+                # Keep the newest text, which is at the end of the premise
+                truncated_premise = premise[max(len(premise) - premise_budget, 0):]
+                rows.append(tokenizer.build_inputs_with_special_tokens(truncated_premise, hypothesis))
+
+        # Pad to a fixed bucket length, so ONNX runtime sees only a few distinct shapes
+        longest_row = max(len(row) for row in rows)
+        sequence_length = next(
+            (bucket for bucket in sequence_length_buckets if bucket >= longest_row),
+            longest_row
         )
 
-        ort_inputs = {
-            'input_ids': batch_inputs['input_ids'].astype(np.int64),
-            'attention_mask': batch_inputs['attention_mask'].astype(np.int64)
-        }
-        
-        # Run inference
-        logits = session.run(None, ort_inputs)[0]
-        entailment_scores = logits[:, 0]
+        input_ids = np.full((len(rows), sequence_length), tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(rows), sequence_length), dtype=np.int64)
 
-        sorted_indices = np.argsort(entailment_scores)[::-1]
+        for i, row in enumerate(rows):
+            input_ids[i, :len(row)] = row
+            attention_mask[i, :len(row)] = 1
 
         return {
-            'labels': [candidate_labels[i] for i in sorted_indices],
-            'scores': [float(entailment_scores[i]) for i in sorted_indices]
+            'input_ids': input_ids,
+            'attention_mask': attention_mask
         }
 
+    def _parse_batch(self, tasks: list['ClassificationTask'], logits: np.ndarray) -> list[dict]:
+        """Split entailment scores of a batch back into per-task rankings"""
+        entailment_scores = logits[:, 0]
+
+        results = []
+        start = 0
+        for task in tasks:
+            end = start + len(task.candidate_labels)
+            task_scores = entailment_scores[start:end]
+            sorted_indices = np.argsort(task_scores)[::-1]
+
+            results.append({
+                'labels': [task.candidate_labels[i] for i in sorted_indices],
+                'scores': [float(task_scores[i]) for i in sorted_indices]
+            })
+            start = end
+
+        return results
+
+    async def _onnx_zero_shot_classification_batch_async(self, tasks: list['ClassificationTask']) -> list[dict]:
+        """
+        Perform zero-shot classification of several tasks through the inference scheduler,
+        which may run them together with tasks of other requests
+        """
+        if self.sidecar is not None:
+            return await self.sidecar.classify(tasks)
+
+        loop = asyncio.get_running_loop()
+
+        ort_inputs = await loop.run_in_executor(self.executor, self._prepare_batch, self.tokenizer, tasks)
+
+        logits = await self.scheduler.infer(ort_inputs)
+
+        return await loop.run_in_executor(self.executor, self._parse_batch, tasks, logits)
+
     def _convert_messages_to_string(self, messages: list[Message], include_character_name: bool = True) -> str:
         return "\n".join(
             f"{message.character}: {message.english_text}" 
@@ -186,96 +366,83 @@ class Classifier:
             message.english_text for message in messages
         )
 
-    def determine_next_speaking_character(
+    def _speaking_character_task(self, messages: list[Message], characters: list[Character]) -> 'ClassificationTask':
+        history = self._convert_messages_to_string(reversed(messages), include_character_name=False)
+
+        return ClassificationTask(
+            name="speaker",
+            text=history,
+            candidate_labels=[character.value for character in characters],
+            hypothesis_template="The next person to speak is {}."
+        )
+
+    async def determine_next_speaking_character_async(
         self,
         messages: list[Message], 
         characters: list[Character]
     ) -> Character:
-        history = self._convert_messages_to_string(reversed(messages), include_character_name=False)
         if len(characters) == 1:
             return characters[0]
 
-        candidate_labels = [character.value for character in characters]
-        hypothesis_template = "The next person to speak is {}."
-
-        result = self._onnx_zero_shot_classification(
-            self.session, 
-            self.tokenizer,
-            history,
-            candidate_labels,
-            hypothesis_template
-        )
+        result = (await self._onnx_zero_shot_classification_batch_async(
+            [self._speaking_character_task(messages, characters)]
+        ))[0]
 
         return str_to_enum(result['labels'][0], Character)
 
-    def determine_next_chracter_sprite(
-        self,
-        chracter_name: Character,
-        character_clothes: Clothes,
-        messages: list[Message]
-    ) -> CharacterSprite:
-        history = self._convert_messages_to_string(messages)
-
-        # Get character pose
+    def _pose_task(self, chracter_name: Character, history: str) -> 'ClassificationTask':
         character_poses: tuple[Pose] = valid_character_poses[chracter_name]
-        poses_descriptions = [pose.get_pose_description(pose) for pose in character_poses]
 
-        hypothesis_template = f"The {chracter_name} mood based on his response is {{}}"
-        
-        result = self._onnx_zero_shot_classification(
-            self.session,
-            self.tokenizer,
-            history,
-            poses_descriptions,
-            hypothesis_template
+        return ClassificationTask(
+            name="pose",
+            text=history,
+            candidate_labels=[pose.get_pose_description(pose) for pose in character_poses],
+            hypothesis_template=f"The {chracter_name} mood based on his response is {{}}"
         )
 
-        i = poses_descriptions.index(result['labels'][0])
-        character_pose = character_poses[i]
-
-        # Get character face
+    def _face_task(self, chracter_name: Character, character_pose: Pose, history: str) -> 'ClassificationTask':
         face_expressions = valid_character_expressions[character_pose]
-        face_expressions_descriptions = [face.get_facial_expression_description(face) for face in face_expressions]
 
-        hypothesis_template = f"The {chracter_name} face expression based on response is {{}}"
-        
-        result = self._onnx_zero_shot_classification(
-            self.session,
-            self.tokenizer,
-            history,
-            face_expressions_descriptions,
-            hypothesis_template
+        return ClassificationTask(
+            name=f"face:{character_pose.value}",
+            text=history,
+            candidate_labels=[face.get_facial_expression_description(face) for face in face_expressions],
+            hypothesis_template=f"The {chracter_name} face expression based on response is {{}}"
         )
 
-        i = face_expressions_descriptions.index(result['labels'][0])
-        character_face = face_expressions[i]
-
-        return CharacterSprite(
-            character=chracter_name,
-            pose=character_pose,
-            facial_expression=character_face,
-            clothes=character_clothes
+    def _following_task(self, character: Character, user_character_name: str, history: str) -> 'ClassificationTask':
+        return ClassificationTask(
+            name="following",
+            text=history,
+            candidate_labels=["agreed to follow", "refused to follow"],
+            hypothesis_template=f"The {character} {{}} {user_character_name} whether he wants to go."
         )
 
-    def determine_following(
-        self,
-        character: Character,
-        user_character_name: str,
-        messages: list[Message]
-    ) -> bool:
-        history = self._convert_messages_to_string(reversed(messages))
+    def _music_task(self, history: str) -> 'ClassificationTask':
+        musics = [m for m in Music if m != Music.NONE]
 
-        candidate_labels = ["agreed to follow", "refused to follow"]
-        hypothesis_template = f"The {character} {{}} {user_character_name} whether he wants to go."
-        
-        result = self._onnx_zero_shot_classification(
-            self.session,
-            self.tokenizer,
-            history,
-            candidate_labels,
-            hypothesis_template
+        return ClassificationTask(
+            name="music",
+            text=history,
+            candidate_labels=[m.get_music_description(m) for m in musics],
+            hypothesis_template="Mood of conversation is {}"
         )
 
+    def _select_pose(self, chracter_name: Character, result: dict) -> Pose:
+        character_poses: tuple[Pose] = valid_character_poses[chracter_name]
+        poses_descriptions = [pose.get_pose_description(pose) for pose in character_poses]
+
+        i = poses_descriptions.index(result['labels'][0])
+        return character_poses[i]
+
+    def _select_face(self, character_pose: Pose, result: dict) -> FacialExpression:
+        face_expressions = valid_character_expressions[character_pose]
+        face_expressions_descriptions = [face.get_facial_expression_description(face) for face in face_expressions]
+
+        i = face_expressions_descriptions.index(result['labels'][0])
+        return face_expressions[i]
+
+    def _select_following(self, result: dict) -> bool:
         # Apply softmax to normalize the scores into probabilities
         raw_scores = np.array(result['scores'])
         exp_scores = np.exp(raw_scores - np.max(raw_scores))  # Subtract max for numerical stability
@@ -289,37 +456,91 @@ class Classifier:
 
         return follow_score is not None and follow_score > 0.96
 
-    def determine_music(
-        self,
-        messages: list[Message],
-        previous_music: Music = Music.NONE
-    ) -> Music:
-        history = self._convert_messages_to_string(reversed(messages))
-
+    def _select_music(self, result: dict, previous_music: Music) -> Music:
         musics = [m for m in Music if m != Music.NONE]
         music_descriptions = [m.get_music_description(m) for m in musics]
 
-        hypothesis_template = "Mood of conversation is {}"
-        
-        result = self._onnx_zero_shot_classification(
-            self.session,
-            self.tokenizer,
-            history,
-            music_descriptions,
-            hypothesis_template
-        )
-
         # Get the top score
         top_score = result['scores'][0]
         
         if top_score > 3:
             i = music_descriptions.index(result['labels'][0])
-            music = musics[i]
-        else:
-            # Otherwise, return the previous music
-            music = previous_music
+            return musics[i]
+
+        # Otherwise, return the previous music
+        return previous_music
+
+    def _turn_tasks(
+        self,
+        character: Character,
+        user_character_name: str,
+        messages: list[Message],
+        include_following: bool
+    ) -> list['ClassificationTask']:
+        sprite_history = self._convert_messages_to_string(messages[:1])
+        conversation_history = self._convert_messages_to_string(reversed(messages[:2]))
+
+        character_poses: tuple[Pose] = valid_character_poses[character]
+
+        tasks = [
+            self._music_task(conversation_history),
+            self._pose_task(character, sprite_history)
+        ] + [
+            self._face_task(character, pose, sprite_history) for pose in character_poses
+        ]
+
+        if include_following:
+            tasks.append(self._following_task(character, user_character_name, conversation_history))
+
+        return tasks
+
+    def _turn_analysis(
+        self,
+        tasks: list['ClassificationTask'],
+        results: list[dict],
+        character: Character,
+        character_clothes: Clothes,
+        previous_music: Music,
+        include_following: bool
+    ) -> 'TurnAnalysis':
+        results = dict(zip([task.name for task in tasks], results))
+
+        character_pose = self._select_pose(character, results["pose"])
+        character_face = self._select_face(character_pose, results[f"face:{character_pose.value}"])
+
+        return TurnAnalysis(
+            music=self._select_music(results["music"], previous_music),
+            sprite=CharacterSprite(
+                character=character,
+                pose=character_pose,
+                facial_expression=character_face,
+                clothes=character_clothes
+            ),
+            following=include_following and self._select_following(results["following"])
+        )
 
-        return music
+    async def analyze_turn_async(
+        self,
+        character: Character,
+        character_clothes: Clothes,
+        user_character_name: str,
+        messages: list[Message],
+        previous_music: Music = Music.NONE,
+        include_following: bool = True
+    ) -> 'TurnAnalysis':
+        """
+        Decide music, sprite and following of the character who has just spoken with a single ONNX run.
+        Messages are ordered from the most recent one, which is the character's response.
+        Faces are scored for every pose of the character, so the face of the chosen pose
+        is known without a second run. The batch is run by the inference scheduler
+        together with batches of other requests.
+        """
+        tasks = self._turn_tasks(character, user_character_name, messages, include_following)
+        results = await self._onnx_zero_shot_classification_batch_async(tasks)
+
+        return self._turn_analysis(
+            tasks, results, character, character_clothes, previous_music, include_following
+        )
 
 # Create a singleton instance
 classifier = Classifier()
@@ -0,0 +1,293 @@
+"""
+Local language identification of user messages.
+
+Text is first split by script (Cyrillic, Han, kana, Hangul, Arabic, Devanagari, Latin).
+Languages with their own script are decided by script share, languages sharing a script
+are told apart by distinctive letters and frequent short words.
+"""
+import math
+import os
+import re
+import unicodedata
+from enum import Enum
+from pydantic import BaseModel
+from src.schemas.other import Language
+from src.auxiliary.metrics import metrics
+
+min_confidence = float(os.getenv("LANGUAGE_DETECTION_MIN_CONFIDENCE", "0.6"))
+
+word_pattern = re.compile(r"[^\W\d_]+")
+
+# One CJK character carries about as much as a short word
+script_weights = {"han": 2.0, "kana": 2.0, "hangul": 2.0}
+
+# Languages assumed when the script is known but nothing else tells them apart
+script_default_languages = {
+    "latin": Language.ENGLISH,
+    "cyrillic": Language.RUSSIAN,
+    "han": Language.CHINESE_SIMPLIFIED,
+    "kana": Language.JAPANESE,
+    "hangul": Language.KOREAN,
+    "arabic": Language.ARABIC,
+    "devanagari": Language.HINDI,
+}
+
+# Frequent short words, chosen to overlap as little as possible between languages
+stopwords: dict[Language, set[str]] = {
+    Language.ENGLISH: set(
+        "the a i and you what is are was this that it with have not but my your me im "
+        "do does did can will would hi hello hey yes yeah ok okay thanks thank please "
+        "why how where who when so just like know think want go lets sorry sure here there of to "
+        # Stopwords of other languages too, listed so these English lines stay ambiguous
+        "no come die on ya".split()
+    ),
+    Language.SPANISH: set(
+        "el la los las que es y en un una por para con pero muy sí hola gracias qué cómo "
+        "dónde yo tú usted está estoy eres soy bien vamos también porque nada algo quiero "
+        "puedo tengo aquí hay del al".split()
+    ),
+    Language.FRENCH: set(
+        "le la les des est et je tu il elle nous vous une un pas que qui oui non merci "
+        "bonjour salut avec pour mais très bien suis es sont dans sur moi toi ça quoi "
+        "pourquoi comment où aussi du au".split()
+    ),
+    Language.ITALIAN: set(
+        "il lo la gli le che è e un una sono sei non per con ma molto sì ciao grazie "
+        "cosa come dove io tu lui lei noi voi perché anche bene andiamo questo quello "
+        "della del nel ho hai".split()
+    ),
+    Language.PORTUGUESE: set(
+        "o a os as que é e um uma não sim obrigado obrigada olá oi você eu ele ela nós "
+        "está estou são muito bem com para mas também porque onde como isso isto aqui "
+        "do da no na tenho vamos".split()
+    ),
+    Language.GERMAN: set(
+        "der die das und ist ich du er sie es wir ihr ein eine nicht ja nein danke hallo "
+        "bitte mit für aber sehr gut bin bist sind was wie wo warum auch auf zu den dem "
+        "mich dich mir dir".split()
+    ),
+    Language.DUTCH: set(
+        "de het een en is ik jij je hij zij wij niet ja nee dank bedankt hallo met voor "
+        "maar heel goed ben bent zijn wat hoe waar waarom ook op te van dat dit mij jou "
+        "heb hebt".split()
+    ),
+    Language.POLISH: set(
+        "i w na nie tak to jest się że jak co ja ty on ona my wy dzięki dziękuję cześć "
+        "proszę z do ale bardzo dobrze jestem jesteś są gdzie dlaczego też tu tam mnie "
+        "ciebie czy".split()
+    ),
+    Language.INDONESIAN: set(
+        "yang dan di ke dari ini itu aku saya kamu anda dia kami kita tidak ya iya terima "
+        "kasih halo apa bagaimana mengapa kenapa dimana juga dengan untuk tapi sangat baik "
+        "ada sudah belum mau bisa".split()
+    ),
+    Language.TURKISH: set(
+        "ve bir bu şu o ben sen biz siz onlar değil evet hayır teşekkürler merhaba selam "
+        "ne nasıl neden nerede için ile ama çok iyi var yok da de mi mı mu mü ki".split()
+    ),
+    Language.VIETNAMESE: set(
+        "và là của có không tôi bạn anh em chị nó chúng ta được này đó một những các "
+        "vâng cảm ơn xin chào gì sao đâu như với cho nhưng rất tốt đi".split()
+    ),
+    Language.ROMANIAN: set(
+        "și este în nu da eu tu el ea noi voi un o cu pentru dar foarte bine sunt ești "
+        "ce cum unde de ce mulțumesc salut bună pe la din mă te".split()
+    ),
+    Language.RUSSIAN: set(
+        "и в не на я что он она это как ты мы вы они да нет привет спасибо пожалуйста "
+        "с но очень хорошо где почему когда кто тоже здесь там меня тебя его её был была "
+        "всё уже ещё сейчас".split()
+    ),
+    Language.UKRAINIAN: set(
+        "і й в не на я що він вона це як ти ми ви вони так ні привіт дякую будь ласка "
+        "з але дуже добре де чому коли хто теж тут там мене тебе його її був була "
+        "вже ще зараз".split()
+    ),
+}
+
+# Letters that point to a language. Exclusive letters weigh more than shared ones.
+distinctive_letters: dict[Language, tuple[str, str]] = {
+    # language: (exclusive, shared)
+    Language.SPANISH: ("ñ¿¡", "áéíóú"),
+    Language.FRENCH: ("œæëÿ", "çèêàùâîôûï"),
+    Language.ITALIAN: ("", "àèìòù"),
+    Language.PORTUGUESE: ("ãõ", "çâêôáéíóúà"),
+    Language.GERMAN: ("ß", "äöü"),
+    Language.DUTCH: ("", "ë"),
+    Language.POLISH: ("ąćęłńśźż", "ó"),
+    Language.TURKISH: ("ğı", "şçöü"),
+    # Precomposed letters with tone marks are only used in Vietnamese
+    Language.VIETNAMESE: ("đơư" + "".join(chr(code) for code in range(0x1EA0, 0x1EFA)), "ăâêô"),
+    Language.ROMANIAN: ("șț", "ăâîş"),
+    Language.RUSSIAN: ("ыэъё", ""),
+    Language.UKRAINIAN: ("іїєґ", ""),
+}
+
+exclusive_letter_weight = 2.0
+shared_letter_weight = 0.5
+evidence_sharpness = 1.5
+
+# Common characters whose simplified and traditional forms differ
+simplified_characters = "这们说个来时会为对没还过么吗见觉样问让给开关东车电话听买卖长门间头学习应该发现实经认识语请谢爱边动两热难欢题"
+traditional_characters = "這們說個來時會為對沒還過麼嗎見覺樣問讓給開關東車電話聽買賣長門間頭學習應該發現實經認識語請謝愛邊動兩熱難歡題"
+
+class TranslationAction(str, Enum):
+    SKIP = "skip"
+    TRANSLATE = "translate"
+    REUSE_PREVIOUS = "reuse_previous"
+
+
+class LanguageDetection(BaseModel):
+    language: Language | None
+    confidence: float
+
+
+class LanguageDecision(BaseModel):
+    language: Language
+    confidence: float
+    action: TranslationAction
+
+
+def _script(character: str) -> str | None:
+    if not character.isalpha():
+        return None
+
+    code = ord(character)
+    if code < 0x250 or 0x1E00 <= code <= 0x1EFF:
+        return "latin"
+    if 0x400 <= code <= 0x52F:
+        return "cyrillic"
+    if 0x3040 <= code <= 0x30FF or 0x31F0 <= code <= 0x31FF:
+        return "kana"
+    if 0xAC00 <= code <= 0xD7AF or 0x1100 <= code <= 0x11FF or 0x3130 <= code <= 0x318F:
+        return "hangul"
+    if 0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF or 0xF900 <= code <= 0xFAFF:
+        return "han"
+    if 0x600 <= code <= 0x6FF or 0x750 <= code <= 0x77F:
+        return "arabic"
+    if 0x900 <= code <= 0x97F:
+        return "devanagari"
+
+    return None
+
+
+def _script_weights(text: str) -> dict[str, float]:
+    weights: dict[str, float] = {}
+    for character in text:
+        script = _script(character)
+        if script is not None:
+            weights[script] = weights.get(script, 0) + script_weights.get(script, 1.0)
+
+    return weights
+
+
+def _score_alphabetic(text: str, candidates: list[Language]) -> dict[Language, float]:
+    words = word_pattern.findall(text)
+    scores = {language: 0.0 for language in candidates}
+
+    for language in candidates:
+        words_of_language = stopwords.get(language, set())
+        scores[language] += sum(1.0 for word in words if word in words_of_language)
+
+        exclusive, shared = distinctive_letters.get(language, ("", ""))
+        for character in text:
+            if character in exclusive:
+                scores[language] += exclusive_letter_weight
+            elif character in shared:
+                scores[language] += shared_letter_weight
+
+    return scores
+
+
+def _pick(scores: dict[Language, float], default: Language) -> tuple[Language, float]:
+    best = max(scores, key=scores.get)
+
+    if scores[best] == 0:
+        return (default, 1 / len(scores))
+
+    # Softmax over the candidates with evidence and the default, so a single word shared
+    # with another language stays ambiguous while candidates without evidence do not dilute a match
+    exponents = {
+        language: math.exp(evidence_sharpness * score) for language, score in scores.items()
+        if score > 0 or language == default
+    }
+    return (best, exponents[best] / sum(exponents.values()))
+
+
+def _detect_han(text: str) -> tuple[Language, float]:
+    scores = {
+        Language.CHINESE_SIMPLIFIED: sum(1.0 for character in text if character in simplified_characters),
+        Language.CHINESE_TRADITIONAL: sum(1.0 for character in text if character in traditional_characters),
+    }
+    return _pick(scores, Language.CHINESE_SIMPLIFIED)
+
+
+def detect_language(text: str) -> LanguageDetection:
+    """
+    Detect the language of the text with a confidence between 0 and 1
+    """
+    text = unicodedata.normalize("NFC", text).lower()
+    weights = _script_weights(text)
+
+    if not weights:
+        return LanguageDetection(language=None, confidence=0.0)
+
+    # Japanese mixes kanji with kana, so any kana decides the script
+    if "kana" in weights:
+        weights["kana"] += weights.pop("han", 0)
+
+    script = max(weights, key=weights.get)
+    script_share = weights[script] / sum(weights.values())
+
+    if script == "latin":
+        candidates = [
+            language for language in stopwords
+            if language not in (Language.RUSSIAN, Language.UKRAINIAN)
+        ]
+        language, confidence = _pick(_score_alphabetic(text, candidates), Language.ENGLISH)
+    elif script == "cyrillic":
+        language, confidence = _pick(
+            _score_alphabetic(text, [Language.RUSSIAN, Language.UKRAINIAN]),
+            Language.RUSSIAN
+        )
+    elif script == "han":
+        language, confidence = _detect_han(text)
+    else:
+        language, confidence = (script_default_languages[script], 1.0)
+
+    return LanguageDetection(language=language, confidence=round(confidence * script_share, 3))
+
+
+def decide_translation(text: str, previous_text: str | None = None) -> LanguageDecision:
+    """
+    Decide the language of the user message without an LLM call.
+    Short or ambiguous messages keep the language of the previous turns,
+    without confident previous turns they are taken as English.
+    """
+    detection = detect_language(text)
+
+    if detection.language is not None and detection.confidence >= min_confidence:
+        decision = LanguageDecision(
+            language=detection.language,
+            confidence=detection.confidence,
+            action=TranslationAction.SKIP if detection.language == Language.ENGLISH else TranslationAction.TRANSLATE
+        )
+    else:
+        previous = detect_language(previous_text) if previous_text else None
+
+        if previous is not None and previous.language is not None and previous.confidence >= min_confidence:
+            decision = LanguageDecision(
+                language=previous.language,
+                confidence=previous.confidence,
+                action=TranslationAction.REUSE_PREVIOUS
+            )
+        else:
+            # A guess below the threshold, e.g. "no" as Portuguese, would make the character answer in that language
+            decision = LanguageDecision(
+                language=Language.ENGLISH,
+                confidence=detection.confidence,
+                action=TranslationAction.SKIP
+            )
+
+    metrics.increment(f"language_decision_{decision.action.value}")
+    return decision
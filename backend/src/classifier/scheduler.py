@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from src.auxiliary.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+batch_window_ms = float(os.getenv("CLASSIFIER_BATCH_WINDOW_MS", "5"))
+max_batch_size = int(os.getenv("CLASSIFIER_MAX_BATCH_SIZE", "64"))
+
+
+class InferenceJob:
+    def __init__(self, ort_inputs: dict[str, np.ndarray]):
+        self.ort_inputs = ort_inputs
+        self.rows = ort_inputs['input_ids'].shape[0]
+        self.future: Future = Future()
+
+
+class InferenceScheduler:
+    """
+    Gathers classification jobs of concurrent requests for a short window
+    and runs them as one ONNX batch on a dedicated worker thread.
+    """
+
+    def __init__(
+        self,
+        session,
+        pad_token_id: int,
+        batch_window_ms: float = batch_window_ms,
+        max_batch_size: int = max_batch_size
+    ):
+        self.session = session
+        self.pad_token_id = pad_token_id
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        self.queue: queue.Queue[InferenceJob | None] = queue.Queue()
+        self.pending: InferenceJob | None = None
+        self.thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+
+        self.thread = threading.Thread(target=self._worker, name="classifier-inference", daemon=True)
+        self.thread.start()
+        logger.info(
+            f"Inference scheduler started (window {self.batch_window * 1000} ms, max batch {self.max_batch_size})"
+        )
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def submit(self, ort_inputs: dict[str, np.ndarray]) -> Future:
+        job = InferenceJob(ort_inputs)
+        self.queue.put(job)
+        metrics.set_gauge("classifier_queue_depth", self.queue.qsize())
+
+        return job.future
+
+    async def infer(self, ort_inputs: dict[str, np.ndarray]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(ort_inputs))
+
+    def _collect(self) -> list[InferenceJob] | None:
+        """Block for the first job, then gather more until the window closes or the batch is full"""
+        if self.pending is not None:
+            first, self.pending = self.pending, None
+        else:
+            first = self.queue.get()
+            if first is None:
+                return None
+
+        jobs = [first]
+        rows = first.rows
+        deadline = time.monotonic() + self.batch_window
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            try:
+                job = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if job is None:
+                # Finish the jobs already taken, stop on the next round
+                self.queue.put(None)
+                break
+
+            if rows + job.rows > self.max_batch_size:
+                self.pending = job
+                break
+
+            jobs.append(job)
+            rows += job.rows
+
+        return jobs
+
+    def _merge(self, jobs: list[InferenceJob]) -> dict[str, np.ndarray]:
+        sequence_length = max(job.ort_inputs['input_ids'].shape[1] for job in jobs)
+        pad_values = {'input_ids': self.pad_token_id, 'attention_mask': 0}
+
+        return {
+            name: np.concatenate([
+                np.pad(
+                    job.ort_inputs[name],
+                    ((0, 0), (0, sequence_length - job.ort_inputs[name].shape[1])),
+                    constant_values=pad_value
+                )
+                for job in jobs
+            ])
+            for name, pad_value in pad_values.items()
+        }
+
+    def _worker(self) -> None:
+        while True:
+            jobs = self._collect()
+            if jobs is None:
+                return
+
+            # Skip jobs whose callers have already given up
+            jobs = [job for job in jobs if job.future.set_running_or_notify_cancel()]
+            if not jobs:
+                continue
+
+            metrics.set_gauge("classifier_queue_depth", self.queue.qsize())
+            metrics.observe("classifier_batch_size", sum(job.rows for job in jobs))
+            metrics.observe("classifier_batch_jobs", len(jobs))
+
+            try:
+                logits = self.session.run(None, self._merge(jobs))[0]
+            except Exception as e:
+                logger.exception("Batched inference failed")
+                for job in jobs:
+                    job.future.set_exception(e)
+                continue
+
+            start = 0
+            for job in jobs:
+                job.future.set_result(logits[start:start + job.rows])
+                start += job.rows
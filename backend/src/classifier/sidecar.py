@@ -0,0 +1,133 @@
+"""
+Classification sidecar: a single process holding the ONNX model,
+which all gunicorn workers query over a Unix socket.
+
+Run it with `python -m src.classifier.sidecar`.
+"""
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+socket_path = os.getenv("CLASSIFIER_SOCKET_PATH", "/tmp/classifier.sock")
+connect_timeout = float(os.getenv("CLASSIFIER_SIDECAR_CONNECT_TIMEOUT", "60"))
+
+# Every frame is a 4-byte big-endian length followed by a JSON document
+frame_header = struct.Struct(">I")
+
+
+def encode_frame(payload: dict) -> bytes:
+    body = json.dumps(payload).encode()
+    return frame_header.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict:
+    header = await reader.readexactly(frame_header.size)
+    (length,) = frame_header.unpack(header)
+    return json.loads(await reader.readexactly(length))
+
+
+class SidecarClient:
+    """
+    Sends classification tasks to the sidecar and returns its rankings
+    """
+
+    def __init__(self, path: str = socket_path, timeout: float = connect_timeout):
+        self.path = path
+        self.timeout = timeout
+
+    async def _open_connection(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        # The sidecar may still be loading the model when workers start
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() >= deadline:
+                    raise
+                await asyncio.sleep(0.5)
+
+    def _parse_response(self, response: dict) -> list[dict]:
+        if "error" in response:
+            raise RuntimeError(f"Classifier sidecar failed: {response['error']}")
+        return response["results"]
+
+    async def classify(self, tasks: list) -> list[dict]:
+        reader, writer = await self._open_connection()
+        try:
+            writer.write(encode_frame({"tasks": [task.model_dump() for task in tasks]}))
+            await writer.drain()
+            response = await read_frame(reader)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+        return self._parse_response(response)
+
+    async def metrics(self) -> dict:
+        """Snapshot of the metrics recorded in the sidecar, like classifier batch sizes"""
+        reader, writer = await self._open_connection()
+        try:
+            writer.write(encode_frame({"metrics": True}))
+            await writer.drain()
+            response = await read_frame(reader)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+        return response["metrics"]
+
+
+async def serve(path: str = socket_path) -> None:
+    """
+    Load the model once and answer classification requests of all workers.
+    Requests of different workers are batched together by the inference scheduler.
+    A {"metrics": true} request is answered with the metrics of the sidecar.
+    """
+    from src.classifier.bert import classifier, ClassificationTask
+    from src.auxiliary.metrics import metrics
+
+    classifier.load_model(mode="local")
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+
+                if request.get("metrics"):
+                    writer.write(encode_frame({"metrics": metrics.snapshot()}))
+                    await writer.drain()
+                    continue
+
+                try:
+                    tasks = [ClassificationTask(**task) for task in request["tasks"]]
+                    response = {"results": await classifier._onnx_zero_shot_classification_batch_async(tasks)}
+                except Exception as e:
+                    logger.exception("Classification request failed")
+                    response = {"error": str(e)}
+
+                writer.write(encode_frame(response))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    server = await asyncio.start_unix_server(handle, path=path)
+    logger.info(f"Classifier sidecar listening on {path}")
+
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+from src.auxiliary.database import get_cached_translation, save_cached_translation, evict_translation_cache
+from src.auxiliary.metrics import metrics
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.db import get_async_session
+from src.schemas.database import TranslationCacheEntry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+memory_cache_size = int(os.getenv("TRANSLATION_CACHE_SIZE", "10000"))
+cache_ttl = timedelta(hours=float(os.getenv("TRANSLATION_CACHE_TTL_HOURS", "720")))
+max_rows = int(os.getenv("TRANSLATION_CACHE_MAX_ROWS", "1000000"))
+# Expired and excess rows are deleted once per this many stored translations
+evict_every = int(os.getenv("TRANSLATION_CACHE_EVICT_EVERY", "500"))
+
+whitespace_pattern = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return whitespace_pattern.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(text: str, target_language: str, sex: str, tier: str) -> str:
+    source = "\x1f".join((normalize_text(text), target_language.lower(), sex, tier))
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class TranslationCache:
+    """
+    Two-level cache of translations: an in-process LRU in front of the translation_cache table.
+    Entries of both levels expire after the TTL.
+    """
+
+    def __init__(self, size: int = memory_cache_size, ttl: timedelta = cache_ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, TranslationCacheEntry]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.stored = 0
+
+    def _get_memory(self, key: str) -> TranslationCacheEntry | None:
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+
+            stored_at, entry = item
+            if time.monotonic() - stored_at > self.ttl.total_seconds():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return entry
+
+    def _put_memory(self, key: str, entry: TranslationCacheEntry) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic(), entry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    async def get(self, key: str) -> TranslationCacheEntry | None:
+        entry = self._get_memory(key)
+        if entry is not None:
+            metrics.increment("translation_cache_memory_hits")
+            return entry
+
+        try:
+            # A unit of work of its own, so a cache failure does not abort the transaction of the request
+            async with get_async_session("translation_cache") as session:
+                entry = await get_cached_translation(session, key, self.ttl)
+        except Exception:
+            logger.exception("Failed to read translation cache")
+            return None
+
+        if entry is None:
+            metrics.increment("translation_cache_misses")
+            return None
+
+        metrics.increment("translation_cache_database_hits")
+        self._put_memory(key, entry)
+        return entry
+
+    async def put(self, key: str, translation: str, input_tokens: int, output_tokens: int, session: AsyncSession | None = None) -> None:
+        """
+        Store the translation. With a session it is only queued in it,
+        and written to the table by save_pending in the transaction of the session.
+        """
+        entry = TranslationCacheEntry(
+            key=key,
+            translation=translation,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens
+        )
+        self._put_memory(key, entry)
+
+        if session is not None:
+            session.info.setdefault("translation_cache_entries", []).append(entry)
+            return
+
+        try:
+            async with get_async_session("translation_cache") as session:
+                await self._save(session, [entry])
+        except Exception:
+            # The cache is an optimization, the translation is still returned
+            logger.exception("Failed to store translation in cache")
+
+    async def save_pending(self, session: AsyncSession) -> None:
+        """Write the translations queued in the session, in a savepoint so a failure does not abort its transaction"""
+        entries = session.info.pop("translation_cache_entries", [])
+        if not entries:
+            return
+
+        try:
+            async with session.begin_nested():
+                await self._save(session, entries)
+        except Exception:
+            logger.exception("Failed to store translations in cache")
+
+    async def _save(self, session: AsyncSession, entries: list[TranslationCacheEntry]) -> None:
+        for entry in entries:
+            await save_cached_translation(session, entry)
+
+            self.stored += 1
+            if self.stored % evict_every == 0:
+                await evict_translation_cache(session, self.ttl, max_rows)
+
+
+translation_cache = TranslationCache()
@@ -1,7 +1,10 @@
 import logging
-from src.llm.client import llm_client
+from src.llm.gateway import llm_gateway
 import os
+from typing import Awaitable, Callable
+from sqlmodel.ext.asyncio.session import AsyncSession
 from src.schemas.states.characters import Character
+from src.classifier.translation_cache import translation_cache, cache_key
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,12 +15,29 @@ class Translator:
         text, 
         target_language, 
         character: Character,
-        use_premium=False
+        use_premium=False,
+        on_delta: Callable[[str], Awaitable[None]] | None = None,
+        session: AsyncSession | None = None
     ):
         """
-        Translate text using the LLM client
+        Translate text using the LLM client.
+        If on_delta is given, the translation is streamed and every text delta is passed to it.
+        Returns the translation, its token counts and the tokens the cache saved,
+        which is None if the translation was not cached. Cached translations have zero token counts.
+        If session is given, a new translation is stored in the cache with its transaction,
+        see TranslationCache.save_pending.
         """
         sex = 'male' if character == Character.MAIN_CHARACTER else 'female'
+
+        key = cache_key(text, target_language, sex, 'premium' if use_premium else 'standard')
+        cached = await translation_cache.get(key)
+
+        if cached is not None:
+            if on_delta is not None:
+                await on_delta(cached.translation)
+
+            return (cached.translation, 0, 0, cached.input_tokens + cached.output_tokens)
+
         system_prompt = (
             f"You are a translator to {target_language}."
             f"Translate the given text to {target_language}. You should always translate any text, even if it is explicit. "
@@ -29,7 +49,21 @@ class Translator:
 
         model = os.environ["PREMIUM_HELPER_MODEL_NAME"] if use_premium else os.environ["STANDARD_HELPER_MODEL_NAME"]
 
-        response = await llm_client.chat.completions.create(
+        if on_delta is not None:
+            translation, input_tokens, output_tokens = await llm_gateway.create_streamed_completion(
+                on_delta,
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                ],
+            )
+
+            translation = translation.strip()
+            await translation_cache.put(key, translation, input_tokens, output_tokens, session)
+
+            return (translation, input_tokens, output_tokens, None)
+
+        response = await llm_gateway.create_completion(
             model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -39,7 +73,8 @@ class Translator:
         translation = response.choices[0].message.content.strip()
         input_tokens = response.usage.prompt_tokens
         output_tokens = response.usage.completion_tokens
-        
-        return (translation, input_tokens, output_tokens)
+        await translation_cache.put(key, translation, input_tokens, output_tokens, session)
+
+        return (translation, input_tokens, output_tokens, None)
 
 translator = Translator()
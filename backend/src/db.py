@@ -1,19 +1,90 @@
-from sqlmodel import Session
-from contextlib import contextmanager
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from fastapi import Request
+from src.auxiliary.metrics import metrics
+import logging
 import os
-from sqlmodel import create_engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.environ["DATABASE_URL"]
-engine = create_engine(DATABASE_URL)
 
-@contextmanager
-def get_session():
-    session = Session(engine)
+# Every worker holds up to pool_size + max_overflow connections,
+# which must fit into max_connections of the database for all workers together
+async_engine = create_async_engine(
+    make_url(DATABASE_URL).set(drivername="postgresql+asyncpg"),
+    pool_size=int(os.getenv("DATABASE_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("DATABASE_MAX_OVERFLOW", "10")),
+    pool_timeout=float(os.getenv("DATABASE_POOL_TIMEOUT", "10")),
+    pool_recycle=int(os.getenv("DATABASE_POOL_RECYCLE", "1800")),
+    pool_pre_ping=os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+)
+
+
+@dataclass
+class UnitOfWorkStats:
+    queries: int = 0
+    transactions: int = 0
+
+
+# Statistics of the unit of work running in the current task
+unit_of_work_stats: ContextVar[UnitOfWorkStats | None] = ContextVar("unit_of_work_stats", default=None)
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def count_query(connection, cursor, statement, parameters, context, executemany):
+    stats = unit_of_work_stats.get()
+    if stats is not None:
+        stats.queries += 1
+
+
+@event.listens_for(async_engine.sync_engine, "begin")
+def count_transaction(connection):
+    stats = unit_of_work_stats.get()
+    if stats is not None:
+        stats.transactions += 1
+
+
+@asynccontextmanager
+async def get_async_session(name: str = "unit_of_work"):
+    """
+    A unit of work: one session committed at the end.
+    Its query and transaction counts are logged under the name.
+    """
+    stats = UnitOfWorkStats()
+    token = unit_of_work_stats.set(stats)
+
+    # Objects stay loaded after commit, since they can not be lazily refreshed outside of the session
+    session = AsyncSession(async_engine, expire_on_commit=False)
     try:
         yield session
-        session.commit()
+        await session.commit()
     except Exception:
-        session.rollback()
+        await session.rollback()
         raise
     finally:
-        session.close()
+        await session.close()
+        unit_of_work_stats.reset(token)
+
+        logger.info(f"{name}: {stats.transactions} transactions, {stats.queries} queries")
+        metrics.observe("database_queries_per_unit_of_work", stats.queries)
+        metrics.observe("database_transactions_per_unit_of_work", stats.transactions)
+
+
+def unit_of_work_name(request: Request) -> str:
+    route = request.scope.get("route")
+    return f"{request.method} {route.path if route is not None else request.url.path}"
+
+
+async def get_db_session(request: Request):
+    """
+    FastAPI dependency with the unit of work of the request, shared by all its dependencies and helpers
+    """
+    async with get_async_session(unit_of_work_name(request)) as session:
+        yield session
@@ -1,9 +1,20 @@
 from openai import AsyncOpenAI
+import httpx
 import os
 
 standard_model_name = os.environ["STANDARD_MODEL_NAME"]
 premium_model_name = os.environ["PREMIUM_MODEL_NAME"]
 
+# Connections are shared by all requests of the worker
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+    ),
+    timeout=httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "120")), connect=10.0)
+)
+
 llm_client = AsyncOpenAI(
     base_url=os.environ["LLM_BASE_URL"],
     api_key=os.environ["LLM_API_KEY"],
@@ -11,4 +22,7 @@ llm_client = AsyncOpenAI(
         "HTTP-Referer": "https://redcamptale.web.app",
         "X-Title": "Red Camp Tale",
     },
-)
\ No newline at end of file
+    http_client=http_client,
+    # Retries are done by the gateway
+    max_retries=0,
+)
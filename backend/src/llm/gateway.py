@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable
+from openai import (
+    APIConnectionError,
+    APIError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+from src.llm.client import llm_client
+from src.auxiliary.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+premium_model_names = {
+    os.getenv("PREMIUM_MODEL_NAME"),
+    os.getenv("PREMIUM_HELPER_MODEL_NAME")
+}
+
+max_concurrency_per_model = int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", "32"))
+requests_per_minute = {
+    "standard": float(os.getenv("LLM_STANDARD_REQUESTS_PER_MINUTE", "600")),
+    "premium": float(os.getenv("LLM_PREMIUM_REQUESTS_PER_MINUTE", "120"))
+}
+max_retries = int(os.getenv("LLM_MAX_RETRIES", "4"))
+retry_base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+retry_max_delay = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+
+# Errors of a request that may succeed if it is sent again.
+# APITimeoutError is an APIConnectionError, listed for clarity.
+retryable_errors = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average with bursts up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMGateway:
+    """
+    Single entry point for chat completions.
+    Limits concurrent requests per model and request rate per model family,
+    and retries rate-limited, failed to connect and server failed requests with exponential backoff and jitter.
+    """
+
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+        self.semaphores: dict[str, asyncio.Semaphore] = {}
+        self.buckets = {
+            family: TokenBucket(rate=rate / 60, capacity=max(1, rate / 60 * 5))
+            for family, rate in requests_per_minute.items()
+        }
+
+    def _family(self, model: str) -> str:
+        return "premium" if model in premium_model_names else "standard"
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphore = self.semaphores.get(model)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max_concurrency_per_model)
+            self.semaphores[model] = semaphore
+        return semaphore
+
+    def _retry_delay(self, error: APIError, attempt: int) -> float:
+        # Connection errors have no response
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), retry_max_delay)
+            except ValueError:
+                pass
+
+        # Full jitter
+        return random.uniform(0, min(retry_max_delay, retry_base_delay * 2 ** attempt))
+
+    async def _create(self, consume: Callable[[object], Awaitable] | None = None, **kwargs):
+        """
+        Create a completion, returned as is or passed to consume while the model's semaphore is held.
+        The semaphore is released during backoff, so retried requests do not hold back other ones.
+        Only creating the completion is retried, not consuming it.
+        """
+        model = kwargs["model"]
+        family = self._family(model)
+
+        for attempt in range(max_retries + 1):
+            async with self._semaphore(model):
+                await self.buckets[family].acquire()
+                metrics.increment(f"llm_requests_{family}")
+
+                try:
+                    response = await self.client.chat.completions.create(**kwargs)
+                except retryable_errors as e:
+                    if attempt == max_retries:
+                        raise
+                    error = e
+                else:
+                    return response if consume is None else await consume(response)
+
+            delay = self._retry_delay(error, attempt)
+            if isinstance(error, RateLimitError):
+                metrics.increment(f"llm_rate_limited_{family}")
+                logger.warning(f"Rate limited by {model}, retrying in {delay:.2f} s")
+            else:
+                metrics.increment(f"llm_failed_{family}")
+                logger.warning(f"Request to {model} failed with {type(error).__name__}, retrying in {delay:.2f} s")
+            await asyncio.sleep(delay)
+
+    async def create_completion(self, **kwargs):
+        return await self._create(**kwargs)
+
+    async def create_streamed_completion(
+        self,
+        on_delta: Callable[[str], Awaitable[None]],
+        **kwargs
+    ) -> tuple[str, int, int]:
+        """
+        Stream a chat completion, passing every text delta to on_delta.
+        Returns the full text with input and output token counts.
+        """
+        async def consume(stream) -> tuple[str, int, int]:
+            parts = []
+            input_tokens = 0
+            output_tokens = 0
+
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    delta = chunk.choices[0].delta.content
+                    parts.append(delta)
+                    await on_delta(delta)
+
+                if chunk.usage is not None:
+                    input_tokens = chunk.usage.prompt_tokens
+                    output_tokens = chunk.usage.completion_tokens
+
+            return ("".join(parts), input_tokens, output_tokens)
+
+        return await self._create(
+            consume,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs
+        )
+
+
+llm_gateway = LLMGateway(llm_client)
@@ -1,25 +1,38 @@
 from src.schemas.database import Message
-from src.llm.client import llm_client, standard_model_name, premium_model_name
+from src.llm.client import standard_model_name, premium_model_name
+from src.llm.gateway import llm_gateway
 from src.schemas.states.locations import Location
 from src.schemas.states.characters import Character
 from src.schemas.states.entities.base import Clothes
 from src.schemas.states.times import Time
 import os
+from typing import Awaitable, Callable
 from src.llm.prompts import (
     message_summary_prompt, 
+    message_summary_update_prompt,
     character_message_prompt
 )
 
-async def get_summary_of_messages(messages: list[Message], use_premium=False) -> tuple[str, int, int]:
+async def get_summary_of_messages(messages: list[Message], use_premium=False, previous_summary: str | None = None) -> tuple[str, int, int]:
+    """
+    Summary of the messages, oldest first.
+    With previous_summary, the messages continue the dialogue it summarizes and are folded into it.
+    """
     interaction = "\n\n".join(
         f"{message.character}: {message.english_text}" for message in messages
     )
+
+    if previous_summary is not None:
+        prompt = message_summary_update_prompt
+        interaction = f"Summary of the dialogue so far:\n{previous_summary}\n\nContinuation:\n{interaction}"
+    else:
+        prompt = message_summary_prompt
     
     if use_premium:
-        summary = await llm_client.chat.completions.create(
+        summary = await llm_gateway.create_completion(
             model=os.environ["PREMIUM_HELPER_MODEL_NAME"],
             messages=[
-                {"role": "system", "content": message_summary_prompt},
+                {"role": "system", "content": prompt},
                 {"role": "user", "content": interaction}
             ],
             top_p=0.95,
@@ -27,10 +40,10 @@ async def get_summary_of_messages(messages: list[Message], use_premium=False) ->
             max_completion_tokens=512
         )
     else:
-        summary = await llm_client.chat.completions.create(
+        summary = await llm_gateway.create_completion(
             model=os.environ["STANDARD_HELPER_MODEL_NAME"],
             messages=[
-                {"role": "system", "content": message_summary_prompt},
+                {"role": "system", "content": prompt},
                 {"role": "user", "content": interaction}
             ],
             top_p=0.95,
@@ -55,8 +68,13 @@ async def get_character_message(
     previous_history: str,
     messages: list[Message],
     narrative_preference: str,
-    use_premium=False
+    use_premium=False,
+    on_delta: Callable[[str], Awaitable[None]] | None = None
 ) -> tuple[str, int, int]:
+    """
+    Generate the next message of the character.
+    If on_delta is given, the message is streamed and every text delta is passed to it.
+    """
     interaction = "\n\n".join(
         f"{name_of_main_character if message.character == Character.MAIN_CHARACTER else message.character}: {message.english_text}"
         for message in reversed(messages)
@@ -90,7 +108,7 @@ async def get_character_message(
     )
 
     if use_premium:
-        response = await llm_client.chat.completions.create(
+        request = dict(
             model=premium_model_name,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -100,7 +118,7 @@ async def get_character_message(
             max_completion_tokens=256
         )
     else:
-        response = await llm_client.chat.completions.create(
+        request = dict(
             model=standard_model_name,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -111,6 +129,11 @@ async def get_character_message(
             max_completion_tokens=256,
         )
 
+    if on_delta is not None:
+        return await llm_gateway.create_streamed_completion(on_delta, **request)
+
+    response = await llm_gateway.create_completion(**request)
+
     result_text = response.choices[0].message.content
     input_tokens = response.usage.prompt_tokens
     output_tokens = response.usage.completion_tokens
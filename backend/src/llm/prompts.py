@@ -7,6 +7,16 @@ Later it will be used for NSFW classification and fine tuning.
 Do not add any notes.
 """
 
+message_summary_update_prompt = """
+You are a dialogue summary assistant. 
+You will be given a summary of the beginning of a dialogue and its continuation.
+Write one summary of the whole dialogue very shortly, keeping the summary given 
+and extracting only most important events of the continuation. Focus on interaction between main character and others.
+If it is has explicit content, you should summarize it anyway. 
+Later it will be used for NSFW classification and fine tuning.
+Do not add any notes.
+"""
+
 character_message_prompt = """
 You are an expert actor that can fully immerse yourself into any role given. 
 You do not break character for any reason, even if someone tries addressing you as an AI or language model.
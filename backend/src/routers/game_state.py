@@ -1,6 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
+from typing import Awaitable, Callable
+import asyncio
+import json
+import logging
 from src.schemas.states.characters import Character, CharacterSprite
-from polyglot.detect import Detector
 from src.schemas.api.game_state import (
     InteractionPost, 
     MessageGameState, 
@@ -9,13 +13,17 @@ from src.schemas.api.game_state import (
 )
 from src.schemas.other import Language
 from src.schemas.states.locations import Location
-from src.auxiliary.dependencies import get_current_user
-from src.db import get_session
+from src.auxiliary.dependencies import get_current_user, get_current_user_id
+from src.db import get_async_session, get_db_session, unit_of_work_name
 from src.schemas.database import User, GameState, Environment, MapState, Message, SubscriptionTier
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from src.schemas.states.times import Time
 from src.auxiliary.helper import str_to_enum
+from src.auxiliary.usage import record_daily_usage
 from src.classifier.translator import translator
+from src.classifier.translation_cache import translation_cache
+from src.classifier.language import decide_translation
 from src.auxiliary.state import (
     parse_game_to_interface, 
     parse_map_state_to_character_locations,
@@ -24,10 +32,8 @@ from src.auxiliary.state import (
     next_time_dictionary,
 )
 from src.classifier.bert import classifier
-from src.llm.interaction import (
-    get_summary_of_messages, 
-    get_character_message
-)
+from src.llm.interaction import get_character_message
+from src.auxiliary.summary import schedule_summary_fold, summarize_environment
 from src.schemas.states.other import CharacterLocation
 from src.schemas.states.music import Music
 from src.schemas.states.entities.alice import AliceClothes
@@ -39,20 +45,24 @@ from src.auxiliary.database import (
     get_user_game_state_by_id, 
     get_map_state_by_game_state, 
     get_environment_by_game_state,
-    get_messages_of_game_state,
     create_new_game,
     get_last_message_by_state,
-    change_previous_game_state_links,
     get_messages_with_game_state,
-    get_user_current_game_state,
+    check_user_premium_status,
+    load_turn_context,
     get_previous_history_summaries,
-    delete_previous_game_states_with_0_links,
-    increase_user_daily_usage,
-    check_user_premium_status
+    append_game_state,
+    set_user_head
 )
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 game_state_router = APIRouter(tags=["game_state"])
 
+# Streamed turns keep running when their client disconnects
+running_turns: set[asyncio.Task] = set()
+
 @game_state_router.get(
     "/game_state/continue",
     response_model=GameStateInterface,
@@ -62,31 +72,31 @@ game_state_router = APIRouter(tags=["game_state"])
     }
 )
 async def continue_game(
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Continue the game.
     It will return game state with updated state.
     """
-    with get_session() as session:
-        if user.last_game_state_id is None:
-            return create_new_game(user)
+    if user.last_game_state_id is None:
+        return await create_new_game(session, user)
 
-        else:
-            last_game_state: GameState = session.exec(select(GameState).filter(GameState.id == user.last_game_state_id)).first()
-            environment: Environment = get_environment_by_game_state(last_game_state)
-            map_state: MapState = get_map_state_by_game_state(last_game_state)
+    else:
+        last_game_state: GameState = (await session.exec(select(GameState).filter(GameState.id == user.last_game_state_id))).first()
+        environment: Environment = await get_environment_by_game_state(session, last_game_state)
+        map_state: MapState = await get_map_state_by_game_state(session, last_game_state)
 
-            last_message = get_last_message_by_state(last_game_state)
+        last_message = await get_last_message_by_state(session, last_game_state)
 
-            interface = parse_game_to_interface(
-                environment=environment,
-                game_state=last_game_state,
-                map_state=map_state,
-                message=last_message
-            )
+        interface = parse_game_to_interface(
+            environment=environment,
+            game_state=last_game_state,
+            map_state=map_state,
+            message=last_message
+        )
 
-            return interface
+        return interface
 
 
 @game_state_router.post(
@@ -98,14 +108,10 @@ async def continue_game(
     }
 )
 async def start_new_game(
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):  
-    last_game_state = get_user_game_state_by_id(user.last_game_state_id, user)
-    if last_game_state is not None:
-        change_previous_game_state_links(last_game_state, change=-1)
-        delete_previous_game_states_with_0_links(last_game_state)
-
-    return create_new_game(user)
+    return await create_new_game(session, user)
 
 
 @game_state_router.post(
@@ -113,7 +119,6 @@ async def start_new_game(
     response_model=GameStateInterface,
     status_code=200,
     responses={
-        400: {'description': 'Language detection problems'},
         401: {'description': 'Unauthorized'},
         404: {'description': 'Game state not found'}
     }
@@ -121,7 +126,8 @@ async def start_new_game(
 async def interaction(
     interaction_post: InteractionPost,
     game_state_id: int,
-    user: User = Depends(get_current_user)
+    user_id: int | None = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Interaction with the game state.
@@ -130,7 +136,97 @@ async def interaction(
     It will use text generation and classification methods to determine
     next speaking character, his message, translating to russian, changing music and character sprites.
     """
-    use_premium = check_user_premium_status(user)
+    return await run_interaction_turn(session, interaction_post, game_state_id, user_id)
+
+
+@game_state_router.post(
+    "/game_state/{game_state_id}/interaction/stream",
+    response_class=StreamingResponse,
+    status_code=200,
+    responses={
+        200: {'description': 'Server-sent events: "delta" with text, then "game_state" or "error"'},
+        401: {'description': 'Unauthorized'}
+    }
+)
+async def interaction_stream(
+    request: Request,
+    interaction_post: InteractionPost,
+    game_state_id: int,
+    user_id: int | None = Depends(get_current_user_id)
+):
+    """
+    Same as interaction, but streams the character's message as server-sent events.
+    "delta" events carry text as it is generated (or translated, if user's language is not English).
+    The final "game_state" event carries the updated game state, "error" is sent instead if the turn fails.
+    The turn is completed and saved even if the client disconnects.
+    """
+    if user_id is None:
+        raise HTTPException(401)
+
+    events: asyncio.Queue[tuple[str, dict] | None] = asyncio.Queue()
+
+    async def on_delta(text: str) -> None:
+        await events.put(("delta", {"text": text}))
+
+    # The turn outlives the request, so it runs in a unit of work of its own
+    name = unit_of_work_name(request)
+
+    async def run_turn() -> None:
+        try:
+            async with get_async_session(name) as session:
+                interface = await run_interaction_turn(session, interaction_post, game_state_id, user_id, on_delta=on_delta)
+            await events.put(("game_state", interface.model_dump(mode="json")))
+        except HTTPException as e:
+            await events.put(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception:
+            logger.exception("Streamed interaction failed")
+            await events.put(("error", {"status_code": 500, "detail": "Internal server error"}))
+        finally:
+            await events.put(None)
+
+    turn = asyncio.create_task(run_turn())
+    running_turns.add(turn)
+    turn.add_done_callback(running_turns.discard)
+
+    async def stream_events():
+        while (event := await events.get()) is not None:
+            name, data = event
+            yield f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def run_interaction_turn(
+    session: AsyncSession,
+    interaction_post: InteractionPost,
+    game_state_id: int,
+    user_id: int | None,
+    on_delta: Callable[[str], Awaitable[None]] | None = None
+) -> GameStateInterface:
+    """
+    Run one turn of interaction in the session and return the updated game state.
+    If on_delta is given, the displayed text of the character's message is passed to it as it is generated.
+    """
+    if user_id is None:
+        raise HTTPException(401)
+
+    # Previous 15 messages are used for generation, and to count the messages to fold into the running summary
+    user, context = await load_turn_context(session, user_id, game_state_id, message_limit=15)
+
+    if user is None:
+        raise HTTPException(401)
+
+    if context is None:
+        raise HTTPException(404, detail="Game state not found.")
+
+    use_premium = await check_user_premium_status(session, user)
+
+    # The connection returns to the pool during the model calls, the results are stored in the next transaction
+    await session.commit()
 
     translation_input_tokens = 0
     translation_output_tokens = 0
@@ -148,19 +244,18 @@ async def interaction(
     premium_translation_output_tokens = 0
     premium_translation_queries = 0
 
-    game_state = get_user_game_state_by_id(game_state_id, user)
+    translation_cache_hits = 0
+    translation_cache_misses = 0
+    translation_cache_saved_tokens = 0
 
-    if game_state is None:
-        raise HTTPException(404, detail="Game state not found.")
+    game_state = context.game_state
+    user_message = None
 
-    new_game_state = game_state
-
-    # Get previous 15 messages from game state
-    messages = get_messages_of_game_state(new_game_state, limit=15)
+    messages = list(context.messages)
     recent_message = messages[0] if messages else None
 
-    environment = get_environment_by_game_state(game_state)
-    map_state = get_map_state_by_game_state(game_state)
+    environment = context.environment
+    map_state = context.map_state
 
     game_state_sprites: list[CharacterSprite] = [CharacterSprite(**c) for c in game_state.characters]
 
@@ -173,147 +268,49 @@ async def interaction(
         )
 
     if user.language == Language.AUTO.value:
-        try:
-            if interaction_post.user_text:
-                detector = Detector(interaction_post.user_text)
-            elif recent_message:
-                detector = Detector(recent_message.displayed_text)
-            else:
-                input_language = Language.ENGLISH.value
-            
-            if not detector.reliable:
-                raise HTTPException(400, detail="Language detection problems")
-            else:
-                input_language = detector.language.name
-        except Exception:
-            raise HTTPException(400, detail="Language detection problems")
+        # Short messages are ambiguous, so the recent turns decide their language
+        previous_text = " ".join(message.displayed_text for message in messages[:4])
+        decision = decide_translation(interaction_post.user_text or "", previous_text)
+        input_language = decision.language.value
     else:
         input_language = user.language
 
-    with get_session() as session:
-        if interaction_post.user_interaction:
-            displayed_text = interaction_post.user_text
-            if not game_state_sprites or input_language == Language.ENGLISH.value:
-                english_text = interaction_post.user_text
-            else:
-                english_text, input_tokens, output_tokens = await translator.translate(
-                    interaction_post.user_text,
-                    target_language=Language.ENGLISH.value,
-                    character=Character.MAIN_CHARACTER,
-                    use_premium=use_premium
-                )
-
-                if use_premium:
-                    premium_translation_input_tokens += input_tokens
-                    premium_translation_output_tokens += output_tokens
-                    premium_translation_queries += 1
-                else:
-                    translation_input_tokens += input_tokens
-                    translation_output_tokens += output_tokens
-                    translation_queries += 1
-
-            new_message = Message(
-                character=Character.MAIN_CHARACTER.value,
-                english_text=english_text,
-                displayed_text=displayed_text,
-                previous_message_id=recent_message.id if recent_message is not None else None
-            )
-
-            session.add(new_message)
-            session.flush()
-            session.refresh(new_message)
-
-            new_game_state = GameState(
-                user_id=user.id,
-                characters=game_state.characters,
-                music=game_state.music,
-                followers=game_state.followers,
-                last_message_id=new_message.id,
-                environment_id=game_state.environment_id,
-                map_state_id=game_state.map_state_id,
-                previous_game_state_id=game_state.id
-            )
-
-            session.add(new_game_state)
-            session.flush()
-            session.refresh(new_game_state)
-
-            game_state = new_game_state
-
-            messages = [new_message] + messages
-            recent_message = new_message
-
-            if not game_state_sprites:
-                user.last_game_state_id = game_state.id
-                session.add(user)
-                return parse_game_to_interface(
-                    environment=environment,
-                    game_state=game_state,
-                    map_state=map_state,
-                    message=recent_message
-                )
-
-        # Get all character names from current game state
-        character_names = []
-        if game_state_sprites:
-            character_names = [
-                str_to_enum(character.character, Character) for character in game_state_sprites
-            ]
-
-        classifiying_messages = messages[:1]
-
-        # DETERMINE NEXT SPEAKER
-        next_character = classifier.determine_next_speaking_character(
-            messages=classifiying_messages,
-            characters=character_names
-        )
-
-        clothes = None
-        for character in game_state_sprites:
-            if character.character == next_character:
-                clothes = character.clothes
-                break
+    async def append_user_message() -> GameState:
+        session.add(user_message)
+        await session.flush()
+        await session.refresh(user_message)
 
-        character_history = get_previous_history_summaries(
-            environment=environment,
-            character=next_character,
-            limit=6
-        )
-
-        time_of_day = str_to_enum(map_state.time, Time)
-
-        # SPEAK
-        character_message, input_tokens, output_tokens = await get_character_message(
-            character_name=next_character,
-            other_character_location=character_names,
-            location=str_to_enum(environment.location, Location),
-            name_of_main_character=user.user_biography_name,
-            time_of_day=time_of_day,
-            biography_of_main_character=user.user_biography_description,
-            clothes=str_to_enum(clothes, [UlyanaClothes, AliceClothes, SlavyaClothes, LenaClothes, MikuClothes]),
-            previous_history="\n\n".join(character_history),
-            messages=messages,
-            narrative_preference=user.user_narrative_preference,
-            use_premium=use_premium
+        return await append_game_state(
+            session,
+            game_state,
+            user_id=user.id,
+            characters=game_state.characters,
+            music=game_state.music,
+            followers=game_state.followers,
+            last_message_id=user_message.id,
+            environment_id=game_state.environment_id,
+            map_state_id=game_state.map_state_id
         )
 
-        if use_premium:
-            premium_interaction_input_tokens += input_tokens
-            premium_interaction_output_tokens += output_tokens
-            premium_interaction_queries += 1
+    if interaction_post.user_interaction:
+        displayed_text = interaction_post.user_text
+        if not game_state_sprites or input_language == Language.ENGLISH.value:
+            english_text = interaction_post.user_text
         else:
-            interaction_input_tokens += input_tokens
-            interaction_output_tokens += output_tokens
-            interaction_queries += 1
-
-        if input_language != Language.ENGLISH.value:
-            displayed_text, input_tokens, output_tokens = await translator.translate(
-                character_message,
-                target_language=input_language,
-                character=next_character,
-                use_premium=use_premium
+            english_text, input_tokens, output_tokens, saved_tokens = await translator.translate(
+                interaction_post.user_text,
+                target_language=Language.ENGLISH.value,
+                character=Character.MAIN_CHARACTER,
+                use_premium=use_premium,
+                session=session
             )
 
+            if saved_tokens is None:
+                translation_cache_misses += 1
+            else:
+                translation_cache_hits += 1
+                translation_cache_saved_tokens += saved_tokens
+
             if use_premium:
                 premium_translation_input_tokens += input_tokens
                 premium_translation_output_tokens += output_tokens
@@ -322,96 +319,198 @@ async def interaction(
                 translation_input_tokens += input_tokens
                 translation_output_tokens += output_tokens
                 translation_queries += 1
-        else:
-            displayed_text = character_message
 
-        new_message = Message(
-            character=next_character,
-            english_text=character_message,
+        # Stored together with the character's answer
+        user_message = Message(
+            character=Character.MAIN_CHARACTER.value,
+            english_text=english_text,
             displayed_text=displayed_text,
             previous_message_id=recent_message.id if recent_message is not None else None
         )
 
-        session.add(new_message)
-        session.flush()
-        session.refresh(new_message)
+        messages = [user_message] + messages
+        recent_message = user_message
 
-        new_messages = [new_message] + messages
-        new_followers_messages = new_messages[:2]
-        new_music_messages = new_messages[:2]
+        if not game_state_sprites:
+            new_game_state = await append_user_message()
+            await set_user_head(session, user, new_game_state)
+            return parse_game_to_interface(
+                environment=environment,
+                game_state=new_game_state,
+                map_state=map_state,
+                message=user_message
+            )
 
-        #DETERMINE MUSIC
-        music = classifier.determine_music(
-            new_music_messages, 
-            str_to_enum(game_state.music, Music)
-        )
+    # Get all character names from current game state
+    character_names = []
+    if game_state_sprites:
+        character_names = [
+            str_to_enum(character.character, Character) for character in game_state_sprites
+        ]
 
-        #DETERMINE SPRITE
-        new_sprite = classifier.determine_next_chracter_sprite(
-            chracter_name=next_character,
-            character_clothes=clothes,
-            messages=[new_message]
-        )
+    classifiying_messages = messages[:1]
 
-        new_sprites = [
-            sprite for sprite in game_state_sprites if sprite.character != next_character
-        ] + [new_sprite]
+    # DETERMINE NEXT SPEAKER
+    next_character = await classifier.determine_next_speaking_character_async(
+        messages=classifiying_messages,
+        characters=character_names
+    )
 
-        #DETERMINE FOLLOWERS
-        new_following=[str_to_enum(follower, Character) for follower in game_state.followers]
+    clothes = None
+    for character in game_state_sprites:
+        if character.character == next_character:
+            clothes = character.clothes
+            break
+
+    character_history = await get_previous_history_summaries(session, environment, next_character, limit=6)
+
+    time_of_day = str_to_enum(map_state.time, Time)
+
+    # SPEAK
+    character_message, input_tokens, output_tokens = await get_character_message(
+        character_name=next_character,
+        other_character_location=character_names,
+        location=str_to_enum(environment.location, Location),
+        name_of_main_character=user.user_biography_name,
+        time_of_day=time_of_day,
+        biography_of_main_character=user.user_biography_description,
+        clothes=str_to_enum(clothes, [UlyanaClothes, AliceClothes, SlavyaClothes, LenaClothes, MikuClothes]),
+        previous_history="\n\n".join(character_history),
+        messages=messages,
+        narrative_preference=user.user_narrative_preference,
+        use_premium=use_premium,
+        # Non-English players see the translation, which is streamed instead
+        on_delta=on_delta if input_language == Language.ENGLISH.value else None
+    )
 
-        if next_character not in new_following:
-            following = classifier.determine_following(
-                character=next_character,
-                user_character_name=user.user_biography_name,
-                messages=new_followers_messages
-            )
+    if use_premium:
+        premium_interaction_input_tokens += input_tokens
+        premium_interaction_output_tokens += output_tokens
+        premium_interaction_queries += 1
+    else:
+        interaction_input_tokens += input_tokens
+        interaction_output_tokens += output_tokens
+        interaction_queries += 1
+
+    new_message = Message(
+        character=next_character.value,
+        english_text=character_message,
+        displayed_text=character_message
+    )
 
-            if following:
-                new_following.append(next_character)
+    new_messages = [new_message] + messages
+    new_following=[str_to_enum(follower, Character) for follower in game_state.followers]
 
-        new_character_game_state = GameState(
-            user_id=user.id,
-            characters=[sprite.model_dump() for sprite in new_sprites],
-            music=music,
-            followers=new_following,
-            last_message_id=new_message.id,
-            environment_id=game_state.environment_id,
-            map_state_id=game_state.map_state_id,
-            previous_game_state_id=new_game_state.id
-        )
+    # Translation and classification only read the English text, so they run concurrently
+    async def translate_message() -> tuple[str, int, int, int | None] | None:
+        if input_language == Language.ENGLISH.value:
+            return None
 
-        session.add(new_character_game_state)
-        session.flush()
-        session.refresh(new_character_game_state)
-
-        user.last_game_state_id = new_character_game_state.id
-        session.add(user)
-
-        increase_user_daily_usage(
-            user=user,
-            interaction_input_tokens=interaction_input_tokens,
-            interaction_output_tokens=interaction_output_tokens,
-            interaction_queries=interaction_queries,
-            translation_input_tokens=translation_input_tokens,
-            translation_output_tokens=translation_output_tokens,
-            translation_queries=translation_queries,
-            premium_interaction_input_tokens=premium_interaction_input_tokens,
-            premium_interaction_output_tokens=premium_interaction_output_tokens,
-            premium_interaction_queries=premium_interaction_queries,
-            premium_translation_input_tokens=premium_translation_input_tokens,
-            premium_translation_output_tokens=premium_translation_output_tokens,
-            premium_translation_queries=premium_translation_queries,
+        return await translator.translate(
+            character_message,
+            target_language=input_language,
+            character=next_character,
+            use_premium=use_premium,
+            on_delta=on_delta,
+            session=session
         )
 
-        parsed = parse_game_to_interface(
-            environment=environment,
-            game_state=new_character_game_state,
-            map_state=map_state,
-            message=new_message
+    #DETERMINE MUSIC, SPRITE AND FOLLOWERS
+    translation, turn_analysis = await asyncio.gather(
+        translate_message(),
+        classifier.analyze_turn_async(
+            character=next_character,
+            character_clothes=clothes,
+            user_character_name=user.user_biography_name,
+            messages=new_messages,
+            previous_music=str_to_enum(game_state.music, Music),
+            include_following=next_character not in new_following
         )
+    )
 
-        return(parsed)
+    if translation is not None:
+        new_message.displayed_text, input_tokens, output_tokens, saved_tokens = translation
+
+        if saved_tokens is None:
+            translation_cache_misses += 1
+        else:
+            translation_cache_hits += 1
+            translation_cache_saved_tokens += saved_tokens
+
+        if use_premium:
+            premium_translation_input_tokens += input_tokens
+            premium_translation_output_tokens += output_tokens
+            premium_translation_queries += 1
+        else:
+            translation_input_tokens += input_tokens
+            translation_output_tokens += output_tokens
+            translation_queries += 1
+
+    new_game_state = game_state
+    if user_message is not None:
+        new_game_state = await append_user_message()
+
+    new_message.previous_message_id = recent_message.id if recent_message is not None else None
+    session.add(new_message)
+    await session.flush()
+    await session.refresh(new_message)
+
+    music = turn_analysis.music
+
+    new_sprites = [
+        sprite for sprite in game_state_sprites if sprite.character != next_character
+    ] + [turn_analysis.sprite]
+
+    if turn_analysis.following:
+        new_following.append(next_character)
+
+    new_character_game_state = await append_game_state(
+        session,
+        new_game_state,
+        user_id=user.id,
+        characters=[sprite.model_dump() for sprite in new_sprites],
+        music=music,
+        followers=new_following,
+        last_message_id=new_message.id,
+        environment_id=game_state.environment_id,
+        map_state_id=game_state.map_state_id
+    )
+
+    await set_user_head(session, user, new_character_game_state)
+
+    # Folded in the background after the messages are committed, so leaving the environment only summarizes the rest
+    schedule_summary_fold(session, environment, [new_message] + messages, user, use_premium)
+
+    await translation_cache.save_pending(session)
+
+    await record_daily_usage(
+        user=user,
+        session=session,
+        interaction_input_tokens=interaction_input_tokens,
+        interaction_output_tokens=interaction_output_tokens,
+        interaction_queries=interaction_queries,
+        translation_input_tokens=translation_input_tokens,
+        translation_output_tokens=translation_output_tokens,
+        translation_queries=translation_queries,
+        premium_interaction_input_tokens=premium_interaction_input_tokens,
+        premium_interaction_output_tokens=premium_interaction_output_tokens,
+        premium_interaction_queries=premium_interaction_queries,
+        premium_translation_input_tokens=premium_translation_input_tokens,
+        premium_translation_output_tokens=premium_translation_output_tokens,
+        premium_translation_queries=premium_translation_queries,
+        translation_cache_hits=translation_cache_hits,
+        translation_cache_misses=translation_cache_misses,
+        translation_cache_saved_tokens=translation_cache_saved_tokens,
+    )
+
+    parsed = parse_game_to_interface(
+        environment=environment,
+        game_state=new_character_game_state,
+        map_state=map_state,
+        message=new_message
+    )
+
+    return(parsed)
 
 
 @game_state_router.get(
@@ -425,35 +524,24 @@ async def interaction(
 )
 async def get_game_state(
     game_state_id: int,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Get game state by id.
-    It will decrease links of previous game states and increase of the new.
-    Also it will change head link in user's database row, to refer it later.
+    It will move the user's head link from the previous game state's branch to the new one,
+    so it can be referred later.
     It returns new game state with updated state.
     """
-    with get_session() as session:
-        game_state = get_user_game_state_by_id(game_state_id, user)
-        if not game_state:
-            raise HTTPException(404, detail="Game state not found.")
-
-        user_last_game_state = get_user_current_game_state(user)
-
-        user.last_game_state_id = game_state.id
-        session.add(user)
-
-        change_previous_game_state_links(game_state, 1)
-        
-        if user_last_game_state is not None:
-            change_previous_game_state_links(user_last_game_state, -1)
-            delete_previous_game_states_with_0_links(user_last_game_state)
+    game_state = await get_user_game_state_by_id(session, game_state_id, user)
+    if not game_state or not await set_user_head(session, user, game_state):
+        raise HTTPException(404, detail="Game state not found.")
 
     return parse_game_to_interface(
-        environment=get_environment_by_game_state(game_state),
+        environment=await get_environment_by_game_state(session, game_state),
         game_state=game_state,
-        map_state=get_map_state_by_game_state(game_state),
-        message=get_last_message_by_state(game_state)
+        map_state=await get_map_state_by_game_state(session, game_state),
+        message=await get_last_message_by_state(session, game_state)
     )
 
 
@@ -469,119 +557,92 @@ async def get_game_state(
 async def change_location(
     game_state_id: int,
     new_location: Location = Body(..., embed=True),
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Changes the location.
     It will create new environment and game state.
     Map state will be new only if there is characters that followed user.
     """
-    use_premium = check_user_premium_status(user)
-    game_state = get_user_game_state_by_id(game_state_id, user)
+    use_premium = await check_user_premium_status(session, user)
+    game_state = await get_user_game_state_by_id(session, game_state_id, user)
 
     if game_state is None:
         raise HTTPException(404, detail="Game state not found.")
 
-    with get_session() as session:
-        map_state = get_map_state_by_game_state(game_state)
-        environment = get_environment_by_game_state(game_state)
-        messages = get_messages_of_game_state(game_state)
-
-        if game_state.followers:
-            new_character_locations = []
-            for character_location in map_state.character_location:
-                character_location = CharacterLocation(**character_location)
-                if character_location.character in game_state.followers:
-                    new_character_locations.append(
-                        CharacterLocation(
-                            location=new_location,
-                            character=character_location.character,
-                            clothes=character_location.clothes
-                        ).model_dump()
-                    )
-                else:
-                    new_character_locations.append(
-                        character_location.model_dump()
-                    )
-
-            new_map_state = MapState(
-                time=map_state.time,
-                character_location=new_character_locations
-            )
-
-            session.add(new_map_state)
-            session.flush()
-            session.refresh(new_map_state)
-
-            new_map_state_id = new_map_state.id
-
-        else:
-            new_character_locations = map_state.character_location
-            new_map_state = map_state
-            new_map_state_id = map_state.id
-
-        if messages and game_state.characters:
-            previous_environment_summary, input_tokens, output_tokens = await get_summary_of_messages(
-                messages=messages,
-                use_premium=use_premium
-            )
-
-            if use_premium:
-                increase_user_daily_usage(
-                    user=user,
-                    premium_summarization_input_tokens=input_tokens,
-                    premium_summarization_output_tokens=output_tokens,
-                    premium_summarization_queries=1
+    map_state = await get_map_state_by_game_state(session, game_state)
+    environment = await get_environment_by_game_state(session, game_state)
+
+    previous_environment_summary = await summarize_environment(session, user, game_state, environment, use_premium)
+
+    if game_state.followers:
+        new_character_locations = []
+        for character_location in map_state.character_location:
+            character_location = CharacterLocation(**character_location)
+            if character_location.character in game_state.followers:
+                new_character_locations.append(
+                    CharacterLocation(
+                        location=new_location,
+                        character=character_location.character,
+                        clothes=character_location.clothes
+                    ).model_dump()
                 )
             else:
-                increase_user_daily_usage(
-                    user=user,
-                    summarization_input_tokens=input_tokens,
-                    summarization_output_tokens=output_tokens,
-                    summarization_queries=1
+                new_character_locations.append(
+                    character_location.model_dump()
                 )
 
-        else:
-            previous_environment_summary = None
-        
-        new_environment = Environment(
-            location=new_location,
-            previous_environment_summary=previous_environment_summary,
-            previous_environment_characters=[character['character'] for character in game_state.characters],
-            previous_environment_id=environment.id
+        new_map_state = MapState(
+            time=map_state.time,
+            character_location=new_character_locations
         )
 
-        session.add(new_environment)
-        session.flush()
-        session.refresh(new_environment)
+        session.add(new_map_state)
+        await session.flush()
+        await session.refresh(new_map_state)
 
-        character_sprites = get_character_sprites_by_location(
-            location=new_location,
-            character_locations=new_character_locations
-        )
+        new_map_state_id = new_map_state.id
 
-        new_game_state = GameState(
-            user_id=user.id,
-            characters=character_sprites,
-            environment_id=new_environment.id,
-            music=Music.NORMAL.value,
-            last_message_id=None,
-            map_state_id=new_map_state_id,
-            previous_game_state_id=game_state.id
-        )
+    else:
+        new_character_locations = map_state.character_location
+        new_map_state = map_state
+        new_map_state_id = map_state.id
+    
+    new_environment = Environment(
+        location=new_location,
+        previous_environment_summary=previous_environment_summary,
+        previous_environment_characters=[character['character'] for character in game_state.characters],
+        previous_environment_id=environment.id
+    )
 
-        session.add(new_game_state)
-        session.flush()
-        session.refresh(new_game_state)
+    session.add(new_environment)
+    await session.flush()
+    await session.refresh(new_environment)
 
-        user.last_game_state_id = new_game_state.id
-        session.add(user)
+    character_sprites = get_character_sprites_by_location(
+        location=new_location,
+        character_locations=new_character_locations
+    )
 
-        return parse_game_to_interface(
-            environment=new_environment,
-            game_state=new_game_state,
-            map_state=new_map_state
-        )
+    new_game_state = await append_game_state(
+        session,
+        game_state,
+        user_id=user.id,
+        characters=character_sprites,
+        environment_id=new_environment.id,
+        music=Music.NORMAL.value,
+        last_message_id=None,
+        map_state_id=new_map_state_id
+    )
+
+    await set_user_head(session, user, new_game_state)
+
+    return parse_game_to_interface(
+        environment=new_environment,
+        game_state=new_game_state,
+        map_state=new_map_state
+    )
 
 
 @game_state_router.post(
@@ -595,7 +656,8 @@ async def change_location(
 )
 async def change_map(
     game_state_id: int,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Changes the map.
@@ -603,33 +665,11 @@ async def change_map(
     Game state will be created.
     """
     use_premium = user.subscription_tier == SubscriptionTier.PREMIUM.value
-    game_state = get_user_game_state_by_id(game_state_id, user)
-    messages = get_messages_of_game_state(game_state)
-    environment = get_environment_by_game_state(game_state)
-    map_state = get_map_state_by_game_state(game_state)
-
-    if messages and game_state.characters:
-        previous_environment_summary, input_tokens, output_tokens = await get_summary_of_messages(
-            messages=messages,
-            use_premium=use_premium
-        )
+    game_state = await get_user_game_state_by_id(session, game_state_id, user)
+    environment = await get_environment_by_game_state(session, game_state)
+    map_state = await get_map_state_by_game_state(session, game_state)
 
-        if use_premium:
-            increase_user_daily_usage(
-                user=user,
-                premium_summarization_input_tokens=input_tokens,
-                premium_summarization_output_tokens=output_tokens,
-                premium_summarization_queries=1
-            )
-        else:
-            increase_user_daily_usage(
-                user=user,
-                summarization_input_tokens=input_tokens,
-                summarization_output_tokens=output_tokens,
-                summarization_queries=1
-            )
-    else:
-        previous_environment_summary = None
+    previous_environment_summary = await summarize_environment(session, user, game_state, environment, use_premium)
 
     next_time = next_time_dictionary[map_state.time]
     random_character_locations = generate_character_locations(next_time)
@@ -646,42 +686,36 @@ async def change_map(
         character_location=random_character_locations
     )
 
-    with get_session() as session:
-        session.add(new_environment)
-        session.add(new_map_state)
+    session.add(new_environment)
+    session.add(new_map_state)
 
-        session.flush()
-        session.refresh(new_environment)
-        session.refresh(new_map_state)
+    await session.flush()
+    await session.refresh(new_environment)
+    await session.refresh(new_map_state)
 
-        character_sprites = get_character_sprites_by_location(
-            location=Location.MAIN_CHARACTER_HOME,
-            character_locations=random_character_locations
-        )
-
-        new_game_state = GameState(
-            user_id=user.id,
-            characters=character_sprites,
-            environment_id=new_environment.id,
-            music=Music.NONE.value,
-            last_message_id=None,
-            map_state_id=new_map_state.id,
-            previous_game_state_id=game_state.id
-        )
-
-        session.add(new_game_state)
+    character_sprites = get_character_sprites_by_location(
+        location=Location.MAIN_CHARACTER_HOME,
+        character_locations=random_character_locations
+    )
 
-        session.flush()
-        session.refresh(new_game_state)
+    new_game_state = await append_game_state(
+        session,
+        game_state,
+        user_id=user.id,
+        characters=character_sprites,
+        environment_id=new_environment.id,
+        music=Music.NONE.value,
+        last_message_id=None,
+        map_state_id=new_map_state.id
+    )
 
-        user.last_game_state_id = new_game_state.id
-        session.add(user)
+    await set_user_head(session, user, new_game_state)
 
-        result = parse_game_to_interface(
-            environment=new_environment,
-            game_state=new_game_state,
-            map_state=new_map_state
-        )
+    result = parse_game_to_interface(
+        environment=new_environment,
+        game_state=new_game_state,
+        map_state=new_map_state
+    )
         
     return result
 
@@ -696,21 +730,21 @@ async def change_map(
 )
 async def get_map(
     game_state_id: int,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Get current map.
     It will have time and characters' positions.
     """
-    with get_session() as session:
-        game_state = get_user_game_state_by_id(game_state_id, user)
+    game_state = await get_user_game_state_by_id(session, game_state_id, user)
 
-        if game_state is None:
-            raise HTTPException(404, detail="Game state not found.")
+    if game_state is None:
+        raise HTTPException(404, detail="Game state not found.")
 
-        map_state: MapState = session.exec(select(MapState).filter(MapState.id == game_state.map_state_id)).first()
+    map_state: MapState = (await session.exec(select(MapState).filter(MapState.id == game_state.map_state_id))).first()
 
-        return parse_map_state_to_character_locations(map_state)
+    return parse_map_state_to_character_locations(map_state)
 
 
 @game_state_router.get(
@@ -726,16 +760,17 @@ async def get_messages(
     game_state_id: int,
     user: User = Depends(get_current_user),
     offset: int = 0,
-    limit: int = 10
+    limit: int = 10,
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Get message history.
     They will have game state id, which can be loaded later.
     """
-    game_state = get_user_game_state_by_id(game_state_id, user)
+    game_state = await get_user_game_state_by_id(session, game_state_id, user)
     if not game_state:
         raise HTTPException(404, detail="Game state not found.")
 
-    game_messages = get_messages_with_game_state(game_state, offset, limit)
+    game_messages = await get_messages_with_game_state(session, game_state, offset, limit)
 
     return game_messages
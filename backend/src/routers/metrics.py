@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from fastapi import APIRouter, Depends
+from src.auxiliary.dependencies import verify_metrics_token
+from src.auxiliary.metrics import metrics
+from src.classifier.bert import classifier
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The sidecar may be restarting, which must not hold the scrape
+sidecar_metrics_timeout = 2.0
+
+metrics_router = APIRouter(tags=["metrics"])
+
+@metrics_router.get(
+    "/metrics",
+    response_model=dict,
+    status_code=200,
+    responses={
+        401: {'description': 'Unauthorized'},
+        404: {'description': 'Metrics are disabled'}
+    },
+    dependencies=[Depends(verify_metrics_token)]
+)
+async def get_metrics():
+    """
+    Returns counters, gauges and histograms of the worker that serves the request.
+    In sidecar classifier mode the metrics of the sidecar, which all workers share, are under "sidecar".
+    Requires the METRICS_TOKEN as a bearer token.
+    """
+    snapshot = metrics.snapshot()
+
+    if classifier.sidecar is not None:
+        try:
+            snapshot["sidecar"] = await asyncio.wait_for(classifier.sidecar.metrics(), sidecar_metrics_timeout)
+        except Exception:
+            logger.exception("Failed to read classifier sidecar metrics")
+
+    return snapshot
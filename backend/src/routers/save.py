@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 from src.schemas.database import Save
 from src.schemas.api.save import SavePost, SavePut
-from src.auxiliary.database import change_previous_game_state_links, get_user_game_state_by_id, delete_previous_game_states_with_0_links
+from src.auxiliary.database import add_game_state_reference, get_user_game_state_by_id, remove_game_state_reference
 from src.auxiliary.dependencies import get_current_user
-from src.db import get_session
+from src.db import get_db_session
 from src.schemas.database import User
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 save_router = APIRouter(tags=["save"])
@@ -21,14 +22,15 @@ save_router = APIRouter(tags=["save"])
 )
 async def create_save(
     save_post: SavePost,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Creates a database entry for a save. 
-    Recursively increases links count for previous game states and current.
+    Increases links count of the game state's branch.
     Points to game id, which can be loaded later.
     """
-    game_state = get_user_game_state_by_id(save_post.game_state_id, user)
+    game_state = await get_user_game_state_by_id(session, save_post.game_state_id, user)
     if game_state is None:
         raise HTTPException(404)
 
@@ -38,12 +40,12 @@ async def create_save(
         description=save_post.description
     )
 
-    with get_session() as session:
-        session.add(save)
-        session.flush()
-        session.refresh(save)
+    if not await add_game_state_reference(session, game_state):
+        raise HTTPException(404)
 
-    change_previous_game_state_links(game_state, change=1)
+    session.add(save)
+    await session.flush()
+    await session.refresh(save)
 
     return save.model_dump()
 
@@ -59,18 +61,18 @@ async def create_save(
 async def get_saves(
     user: User = Depends(get_current_user),
     offset: int = 0,
-    limit: int = 10
+    limit: int = 10,
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Returns a list of saves.
     It will have game state id which user can refer to later to load the game state.
     """
-    with get_session() as session:
-        saves = session.exec(
-            select(Save).filter(Save.user_id == user.id).offset(offset).limit(limit)
-        ).all()
+    saves = (await session.exec(
+        select(Save).filter(Save.user_id == user.id).offset(offset).limit(limit)
+    )).all()
 
-        return [save.model_dump() for save in saves]
+    return [save.model_dump() for save in saves]
 
 
 @save_router.put(
@@ -85,26 +87,26 @@ async def get_saves(
 async def update_save(
     save_id: int,
     save_put: SavePut,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Updates description of the save.
     """
-    with get_session() as session:
-        save = session.exec(
-            select(Save).filter(Save.id == save_id, Save.user_id == user.id)
-        ).first()
+    save = (await session.exec(
+        select(Save).filter(Save.id == save_id, Save.user_id == user.id)
+    )).first()
 
-        if save is None:
-            raise HTTPException(404)
+    if save is None:
+        raise HTTPException(404)
 
-        save.description = save_put.description
+    save.description = save_put.description
 
-        session.add(save)
-        session.flush()
-        session.refresh(save)
+    session.add(save)
+    await session.flush()
+    await session.refresh(save)
 
-        return save.model_dump()
+    return save.model_dump()
 
 
 @save_router.delete(
@@ -118,22 +120,21 @@ async def update_save(
 )
 async def delete_save(
     save_id: int,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
-    Deletes a save. Decreases links count for previous game states and current.
-    If links count is 0 of game states, they will be deleted.
+    Deletes a save. Decreases links count of the game state's branch.
+    Game states that are not referenced anymore are deleted later by the sweeper.
     """
-    with get_session() as session:
-        save = session.exec(
-            select(Save).filter(Save.id == save_id, Save.user_id == user.id)
-        ).first()
+    save = (await session.exec(
+        select(Save).filter(Save.id == save_id, Save.user_id == user.id)
+    )).first()
 
-        if save is None:
-            raise HTTPException(404)
+    if save is None:
+        raise HTTPException(404)
 
-        game_state = get_user_game_state_by_id(save.game_state_id, user)
-        change_previous_game_state_links(game_state, change=-1)
-        delete_previous_game_states_with_0_links(game_state)
+    game_state = await get_user_game_state_by_id(session, save.game_state_id, user)
+    await remove_game_state_reference(session, game_state.branch_id)
 
-        session.delete(save)
\ No newline at end of file
+    await session.delete(save)
\ No newline at end of file
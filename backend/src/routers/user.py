@@ -3,11 +3,13 @@ from src.schemas.api.user import UserPost, JWT, JWTPayload, UserPut
 from fastapi.security import OAuth2PasswordRequestForm
 from src.auxiliary.config import SECRET_KEY, ALGORITHM, pwd_context
 from src.auxiliary.dependencies import get_current_user
-from src.db import get_session
+from src.auxiliary.user_cache import invalidate_user
+from src.db import get_db_session
 from src.schemas.database import User
 import jwt
 from src.classifier.translator import translator
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from src.auxiliary.database import delete_user, truncate_user
 from src.schemas.other import Language
 from src.schemas.states.characters import Character
@@ -23,7 +25,8 @@ user_router = APIRouter(tags=["user"])
     }
 )
 async def create_user(
-    user_post: UserPost
+    user_post: UserPost,
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Creates a new user. IP address will be set to none if user is already in database with this IP.
@@ -33,23 +36,25 @@ async def create_user(
     # Hash the password
     hashed_password = pwd_context.hash(user_post.password)
     
-    with get_session() as session:
-        # Check if user with same name already exists
-        existing_user = session.exec(select(User).filter(User.name == user_post.name)).first()
-        if existing_user:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="User with this name already exists"
-            )
-
-    english_name, _, __ = await translator.translate(
+    # Check if user with same name already exists
+    existing_user = (await session.exec(select(User).filter(User.name == user_post.name))).first()
+    if existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User with this name already exists"
+        )
+
+    # Return the connection to the pool while translating
+    await session.commit()
+
+    english_name, *_ = await translator.translate(
         user_post.game_name,
         target_language='English',
         character=Character.MAIN_CHARACTER,
         use_premium=True
     )
 
-    english_description, _, __ = await translator.translate(
+    english_description, *_ = await translator.translate(
         user_post.game_biography,
         target_language='English',
         character=Character.MAIN_CHARACTER,
@@ -68,9 +73,8 @@ async def create_user(
         user_narrative_displayed_preference=""
     )
 
-    with get_session() as session:
-        # Add user to database
-        session.add(new_user)
+    # Add user to database
+    session.add(new_user)
 
 
 @user_router.post(
@@ -82,29 +86,29 @@ async def create_user(
     }
 )
 async def login_user(
-    form_data: OAuth2PasswordRequestForm = Depends()
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Logs in a user. Returns JWT with user id.
     """
-    with get_session() as session:
-        # First find the user by username
-        user = session.exec(select(User).filter(User.name == form_data.username)).first()
-        
-        # If user not found or password doesn't verify, return unauthorized
-        if not user or not pwd_context.verify(form_data.password, user.password):
-
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        # Create a JWT payload and convert to token
-        payload = JWTPayload(sub=str(user.id))
-        token = jwt.encode(payload.model_dump(), SECRET_KEY, algorithm=ALGORITHM)
-        
-        return JWT(access_token=token, token_type="bearer")
+    # First find the user by username
+    user = (await session.exec(select(User).filter(User.name == form_data.username))).first()
+    
+    # If user not found or password doesn't verify, return unauthorized
+    if not user or not pwd_context.verify(form_data.password, user.password):
+
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # Create a JWT payload and convert to token
+    payload = JWTPayload(sub=str(user.id))
+    token = jwt.encode(payload.model_dump(), SECRET_KEY, algorithm=ALGORITHM)
+    
+    return JWT(access_token=token, token_type="bearer")
 
 
 @user_router.put(
@@ -118,13 +122,17 @@ async def login_user(
 )
 async def update_user(
     user: User = Depends(get_current_user),
-    user_put: UserPut = Body(...)
+    user_put: UserPut = Body(...),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Update the current user account. Requires authentication.
     """
+    # Return the connection to the pool while translating
+    await session.commit()
+
     if user.user_biography_displayed_name != user_put.game_name:
-        english_name, _, __ = await translator.translate(
+        english_name, *_ = await translator.translate(
             user_put.game_name,
             target_language='English',
             character=Character.MAIN_CHARACTER,
@@ -134,7 +142,7 @@ async def update_user(
         english_name = user.user_biography_name
 
     if user.user_biography_displayed_description != user_put.game_biography:
-        english_description, _, __ = await translator.translate(
+        english_description, *_ = await translator.translate(
             user_put.game_biography,
             target_language='English',
             character=Character.MAIN_CHARACTER,
@@ -144,7 +152,7 @@ async def update_user(
         english_description = user.user_biography_description
 
     if user.user_narrative_displayed_preference != user_put.narrative_preference:
-        english_narrative_preference, _, __ = await translator.translate(
+        english_narrative_preference, *_ = await translator.translate(
             user_put.narrative_preference,
             target_language='English',
             character=Character.MAIN_CHARACTER,
@@ -153,20 +161,22 @@ async def update_user(
     else:
         english_narrative_preference = user.user_narrative_preference
 
-    with get_session() as session:
-        user.user_biography_name = english_name
-        user.user_biography_description = english_description
-        user.user_biography_displayed_name = user_put.game_name
-        user.user_biography_displayed_description = user_put.game_biography
-        user.user_narrative_preference = english_narrative_preference
-        user.user_narrative_displayed_preference = user_put.narrative_preference
-        user.language = user_put.language.value
-
-        session.add(user)
-        session.flush()
-        session.refresh(user)
+    # The user may be a cached copy, changed fields are compared to the stored row
+    await session.refresh(user)
+    user.user_biography_name = english_name
+    user.user_biography_description = english_description
+    user.user_biography_displayed_name = user_put.game_name
+    user.user_biography_displayed_description = user_put.game_biography
+    user.user_narrative_preference = english_narrative_preference
+    user.user_narrative_displayed_preference = user_put.narrative_preference
+    user.language = user_put.language.value
+
+    session.add(user)
+    await session.flush()
+    await session.refresh(user)
+    invalidate_user(session, user.id)
 
-        return user.model_dump(exclude={"password"})
+    return user.model_dump(exclude={"password"})
 
 
 @user_router.delete(
@@ -178,12 +188,13 @@ async def update_user(
     }
 )
 async def delete_user_endpoint(
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
     """
     Delete the current user account. Requires authentication.
     """
-    delete_user(user)
+    await delete_user(session, user)
 
 
 @user_router.get(
@@ -209,6 +220,7 @@ async def get_current_user_endpoint(
     }
 )
 async def truncate_user_endpoint(
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session)
 ):
-    truncate_user(user)
\ No newline at end of file
+    await truncate_user(session, user)
\ No newline at end of file
@@ -13,6 +13,9 @@ class CharacterSpriteURLS(BaseModel):
     pose_url: str = Field(description="URL of the character's pose.")
     clothes_url: str = Field(description="URL of the character's clothes.")
     facial_expression_url: str = Field(description="URL of the character's facial expression.")
+    composite_url: str | None = Field(default=None, description="URL of the pose, clothes and facial expression composited into one WebP image, if built.")
+    composite_srcset: str | None = Field(default=None, description="srcset of the composited WebP image in several widths.")
+    composite_avif_srcset: str | None = Field(default=None, description="srcset of the composited AVIF image in several widths.")
 
 class MessageGameState(BaseModel):
     message: Message = Field(description="Message.")
@@ -28,9 +31,13 @@ class GameStateInterface(BaseModel):
 
     message: MessageGameState | None
 
-    music_urls: list[str] = Field(description="List of music URLs.")
+    music_urls: list[str] = Field(description="List of music URLs, in the variant of the bandwidth class of the client.")
+    music_intro_urls: list[str] = Field(default_factory=list, description="URLs of the first seconds of each track of music_urls, in the same order, to start playback while the track loads.")
     music_type: Music = Field(description="Type of the music.")
 
+    prefetch_urls: list[str] = Field(default_factory=list, description="URLs of assets likely needed next, to be loaded in the background.")
+    prefetch_sprites: list[CharacterSpriteURLS] = Field(default_factory=list, description="Composited sprites likely shown next, to be loaded in the background in the size the client shows them.")
+
 class CharacterMapLocation(BaseModel):
     location: Location = Field(description="Location of the character.")
     character: Character = Field(description="Character name.")
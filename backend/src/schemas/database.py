@@ -8,7 +8,7 @@ from src.schemas.states.characters import CharacterSprite
 from src.schemas.other import Language
 from enum import Enum
 
-from sqlalchemy import Column, String, ForeignKey
+from sqlalchemy import Column, String, ForeignKey, Index, text
 from sqlalchemy.dialects.postgresql import JSON
 
 class SubscriptionTier(str, Enum):
@@ -17,10 +17,13 @@ class SubscriptionTier(str, Enum):
 
 class UserDailyUsage(SQLModel, table=True):
     __tablename__ = "user_daily_usage"
+    __table_args__ = (
+        Index("ix_user_daily_usage_user_id_date", "user_id", "date", unique=True),
+    )
 
     id: int | None = SQLModelField(default=None, primary_key=True)
     user_id: int = SQLModelField(sa_column=Column(ForeignKey("users.id", ondelete="SET NULL")))
-    date: datetime = SQLModelField(default=datetime.now(UTC))
+    date: datetime = SQLModelField(default_factory=lambda: datetime.now(UTC).replace(tzinfo=None))
 
     interaction_input_tokens: int = SQLModelField(default=0)
     interaction_output_tokens: int = SQLModelField(default=0)
@@ -46,6 +49,10 @@ class UserDailyUsage(SQLModel, table=True):
     premium_translation_output_tokens: int = SQLModelField(default=0)
     premium_translation_queries: int = SQLModelField(default=0)
 
+    translation_cache_hits: int = SQLModelField(default=0)
+    translation_cache_misses: int = SQLModelField(default=0)
+    translation_cache_saved_tokens: int = SQLModelField(default=0)
+
 class User(SQLModel, table=True):
     __tablename__ = "users"
 
@@ -69,9 +76,9 @@ class User(SQLModel, table=True):
     subscription_started_at: datetime | None = SQLModelField(default=None)
     subscription_ends_at: datetime | None = SQLModelField(default=None)
 
-    last_game_state_id: int | None = SQLModelField(sa_column=Column(ForeignKey("game_states.id", ondelete="SET NULL")))
+    last_game_state_id: int | None = SQLModelField(sa_column=Column(ForeignKey("game_states.id", ondelete="SET NULL"), index=True))
 
-    created_at: datetime = SQLModelField(default=datetime.now(UTC))
+    created_at: datetime = SQLModelField(default_factory=lambda: datetime.now(UTC).replace(tzinfo=None))
 
 class Environment(SQLModel, table=True):
     __tablename__ = "environments"
@@ -81,7 +88,11 @@ class Environment(SQLModel, table=True):
 
     previous_environment_summary: str | None = SQLModelField(default=None)
     previous_environment_characters: list[str] = SQLModelField(default_factory=list, sa_column=Column(JSON))
-    previous_environment_id: int | None = SQLModelField(sa_column=Column(ForeignKey("environments.id", ondelete="CASCADE")))
+    previous_environment_id: int | None = SQLModelField(sa_column=Column(ForeignKey("environments.id", ondelete="CASCADE"), index=True))
+
+    # Summary of the messages up to running_summary_message_id, folded in while the environment is played
+    running_summary: str | None = SQLModelField(default=None)
+    running_summary_message_id: int | None = SQLModelField(sa_column=Column(ForeignKey("messages.id", ondelete="SET NULL"), index=True))
 
 class MapState(SQLModel, table=True):
     __tablename__ = "map_states"
@@ -99,13 +110,38 @@ class Message(SQLModel, table=True):
     english_text: str
     displayed_text: str
 
-    previous_message_id: int | None = SQLModelField(sa_column=Column(ForeignKey("messages.id", ondelete="SET NULL")))
+    previous_message_id: int | None = SQLModelField(sa_column=Column(ForeignKey("messages.id", ondelete="SET NULL"), index=True))
+
+class GameStateBranch(SQLModel, table=True):
+    """
+    A run of game states where each one follows the previous.
+    A branch forks off its parent branch after the state at fork_depth.
+    Links count saves and user heads on the branch's states and child branches.
+    """
+    __tablename__ = "game_state_branches"
+    __table_args__ = (
+        Index("ix_game_state_branches_needs_sweep", "id", postgresql_where=text("needs_sweep")),
+    )
+
+    id: int | None = SQLModelField(default=None, primary_key=True)
+    user_id: int = SQLModelField(sa_column=Column(ForeignKey("users.id", ondelete="CASCADE"), index=True))
+
+    parent_branch_id: int | None = SQLModelField(sa_column=Column(ForeignKey("game_state_branches.id"), index=True))
+    fork_depth: int = SQLModelField(default=-1)
+    head_depth: int = SQLModelField(default=0)
+
+    links: int = SQLModelField(default=0)
+    # Set when a reference is removed, the sweeper then deletes unreferenced states
+    needs_sweep: bool = SQLModelField(default=False)
 
 class GameState(SQLModel, table=True):
     __tablename__ = "game_states"
+    __table_args__ = (
+        Index("ix_game_states_branch_id_depth", "branch_id", "depth"),
+    )
 
     id: int | None = SQLModelField(default=None, primary_key=True)
-    user_id: int = SQLModelField(sa_column=Column(ForeignKey("users.id", ondelete="CASCADE")))
+    user_id: int = SQLModelField(sa_column=Column(ForeignKey("users.id", ondelete="CASCADE"), index=True))
 
     characters: list[CharacterSprite] = SQLModelField(default_factory=list, sa_column=Column(JSON))
     music: str = SQLModelField(default=Music.NONE.value, sa_column=Column(String))
@@ -116,17 +152,33 @@ class GameState(SQLModel, table=True):
     environment_id: int = SQLModelField(sa_column=Column(ForeignKey("environments.id", ondelete="CASCADE")))
     map_state_id: int = SQLModelField(sa_column=Column(ForeignKey("map_states.id", ondelete="CASCADE")))
 
-    previous_game_state_id: int | None = SQLModelField(sa_column=Column(ForeignKey("game_states.id", ondelete="SET NULL")))
+    previous_game_state_id: int | None = SQLModelField(sa_column=Column(ForeignKey("game_states.id", ondelete="SET NULL"), index=True))
 
-    links: int = SQLModelField(default=1)
+    # Number of states before this one, their depths are 0..depth-1 along the branch chain
+    branch_id: int = SQLModelField(sa_column=Column(ForeignKey("game_state_branches.id"), nullable=False))
+    depth: int = SQLModelField(default=0)
 
 class Save(SQLModel, table=True):
     __tablename__ = "saves"
 
     id: int | None = SQLModelField(default=None, primary_key=True)
-    user_id: int = SQLModelField(sa_column=Column(ForeignKey("users.id", ondelete="CASCADE")))
+    user_id: int = SQLModelField(sa_column=Column(ForeignKey("users.id", ondelete="CASCADE"), index=True))
 
-    game_state_id: int = SQLModelField(sa_column=Column(ForeignKey("game_states.id", ondelete="CASCADE")))
+    game_state_id: int = SQLModelField(sa_column=Column(ForeignKey("game_states.id", ondelete="CASCADE"), index=True))
 
-    created_at: datetime = SQLModelField(default=datetime.now(UTC))
+    created_at: datetime = SQLModelField(default_factory=lambda: datetime.now(UTC).replace(tzinfo=None))
     description: str = SQLModelField(default="")
+
+
+class TranslationCacheEntry(SQLModel, table=True):
+    __tablename__ = "translation_cache"
+
+    id: int | None = SQLModelField(default=None, primary_key=True)
+    # sha256 of normalized source text, target language, speaker sex and model tier
+    key: str = SQLModelField(sa_column=Column(String, unique=True, nullable=False))
+
+    translation: str
+    input_tokens: int = SQLModelField(default=0)
+    output_tokens: int = SQLModelField(default=0)
+
+    created_at: datetime = SQLModelField(default_factory=lambda: datetime.now(UTC).replace(tzinfo=None), index=True)
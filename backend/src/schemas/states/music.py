@@ -65,7 +65,7 @@ music_urls: dict[Music, list[str]] = {
         "music/what_do_you_think_of_me.ogg"
     ],
     Music.CONFUSING: [
-        "music/door_to_nightmare.ogg", "music/drown.ogg", "music/into_the_unknown.ogg",
+        "music/door_to_nightmare.ogg", "music/drown.ogg",
         "music/just_think.ogg", "music/no_tresspassing.ogg", "music/orchid.ogg",
         "music/you_lost_me.ogg"
     ],
@@ -73,7 +73,33 @@ music_urls: dict[Music, list[str]] = {
         "music/awakening_power.ogg", "music/doomed_to_be_defeated.ogg", "music/pile.ogg",
         "music/revenga.ogg", "music/scarytale.ogg", "music/that_s_our_madhouse.ogg"
     ],
-    Music.SCARY: ["music/faceless.ogg", "music/sunny_day.ogg", "music/torture.ogg"],
+    Music.SCARY: ["music/faceless.ogg", "music/torture.ogg"],
     Music.SEXY: ["music/eternal_longing.ogg", "music/glimmering_coals.ogg", "music/you_won_t_let_me_down.ogg"],
     Music.NONE: []
-}
\ No newline at end of file
+}
+
+class BandwidthClass(str, Enum):
+    """Bandwidth declared by the client, music is streamed at the bitrate of its class"""
+    LOW = "low"
+    MEDIUM = "medium"
+    HIGH = "high"
+
+
+# Opus bitrates in kbit/s of the variants built by build_music.py, high is the original track
+music_bitrates: dict[BandwidthClass, int] = {
+    BandwidthClass.LOW: 48,
+    BandwidthClass.MEDIUM: 96,
+}
+# Length in seconds of the intro segment which starts playback before the track is loaded
+music_intro_seconds = 15
+music_intro_bitrate = 48
+
+
+def music_variant_path(path: str, bitrate: int) -> str:
+    name = path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    return f"music_variants/{name}.{bitrate}k.opus"
+
+
+def music_intro_path(path: str) -> str:
+    name = path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    return f"music_variants/{name}.intro.opus"
@@ -16,7 +16,7 @@ sys.path.insert(0, backend_src_path)
 # Import all your models here
 from schemas.database import (
     User, UserDailyUsage, Environment, MapState, 
-    Message, GameState, Save
+    Message, GameState, GameStateBranch, Save, TranslationCacheEntry
 )
 from sqlmodel import SQLModel
 
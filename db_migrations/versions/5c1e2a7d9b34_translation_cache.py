@@ -0,0 +1,48 @@
+"""translation-cache
+
+Revision ID: 5c1e2a7d9b34
+Revises: 0846b8f9607e
+Create Date: 2026-10-17 10:12:31.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e2a7d9b34'
+down_revision: Union[str, None] = '0846b8f9607e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'translation_cache',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('translation', sa.String(), nullable=False),
+        sa.Column('input_tokens', sa.Integer(), nullable=False),
+        sa.Column('output_tokens', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+    )
+    op.create_index('ix_translation_cache_created_at', 'translation_cache', ['created_at'])
+
+    op.add_column('user_daily_usage', sa.Column('translation_cache_hits', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('user_daily_usage', sa.Column('translation_cache_misses', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('user_daily_usage', sa.Column('translation_cache_saved_tokens', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('user_daily_usage', 'translation_cache_saved_tokens')
+    op.drop_column('user_daily_usage', 'translation_cache_misses')
+    op.drop_column('user_daily_usage', 'translation_cache_hits')
+
+    op.drop_index('ix_translation_cache_created_at', table_name='translation_cache')
+    op.drop_table('translation_cache')
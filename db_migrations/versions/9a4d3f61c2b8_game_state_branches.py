@@ -0,0 +1,122 @@
+"""game-state-branches
+
+Revision ID: 9a4d3f61c2b8
+Revises: 5c1e2a7d9b34
+Create Date: 2026-10-17 12:40:05.731164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4d3f61c2b8'
+down_revision: Union[str, None] = '5c1e2a7d9b34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+batch_size = 5000
+
+
+def backfill_branches() -> None:
+    """
+    Split existing previous_game_state_id chains into branches.
+    A parent's first child (the lowest id) continues the parent's branch, other children fork.
+    """
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text("SELECT id, user_id, previous_game_state_id FROM game_states ORDER BY id")
+    ).all()
+
+    # Parents are always created before their children, so they are placed first
+    placed: dict[int, tuple[int, int]] = {}
+    branches: list[dict] = []
+    states: list[dict] = []
+
+    for state_id, user_id, previous_id in rows:
+        parent = placed.get(previous_id) if previous_id is not None else None
+
+        if parent is None:
+            branches.append({"id": len(branches) + 1, "user_id": user_id, "parent_branch_id": None, "fork_depth": -1, "head_depth": 0})
+            branch_id, depth = len(branches), 0
+        else:
+            parent_branch_id, parent_depth = parent
+            depth = parent_depth + 1
+            parent_branch = branches[parent_branch_id - 1]
+
+            if parent_branch["head_depth"] == parent_depth:
+                parent_branch["head_depth"] = depth
+                branch_id = parent_branch_id
+            else:
+                branches.append({
+                    "id": len(branches) + 1,
+                    "user_id": user_id,
+                    "parent_branch_id": parent_branch_id,
+                    "fork_depth": parent_depth,
+                    "head_depth": depth
+                })
+                branch_id = len(branches)
+
+        placed[state_id] = (branch_id, depth)
+        states.append({"state_id": state_id, "branch_id": branch_id, "depth": depth})
+
+    branch_table = sa.table(
+        'game_state_branches',
+        sa.column('id', sa.Integer()),
+        sa.column('user_id', sa.Integer()),
+        sa.column('parent_branch_id', sa.Integer()),
+        sa.column('fork_depth', sa.Integer()),
+        sa.column('head_depth', sa.Integer())
+    )
+
+    for start in range(0, len(branches), batch_size):
+        op.bulk_insert(branch_table, branches[start:start + batch_size])
+
+    if branches:
+        connection.execute(sa.text(
+            "SELECT setval(pg_get_serial_sequence('game_state_branches', 'id'), :last_id)"
+        ), {"last_id": len(branches)})
+
+    for start in range(0, len(states), batch_size):
+        connection.execute(
+            sa.text("UPDATE game_states SET branch_id = :branch_id, depth = :depth WHERE id = :state_id"),
+            states[start:start + batch_size]
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'game_state_branches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('parent_branch_id', sa.Integer(), nullable=True),
+        sa.Column('fork_depth', sa.Integer(), nullable=False),
+        sa.Column('head_depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['parent_branch_id'], ['game_state_branches.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    op.add_column('game_states', sa.Column('branch_id', sa.Integer(), nullable=True))
+    op.add_column('game_states', sa.Column('depth', sa.Integer(), nullable=False, server_default='0'))
+
+    backfill_branches()
+
+    op.alter_column('game_states', 'branch_id', nullable=False)
+    op.alter_column('game_states', 'depth', server_default=None)
+    op.create_foreign_key(
+        'game_states_branch_id_fkey', 'game_states', 'game_state_branches', ['branch_id'], ['id']
+    )
+    op.create_index('ix_game_states_branch_id_depth', 'game_states', ['branch_id', 'depth'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_game_states_branch_id_depth', table_name='game_states')
+    op.drop_constraint('game_states_branch_id_fkey', 'game_states', type_='foreignkey')
+    op.drop_column('game_states', 'depth')
+    op.drop_column('game_states', 'branch_id')
+    op.drop_table('game_state_branches')
@@ -0,0 +1,91 @@
+"""branch-reference-counts
+
+Revision ID: c7e51b0a93d2
+Revises: 9a4d3f61c2b8
+Create Date: 2026-10-17 14:05:48.209377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e51b0a93d2'
+down_revision: Union[str, None] = '9a4d3f61c2b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('game_state_branches', sa.Column('links', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('game_state_branches', sa.Column('needs_sweep', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    # Saves, user heads and child branches each hold one link.
+    # Every branch is swept once to delete states nothing refers to.
+    op.execute("""
+        UPDATE game_state_branches b
+        SET needs_sweep = TRUE,
+            links = (
+                SELECT COUNT(*) FROM saves s
+                JOIN game_states gs ON gs.id = s.game_state_id
+                WHERE gs.branch_id = b.id
+            ) + (
+                SELECT COUNT(*) FROM users u
+                JOIN game_states gs ON gs.id = u.last_game_state_id
+                WHERE gs.branch_id = b.id
+            ) + (
+                SELECT COUNT(*) FROM game_state_branches c
+                WHERE c.parent_branch_id = b.id
+            )
+    """)
+
+    op.alter_column('game_state_branches', 'links', server_default=None)
+    op.alter_column('game_state_branches', 'needs_sweep', server_default=None)
+    op.drop_column('game_states', 'links')
+
+    # Lookups of the sweeper
+    op.create_index(
+        'ix_game_state_branches_needs_sweep', 'game_state_branches', ['id'],
+        postgresql_where=sa.text('needs_sweep')
+    )
+    op.create_index('ix_game_state_branches_parent_branch_id', 'game_state_branches', ['parent_branch_id'])
+    op.create_index('ix_saves_game_state_id', 'saves', ['game_state_id'])
+    op.create_index('ix_users_last_game_state_id', 'users', ['last_game_state_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_last_game_state_id', table_name='users')
+    op.drop_index('ix_saves_game_state_id', table_name='saves')
+    op.drop_index('ix_game_state_branches_parent_branch_id', table_name='game_state_branches')
+    op.drop_index('ix_game_state_branches_needs_sweep', table_name='game_state_branches')
+
+    op.add_column('game_states', sa.Column('links', sa.Integer(), nullable=False, server_default='0'))
+
+    # Every save and user head links all states of its chain
+    op.execute("""
+        WITH RECURSIVE refs AS (
+            SELECT game_state_id AS id FROM saves
+            UNION ALL
+            SELECT last_game_state_id FROM users WHERE last_game_state_id IS NOT NULL
+        ),
+        chain AS (
+            SELECT id FROM refs
+            UNION ALL
+            SELECT gs.previous_game_state_id FROM chain c
+            JOIN game_states gs ON gs.id = c.id
+            WHERE gs.previous_game_state_id IS NOT NULL
+        )
+        UPDATE game_states gs
+        SET links = counted.links
+        FROM (SELECT id, COUNT(*) AS links FROM chain GROUP BY id) counted
+        WHERE gs.id = counted.id
+    """)
+
+    op.alter_column('game_states', 'links', server_default=None)
+
+    op.drop_column('game_state_branches', 'needs_sweep')
+    op.drop_column('game_state_branches', 'links')
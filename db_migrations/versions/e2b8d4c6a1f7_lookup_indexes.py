@@ -0,0 +1,78 @@
+"""lookup-indexes
+
+Revision ID: e2b8d4c6a1f7
+Revises: c7e51b0a93d2
+Create Date: 2026-10-17 15:21:09.552913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b8d4c6a1f7'
+down_revision: Union[str, None] = 'c7e51b0a93d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def merge_duplicate_usage() -> None:
+    """
+    Concurrent requests could create several usage rows for one user and day.
+    Their counters are summed into the first row before the unique index is created.
+    """
+    connection = op.get_bind()
+    counters = [
+        column['name'] for column in sa.inspect(connection).get_columns('user_daily_usage')
+        if column['name'] not in ('id', 'user_id', 'date')
+    ]
+
+    op.execute(f"""
+        UPDATE user_daily_usage u
+        SET {', '.join(f'{counter} = merged.{counter}' for counter in counters)}
+        FROM (
+            SELECT MIN(id) AS id, {', '.join(f'SUM({counter}) AS {counter}' for counter in counters)}
+            FROM user_daily_usage
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id, date
+            HAVING COUNT(*) > 1
+        ) merged
+        WHERE u.id = merged.id
+    """)
+
+    op.execute("""
+        DELETE FROM user_daily_usage u
+        USING user_daily_usage kept
+        WHERE u.user_id = kept.user_id
+          AND u.date = kept.date
+          AND u.id > kept.id
+    """)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    merge_duplicate_usage()
+
+    op.create_index('ix_user_daily_usage_user_id_date', 'user_daily_usage', ['user_id', 'date'], unique=True)
+
+    op.create_index('ix_game_states_user_id', 'game_states', ['user_id'])
+    op.create_index('ix_game_states_previous_game_state_id', 'game_states', ['previous_game_state_id'])
+    op.create_index('ix_messages_previous_message_id', 'messages', ['previous_message_id'])
+    op.create_index('ix_saves_user_id', 'saves', ['user_id'])
+    op.create_index('ix_environments_previous_environment_id', 'environments', ['previous_environment_id'])
+    op.create_index('ix_game_state_branches_user_id', 'game_state_branches', ['user_id'])
+    # users.name is already indexed by its unique constraint
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_game_state_branches_user_id', table_name='game_state_branches')
+    op.drop_index('ix_environments_previous_environment_id', table_name='environments')
+    op.drop_index('ix_saves_user_id', table_name='saves')
+    op.drop_index('ix_messages_previous_message_id', table_name='messages')
+    op.drop_index('ix_game_states_previous_game_state_id', table_name='game_states')
+    op.drop_index('ix_game_states_user_id', table_name='game_states')
+
+    op.drop_index('ix_user_daily_usage_user_id_date', table_name='user_daily_usage')
@@ -0,0 +1,39 @@
+"""running-summaries
+
+Revision ID: f3a9c2d1b7e4
+Revises: e2b8d4c6a1f7
+Create Date: 2026-10-17 18:42:31.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9c2d1b7e4'
+down_revision: Union[str, None] = 'e2b8d4c6a1f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('environments', sa.Column('running_summary', sa.String(), nullable=True))
+    op.add_column('environments', sa.Column('running_summary_message_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'environments_running_summary_message_id_fkey',
+        'environments', 'messages',
+        ['running_summary_message_id'], ['id'],
+        ondelete='SET NULL'
+    )
+    op.create_index('ix_environments_running_summary_message_id', 'environments', ['running_summary_message_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_environments_running_summary_message_id', table_name='environments')
+    op.drop_constraint('environments_running_summary_message_id_fkey', 'environments', type_='foreignkey')
+    op.drop_column('environments', 'running_summary_message_id')
+    op.drop_column('environments', 'running_summary')
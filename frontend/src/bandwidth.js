@@ -0,0 +1,19 @@
+// Bandwidth class of the connection, sent as X-Bandwidth-Class so that
+// the backend returns music in a bitrate the connection can stream
+const getBandwidthClass = () => {
+  const connection = navigator.connection;
+  if (!connection) return 'high';
+  if (connection.saveData) return 'low';
+
+  switch (connection.effectiveType) {
+    case 'slow-2g':
+    case '2g':
+      return 'low';
+    case '3g':
+      return 'medium';
+    default:
+      return 'high';
+  }
+};
+
+export default getBandwidthClass;
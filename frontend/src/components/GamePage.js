@@ -1,6 +1,8 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import translations from '../translations';
+import getBandwidthClass from '../bandwidth';
+import postInteractionStream from '../interactionStream';
 import '../styles/GamePage.css';
 
 // Backend URL configuration
@@ -15,6 +17,52 @@ const characterColors = {
   'main_character': 'green' 
 };
 
+// Rendered width of a character sprite, matches .character-sprite in GamePage.css
+const characterSpriteSizes = '(max-width: 767px) min(65vw, 450px), min(35vw, 500px)';
+
+// Composited sprite, the browser picks its format and width
+const CompositePicture = ({ character, style }) => (
+  <picture>
+    {character.composite_avif_srcset && (
+      <source type="image/avif" srcSet={character.composite_avif_srcset} sizes={characterSpriteSizes} />
+    )}
+    <img
+      className="character-layer composite"
+      src={character.composite_url}
+      srcSet={character.composite_srcset}
+      sizes={characterSpriteSizes}
+      alt=""
+      style={style}
+    />
+  </picture>
+);
+
+// One composited image if the backend has it, otherwise the pose, clothes and face layers
+const CharacterLayers = ({ character, darkened }) => {
+  const filter = darkened ? 'brightness(0.5)' : 'none'; // Darken character when loading
+
+  if (character.composite_url) {
+    return <CompositePicture character={character} style={{ filter }} />;
+  }
+
+  return (
+    <>
+      <div className="character-layer pose" style={{ 
+        backgroundImage: `url(${character.pose_url})`,
+        filter
+      }}></div>
+      <div className="character-layer clothes" style={{ 
+        backgroundImage: `url(${character.clothes_url})`,
+        filter
+      }}></div>
+      <div className="character-layer face" style={{ 
+        backgroundImage: `url(${character.facial_expression_url})`,
+        filter
+      }}></div>
+    </>
+  );
+};
+
 // Message history component to display all messages
 const MessageHistory = ({ messages, currentLang, onMessageClick }) => {
   if (!messages || messages.length === 0) return null;
@@ -91,11 +139,15 @@ const GamePage = () => {
   // Initialize audio refs - using a ref to hold the audio instance
   const audioRef = useRef(null);
   const newAudioRef = useRef(null);
+  // Full track loaded while its intro segment plays: { introSrc, audio }
+  const fullTrackRef = useRef(null);
   
   // Message typing effect states and refs
   const [displayedMessageText, setDisplayedMessageText] = useState('');
   const isNewInteractionMessageRef = useRef(false);
   const typingIntervalRef = useRef(null);
+  // Text of the character's message while it is streamed, null otherwise
+  const [streamingText, setStreamingText] = useState(null);
   
   // Initialize audio on component mount
   useEffect(() => {
@@ -113,6 +165,10 @@ const GamePage = () => {
         newAudioRef.current.pause();
         newAudioRef.current = null;
       }
+      if (fullTrackRef.current) {
+        fullTrackRef.current.audio.pause();
+        fullTrackRef.current = null;
+      }
     };
   }, []);
   
@@ -191,7 +247,10 @@ const GamePage = () => {
       try {
         // Get token from localStorage if available
         const token = localStorage.getItem('token');
-        const headers = { 'Authorization': token ? `Bearer ${token}` : '' };
+        const headers = {
+          'Authorization': token ? `Bearer ${token}` : '',
+          'X-Bandwidth-Class': getBandwidthClass()
+        };
         
         const response = await fetch(`${BACKEND_URL}/api/v1/game_state/continue`, {
           method: 'GET',
@@ -213,6 +272,22 @@ const GamePage = () => {
     
     fetchGameState();
   }, []);
+
+  // Load assets likely needed next in the background, so the next scene shows without waiting
+  const prefetchedUrlsRef = useRef(new Set());
+  useEffect(() => {
+    if (!gameState || !gameState.prefetch_urls) return;
+
+    gameState.prefetch_urls.forEach(url => {
+      if (prefetchedUrlsRef.current.has(url)) return;
+      prefetchedUrlsRef.current.add(url);
+
+      const link = document.createElement('link');
+      link.rel = 'prefetch';
+      link.href = url;
+      document.head.appendChild(link);
+    });
+  }, [gameState]);
   
   // Fetch user language preference
   useEffect(() => {
@@ -247,6 +322,37 @@ const GamePage = () => {
     const randomIndex = Math.floor(Math.random() * musicUrls.length);
     return musicUrls[randomIndex];
   };
+
+  // Random track of the game state, with the URL of its intro segment if the backend sends them
+  const getRandomMusicTrack = (state) => {
+    if (!state.music_urls || state.music_urls.length === 0) return null;
+    const randomIndex = Math.floor(Math.random() * state.music_urls.length);
+    return {
+      url: state.music_urls[randomIndex],
+      introUrl: state.music_intro_urls ? state.music_intro_urls[randomIndex] : null
+    };
+  };
+
+  // Stop loading the full track of an intro that is no longer played
+  const discardFullTrack = () => {
+    if (fullTrackRef.current) {
+      fullTrackRef.current.audio.pause();
+      fullTrackRef.current.audio.removeAttribute('src');
+      fullTrackRef.current = null;
+    }
+  };
+
+  // The intro segment starts playing at once, the full track is loaded meanwhile
+  // and continues from the end of the intro when it ends (see handleAudioEnded)
+  const prepareFullTrack = (introAudio, track) => {
+    discardFullTrack();
+    if (!track.introUrl) return;
+
+    const audio = new Audio();
+    audio.preload = 'auto';
+    audio.src = track.url;
+    fullTrackRef.current = { introSrc: introAudio.src, audio };
+  };
   
   // Handle music playback when gameState changes or when current song ends
   useEffect(() => {
@@ -274,6 +380,7 @@ const GamePage = () => {
     const handleMusicLogic = () => {
       // If music type is "none", fade out current music if playing
       if (gameState.music_type === "none") {
+        discardFullTrack();
         if (audioRef.current && !audioRef.current.paused) {
           setMusicFading(true);
           const fadeOutInterval = setInterval(() => {
@@ -296,9 +403,10 @@ const GamePage = () => {
       if (gameState.music_type !== currentMusicType) {
         setCurrentMusicType(gameState.music_type);
         
-        // Select a random music URL from the array
-        const newMusicUrl = getRandomMusicUrl(gameState.music_urls);
-        if (!newMusicUrl) return; // No valid URL, exit early
+        // Select a random track, started from its intro segment if there is one
+        const track = getRandomMusicTrack(gameState);
+        if (!track) return; // No valid URL, exit early
+        const newMusicUrl = track.introUrl || track.url;
         
         // If we already have music playing, crossfade
         if (audioRef.current && !audioRef.current.paused) {
@@ -309,6 +417,7 @@ const GamePage = () => {
           if (newAudioRef.current) {
             newAudioRef.current.src = newMusicUrl;
             newAudioRef.current.volume = 0; // Start at 0 for fade-in
+            prepareFullTrack(newAudioRef.current, track);
             
             const playNewAudio = () => {
               if (isMuted) { // Check mute status before playing
@@ -371,6 +480,7 @@ const GamePage = () => {
           setCurrentMusicUrl(newMusicUrl);
           audioRef.current.src = newMusicUrl;
           audioRef.current.volume = 0; // Start at 0 for fade-in
+          prepareFullTrack(audioRef.current, track);
           
           const playAudio = () => {
             if (isMuted) { // Check mute status before playing
@@ -424,7 +534,34 @@ const GamePage = () => {
     
     // Add an event listener for when the audio ends
     const handleAudioEnded = () => {
+      // When an intro segment ends, its full track continues from the same point
+      const fullTrack = fullTrackRef.current;
+      if (fullTrack && audioRef.current && audioRef.current.src === fullTrack.introSrc) {
+        fullTrackRef.current = null;
+        const intro = audioRef.current;
+        const offset = intro.duration || 0;
+        intro.removeEventListener('ended', handleAudioEnded);
+
+        const audio = fullTrack.audio;
+        if (audio.readyState >= 1) {
+          audio.currentTime = offset;
+        } else {
+          audio.addEventListener('loadedmetadata', () => { audio.currentTime = offset; }, { once: true });
+        }
+        audio.volume = isMuted ? 0 : intro.volume;
+        audioRef.current = audio;
+        setCurrentMusicUrl(audio.src);
+
+        if (!isMuted) {
+          audio.play().catch(e => {
+            console.warn('Audio playback was prevented by browser:', e);
+          });
+        }
+        return;
+      }
+
       // When the current track ends, pick a new random track from the list
+      discardFullTrack();
       if (gameState.music_urls && gameState.music_urls.length > 0) {
         const newMusicUrl = getRandomMusicUrl(gameState.music_urls);
         if (!newMusicUrl) return; // No valid URL, exit early
@@ -651,7 +788,8 @@ const GamePage = () => {
     try {
       const token = localStorage.getItem('token');
       const headers = {
-        'Authorization': token ? `Bearer ${token}` : ''
+        'Authorization': token ? `Bearer ${token}` : '',
+        'X-Bandwidth-Class': getBandwidthClass()
       };
       
       const response = await fetch(`${BACKEND_URL}/api/v1/game_state/${gameStateId}`, {
@@ -742,7 +880,8 @@ const GamePage = () => {
       const token = localStorage.getItem('token');
       const headers = {
         'Authorization': token ? `Bearer ${token}` : '',
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'X-Bandwidth-Class': getBandwidthClass()
       };
       
       // Get the current game state ID
@@ -784,6 +923,44 @@ const GamePage = () => {
     }
   };
   
+  // Run a turn, showing the character's message in the message box as it is streamed
+  const streamInteraction = async (gameStateId, body) => {
+    // Get token from localStorage if available
+    const token = localStorage.getItem('token');
+    const headers = {
+      'Authorization': token ? `Bearer ${token}` : '',
+      'Content-Type': 'application/json',
+      'X-Bandwidth-Class': getBandwidthClass()
+    };
+
+    try {
+      return await postInteractionStream(
+        `${BACKEND_URL}/api/v1/game_state/${gameStateId}/interaction/stream`,
+        {
+          method: 'POST',
+          headers: headers,
+          body: JSON.stringify(body)
+        },
+        (text) => {
+          // The streamed text is already shown, so the final message is not typed again
+          isNewInteractionMessageRef.current = false;
+          if (typingIntervalRef.current) {
+            clearInterval(typingIntervalRef.current);
+            typingIntervalRef.current = null;
+          }
+          setStreamingText(previous => (previous || '') + text);
+        }
+      );
+    } catch (err) {
+      if (err.status === 400) {
+        throw new Error(currentLang === 'ru' 
+          ? 'Попробуйте написать более длинное сообщение или переключите в настройках аккаунта на желаемый язык ввода.'
+          : 'Try to have longer message or switch in account settings to desired input language.');
+      }
+      throw err;
+    }
+  };
+
   // Handle background image click to request character message
   const handleBackgroundClick = async () => {
     if (!gameState || waiting || sendingMessage) return;
@@ -791,36 +968,15 @@ const GamePage = () => {
     try {
       setSendingMessage(true);
       isNewInteractionMessageRef.current = true; // Signal for typing effect
-      
-      // Get token from localStorage if available
-      const token = localStorage.getItem('token');
-      const headers = { 
-        'Authorization': token ? `Bearer ${token}` : '',
-        'Content-Type': 'application/json'
-      };
-      
-      const response = await fetch(`${BACKEND_URL}/api/v1/game_state/${gameState.id}/interaction`, {
-        method: 'POST',
-        headers: headers,
-        body: JSON.stringify({
-          user_interaction: false,
-          user_text: null
-        })
+
+      const data = await streamInteraction(gameState.id, {
+        user_interaction: false,
+        user_text: null
       });
-      
-      if (!response.ok) {
-        if (response.status === 400) {
-          throw new Error(currentLang === 'ru' 
-            ? 'Попробуйте написать более длинное сообщение или переключите в настройках аккаунта на желаемый язык ввода.'
-            : 'Try to have longer message or switch in account settings to desired input language.');
-        }
-        throw new Error(`Error: ${response.status}`);
-      }
-      
-      const data = await response.json();
       updateGameStateWithTransitions(data);
       setError(null);
     } catch (err) {
+      setStreamingText(null);
       setError(err.message || 'Failed to fetch game state');
       console.error('Error fetching game state:', err);
     } finally {
@@ -874,7 +1030,10 @@ const GamePage = () => {
     try {
       // Get token from localStorage if available
       const token = localStorage.getItem('token');
-      const headers = { 'Authorization': token ? `Bearer ${token}` : '' };
+      const headers = {
+        'Authorization': token ? `Bearer ${token}` : '',
+        'X-Bandwidth-Class': getBandwidthClass()
+      };
       
       const response = await fetch(`${BACKEND_URL}/api/v1/game_state/${gameStateId}`, {
         method: 'GET',
@@ -901,13 +1060,7 @@ const GamePage = () => {
     setSendingMessage(true);
     try {
       isNewInteractionMessageRef.current = true; // Signal that the next message update is from user interaction
-      // Get token from localStorage if available
-      const token = localStorage.getItem('token');
-      const headers = {
-        'Content-Type': 'application/json',
-        'Authorization': token ? `Bearer ${token}` : ''
-      };
-      
+
       // Get the current game state ID - safely access nested properties
       let gameStateId;
       if (gameState && gameState.id) {
@@ -921,30 +1074,15 @@ const GamePage = () => {
         throw new Error('No game state ID available');
       }
       
-      // Send POST request to the backend endpoint at line 109 in game_state.py
-      const response = await fetch(`${BACKEND_URL}/api/v1/game_state/${gameStateId}/interaction`, {
-        method: 'POST',
-        headers: headers,
-        body: JSON.stringify({
-          user_interaction: true,
-          user_text: userInput
-        })
+      const data = await streamInteraction(gameStateId, {
+        user_interaction: true,
+        user_text: userInput
       });
-      
-      if (!response.ok) {
-        if (response.status === 400) {
-          throw new Error(currentLang === 'ru' 
-            ? 'Попробуйте написать более длинное сообщение или переключите в настройках аккаунта на желаемый язык ввода.'
-            : 'Try to have longer message or switch in account settings to desired input language.');
-        }
-        throw new Error(`Error: ${response.status}`);
-      }
-      
-      const data = await response.json();
       updateGameStateWithTransitions(data);
       
       setUserInput('');
     } catch (err) {
+      setStreamingText(null);
       setError(err.message || 'Failed to send message');
       console.error('Error sending message:', err);
     } finally {
@@ -960,6 +1098,9 @@ const GamePage = () => {
       typingIntervalRef.current = null;
     }
 
+    // The streamed message is replaced by the one of the new game state
+    setStreamingText(null);
+
     const messageContainer = gameState?.message?.message;
 
     if (messageContainer && messageContainer.displayed_text) {
@@ -1088,18 +1229,7 @@ const GamePage = () => {
                 order: index
               }}>
                 {/* Layered character images */}
-                <div className="character-layer pose" style={{ 
-                  backgroundImage: `url(${character.pose_url})`,
-                  filter: sendingMessage ? 'brightness(0.5)' : 'none'
-                }}></div>
-                <div className="character-layer clothes" style={{ 
-                  backgroundImage: `url(${character.clothes_url})`,
-                  filter: sendingMessage ? 'brightness(0.5)' : 'none'
-                }}></div>
-                <div className="character-layer face" style={{ 
-                  backgroundImage: `url(${character.facial_expression_url})`,
-                  filter: sendingMessage ? 'brightness(0.5)' : 'none'
-                }}></div>
+                <CharacterLayers character={character} darkened={sendingMessage} />
               </div>
             ))}
           </div>
@@ -1111,21 +1241,19 @@ const GamePage = () => {
           .map((character, index) => (
           <div key={index} className={`character-sprite ${characterTransitioning ? 'fading-in' : ''}`}>
             {/* Layered character images */}
-            <div className="character-layer pose" style={{ 
-              backgroundImage: `url(${character.pose_url})`,
-              filter: sendingMessage ? 'brightness(0.5)' : 'none' // Darken character when loading
-            }}></div>
-            <div className="character-layer clothes" style={{ 
-              backgroundImage: `url(${character.clothes_url})`,
-              filter: sendingMessage ? 'brightness(0.5)' : 'none' // Darken character when loading
-            }}></div>
-            <div className="character-layer face" style={{ 
-              backgroundImage: `url(${character.facial_expression_url})`,
-              filter: sendingMessage ? 'brightness(0.5)' : 'none' // Darken character when loading
-            }}></div>
+            <CharacterLayers character={character} darkened={sendingMessage} />
           </div>
         ))}
       </div>
+
+      {/* Sprites likely shown next, loaded hidden with the same sizes, so the browser picks the image it will show */}
+      {gameState && gameState.prefetch_sprites && gameState.prefetch_sprites.length > 0 && (
+        <div className="prefetch-sprites" aria-hidden="true">
+          {gameState.prefetch_sprites.map(character => (
+            <CompositePicture key={character.composite_url} character={character} />
+          ))}
+        </div>
+      )}
       
       {/* Message Box */}
       <div className="message-box">
@@ -1207,7 +1335,14 @@ const GamePage = () => {
 
         {/* Display received messages - NOW SECOND */}
         <div className="messages-container" style={{marginTop: '10px'}}> {/* Adjusted margin */}
-          {gameState && gameState.message && (
+          {streamingText !== null ? (
+            // The speaker is only known with the final game state
+            <div className="message-content">
+              <div className="message-text">
+                {streamingText}
+              </div>
+            </div>
+          ) : gameState && gameState.message && (
             <div className="message-content">
               <div 
                 className="character-name"
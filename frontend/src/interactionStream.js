@@ -0,0 +1,59 @@
+// Reads the server-sent events of /interaction/stream: text of "delta" events is passed
+// to onDelta as the character's message is generated, the "game_state" event is returned.
+// Failures, before or during the stream, are thrown with the HTTP status in error.status
+const interactionError = (status, detail) => {
+  const error = new Error(detail ? `Error: ${status} ${detail}` : `Error: ${status}`);
+  error.status = status;
+  return error;
+};
+
+const postInteractionStream = async (url, options, onDelta) => {
+  const response = await fetch(url, options);
+
+  if (!response.ok) {
+    throw interactionError(response.status);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      const dataLines = [];
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          dataLines.push(line.slice(5).trimStart());
+        }
+      }
+
+      if (dataLines.length === 0) continue;
+      const data = JSON.parse(dataLines.join('\n'));
+
+      if (event === 'delta') {
+        onDelta(data.text);
+      } else if (event === 'game_state') {
+        return data;
+      } else if (event === 'error') {
+        throw interactionError(data.status_code, data.detail);
+      }
+    }
+  }
+
+  throw new Error('Interaction stream ended without a game state');
+};
+
+export default postInteractionStream;